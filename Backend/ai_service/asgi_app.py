@@ -0,0 +1,332 @@
+"""Asyncio serving mode: thousands of in-flight chats in one process
+
+Usage (from Backend/ai_service):
+    python asgi_app.py --service manifesto_app --port 5001
+    ASGI_SERVICE=simple_app uvicorn --factory asgi_app:create_app --port 5001
+
+Serves the same routes and JSON contracts as the Flask app named by
+--service. The chat route (/chat or /chat/manifesto) runs natively on the
+event loop: the route's planner does retrieval and prompt building on a
+worker thread, then the generation waits on Ollama through AsyncLLMClient,
+so a waiting chat costs a coroutine and a socket instead of a thread.
+Streamed answers are relayed as they arrive and a client disconnect
+cancels the upstream generation, as with the Flask server.
+
+Every other route (PDF extraction and ingest, search, summaries, health,
+stats, /metrics) is handed to the Flask app on a thread pool of
+ASGI_WSGI_THREADS workers; CPU-heavy PDF pages still go to the process
+pool in pdf_extract. Batch generations of the Flask routes (map-reduce
+analysis) use the app's own LLMClient, which shares the backend pool
+(health, circuit breakers, load counts and conversation affinity). For
+a service with batch routes the OLLAMA_MAX_IN_FLIGHT budget is split
+between the two clients, a quarter for batch work, so together they never
+run more generations than it allows; otherwise chat gets all of it.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from async_llm import AsyncLLMClient, AsyncSingleFlight
+from chat_turn import ChatReply, answer_turn_async, reply_events, stream_turn_async
+from ollama_stream import NDJSON_MIMETYPE, SSE_MIMETYPE, stream_format
+
+# Chat path, planner and Flask endpoint name of each service
+CHAT_ROUTES = {
+    'simple_app': ('/chat', 'plan_chat', 'chat_with_ollama'),
+    'manifesto_app': ('/chat/manifesto', 'plan_manifesto_chat', 'chat_with_manifesto')
+}
+
+# Services whose Flask routes generate with the blocking client (map-reduce analysis)
+BATCH_SERVICES = {'manifesto_app'}
+
+# Request bodies above this size (PDF uploads) are spooled to disk
+BODY_SPOOL_BYTES = 1024 * 1024
+
+# flask-cors allows every origin on the Flask routes; the native chat route matches it
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+_DONE = object()
+
+
+def split_in_flight(total, batch=True):
+    """Split an in-flight budget into (chat, batch) slots for the two LLM clients
+
+    Without batch routes, or with a single slot, chat gets the whole budget.
+    """
+    if not batch or total < 2:
+        return max(1, total), 0
+    batch_slots = max(1, total // 4)
+    return total - batch_slots, batch_slots
+
+
+class _Headers:
+    """Case-insensitive view of ASGI headers, enough for stream_format"""
+
+    def __init__(self, raw):
+        self._headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in raw}
+
+    def get(self, name, default=None):
+        return self._headers.get(name.lower(), default)
+
+
+class _Request:
+    def __init__(self, scope):
+        self.headers = _Headers(scope['headers'])
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI http scope whose body was read into ``body``"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for raw_name, raw_value in scope['headers']:
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f"HTTP_{name}"
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+class AsyncChatServer:
+    """ASGI application wrapping one of the Flask manifesto services"""
+
+    def __init__(self, service, wsgi_threads=32, max_queue=4096, max_connections=256):
+        self.service = service
+        self.name = service.__name__
+        self.chat_path, planner, self.chat_endpoint = CHAT_ROUTES[self.name]
+        self.plan = getattr(service, planner)
+        self.executor = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix='wsgi')
+        blocking = service.ollama_client
+        chat_slots, batch_slots = split_in_flight(blocking.scheduler.max_in_flight, self.name in BATCH_SERVICES)
+        if batch_slots:
+            blocking.scheduler.max_in_flight = batch_slots
+        elif self.name in BATCH_SERVICES:
+            print(f"⚠️ OLLAMA_MAX_IN_FLIGHT={chat_slots} cannot be split; chat and batch generations "
+                  f"each admit one call", file=sys.stderr)
+        self.client = AsyncLLMClient(
+            blocking.pool,
+            max_in_flight=chat_slots,
+            max_queue=max_queue,
+            queue_timeout=blocking.queue_timeout,
+            timeout=blocking.timeout,
+            max_connections=max_connections,
+            observer=service.metrics.observe_llm
+        )
+        self.flights = AsyncSingleFlight()
+        service.metrics.llm_gauges(self.client)
+        service.metrics.gauge('async_inflight_generations', 'Distinct chat answers being generated on the event loop',
+                              lambda: self.flights.stats()['inFlight'])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        body = await self.read_body(receive)
+        try:
+            if scope['method'] == 'POST' and scope['path'] == self.chat_path:
+                await self.chat(scope, body, receive, send)
+            elif scope['method'] == 'GET' and scope['path'] == '/llm/stats':
+                await self.send_json(send, self.llm_stats())
+            else:
+                await self.wsgi(scope, body, send)
+        finally:
+            body.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.client.aclose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_BYTES)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+        return body
+
+    def llm_stats(self):
+        """The service's /llm/stats body, with the figures of the client serving chat"""
+        stats = dict(self.client.stats(), blocking=self.service.ollama_client.stats(), inflight=self.flights.stats())
+        return {'success': True, 'llm': stats} if self.name == 'simple_app' else stats
+
+    async def send_json(self, send, body, status=200):
+        encoded = json.dumps(body).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'application/json'), (b'content-length', str(len(encoded)).encode('ascii'))
+        ] + CORS_HEADERS})
+        await send({'type': 'http.response.body', 'body': encoded})
+
+    async def send_events(self, send, events, fmt):
+        mimetype = SSE_MIMETYPE if fmt == 'sse' else NDJSON_MIMETYPE
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', f"{mimetype}; charset=utf-8".encode('ascii')),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')
+        ] + CORS_HEADERS})
+        try:
+            async for event in events:
+                await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+        finally:
+            await events.aclose()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def chat(self, scope, body, receive, send):
+        """The service's chat route, with the generation awaited on the event loop"""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            data = json.loads(body.read() or b'null')
+            query = parse_qs(scope['query_string'].decode('latin-1'))
+            fmt = stream_format(_Request(scope), data or {})
+            turn = await loop.run_in_executor(
+                self.executor, self.plan, data, (data or {}).get('mode') or query.get('mode', [None])[0])
+        except Exception:
+            # Let the Flask route produce its own error response
+            body.seek(0)
+            await self.wsgi(scope, body, send)
+            return
+
+        status = 200
+        if isinstance(turn, ChatReply):
+            if fmt and turn.streamable:
+                await self.send_events(send, reply_events_async(turn, fmt), fmt)
+            else:
+                status = turn.status
+                await self.send_json(send, turn.body, status)
+        elif fmt:
+            # Streaming mode: stop generating as soon as the client goes away
+            await until_disconnect(receive, self.send_events(send, stream_turn_async(turn, self.client, fmt, self.executor), fmt))
+        else:
+            # Concurrent identical questions wait for one shared generation
+            answer = await until_disconnect(receive, answer_turn_async(
+                turn, self.client, self.flights, self.service.COALESCE_WAIT_SECONDS, self.executor))
+            if answer is not None:
+                await self.send_json(send, answer)
+        self.service.metrics.request_seconds.observe(
+            time.perf_counter() - started, endpoint=self.chat_endpoint, status=status)
+
+    async def wsgi(self, scope, body, send):
+        """Run the request through the Flask app on the thread pool"""
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return lambda data: None
+
+        def call():
+            result = self.service.app(build_environ(scope, body), start_response)
+            return result, iter(result)
+
+        result, chunks = await loop.run_in_executor(self.executor, call)
+        try:
+            chunk = await loop.run_in_executor(self.executor, next, chunks, _DONE)
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            while chunk is not _DONE:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.executor, next, chunks, _DONE)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+
+async def reply_events_async(reply, fmt):
+    for event in reply_events(reply, fmt):
+        yield event
+
+
+async def until_disconnect(receive, coroutine):
+    """Await ``coroutine``, cancelling it if the client disconnects first; None when cancelled"""
+    task = asyncio.ensure_future(coroutine)
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return None
+    return task.result()
+
+
+def create_app(service=None):
+    """Build the ASGI app for a service module name (default: ASGI_SERVICE or simple_app)"""
+    module = importlib.import_module(service or os.environ.get('ASGI_SERVICE', 'simple_app'))
+    if hasattr(module, 'create_app'):  # simple_app builds its stores and clients on demand
+        module.create_app()
+    return AsyncChatServer(
+        module,
+        wsgi_threads=int(os.environ.get('ASGI_WSGI_THREADS', 32)),
+        max_queue=int(os.environ.get('ASYNC_OLLAMA_MAX_QUEUE', 4096)),
+        max_connections=int(os.environ.get('ASYNC_OLLAMA_MAX_CONNECTIONS', 256))
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--service', choices=sorted(CHAT_ROUTES), default=os.environ.get('ASGI_SERVICE', 'simple_app'))
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--backlog', type=int, default=2048, help='listen queue for connection bursts')
+    args = parser.parse_args()
+
+    print(f"⚡ Serving {args.service} on http://{args.host}:{args.port} (asyncio)")
+    uvicorn.run(create_app(args.service), host=args.host, port=args.port, backlog=args.backlog,
+                log_level='warning', access_log=False)
+
+
+if __name__ == '__main__':
+    main()
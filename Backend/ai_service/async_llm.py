@@ -0,0 +1,295 @@
+import asyncio
+import heapq
+import itertools
+import json
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+from backend_pool import Backend, BackendPool
+from llm_client import PRIORITY_INTERACTIVE, CircuitOpen, QueueFull, QueueTimeout
+from singleflight import SingleFlightTimeout
+
+
+class AsyncPriorityScheduler:
+    """PriorityScheduler for coroutines on one event loop
+
+    Same admission rules and statistics: at most ``max_in_flight`` holders,
+    waiters served by priority (FIFO within a priority), QueueFull once
+    ``max_queue`` are waiting. A waiter costs a future instead of a thread,
+    so the queue can be thousands deep.
+    """
+
+    def __init__(self, max_in_flight=2, max_queue=4096):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._in_flight = 0
+        self._queue = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+
+    def _admit(self, waited):
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    async def acquire(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Wait until a slot is free for this priority"""
+        if self._in_flight < self.max_in_flight and not self._queue:
+            self._in_flight += 1
+            self._admit(0.0)
+            return
+        if len(self._queue) >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(f"LLM queue is full ({self.max_queue} waiting)")
+
+        started = time.monotonic()
+        entry = (priority, next(self._sequence), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, entry)
+        try:
+            # release() hands the slot over by resolving the future
+            await asyncio.wait_for(entry[2], timeout)
+        except asyncio.TimeoutError:
+            self._forget(entry)
+            self.timeouts += 1
+            raise QueueTimeout(f"Waited {timeout}s for an LLM slot")
+        except asyncio.CancelledError:
+            # The caller went away; pass on a slot it was handed meanwhile
+            if entry[2].done() and not entry[2].cancelled():
+                self.release()
+            else:
+                self._forget(entry)
+            raise
+        self._admit(time.monotonic() - started)
+
+    def _forget(self, entry):
+        if entry in self._queue:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+
+    def release(self):
+        """Give a slot back, handing it to the next live waiter"""
+        self._in_flight -= 1
+        while self._queue and self._in_flight < self.max_in_flight:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                self._in_flight += 1
+                future.set_result(None)
+
+    def stats(self):
+        """Return in-flight, queue-depth and wait-time figures"""
+        by_priority = {}
+        for priority, _, _ in list(self._queue):
+            by_priority[priority] = by_priority.get(priority, 0) + 1
+        return {
+            'inFlight': self._in_flight,
+            'maxInFlight': self.max_in_flight,
+            'queued': len(self._queue),
+            'queuedByPriority': by_priority,
+            'maxQueue': self.max_queue,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'avgWaitSeconds': round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+            'maxWaitSeconds': round(self.max_wait, 4)
+        }
+
+
+class GenerateResponse:
+    """Status and JSON body of a finished generate call, read like a requests response"""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return json.loads(self._body)
+
+
+class AsyncLLMClient:
+    """LLMClient for the asyncio server: aiohttp connections, the same pool routing, scheduler and stats
+
+    ``generate`` returns a GenerateResponse (``status_code`` and ``json()``
+    as with requests). ``stream`` is an async generator of tokens; pass a
+    dict as ``result`` to receive Ollama's final message under ``'final'``.
+    A connection failure is raised as the built-in ConnectionError.
+
+    Pass the blocking client's ``pool`` to share backend health, breakers,
+    load counts and conversation affinity between both clients of a process.
+    """
+
+    def __init__(self, backends, max_in_flight=2, max_queue=4096, queue_timeout=30,
+                 timeout=(5, 120), max_connections=256, breaker=None, observer=None):
+        if isinstance(backends, BackendPool):
+            self.pool = backends
+        else:
+            self.pool = BackendPool([Backend(backends, breaker=breaker)], health_interval=0)
+        self.queue_timeout = queue_timeout
+        self.observer = observer or (lambda event, value: None)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.scheduler = AsyncPriorityScheduler(max_in_flight, max_queue)
+        self.max_connections = max_connections
+        self._timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout[0], sock_read=timeout[1])
+        self._session = None
+
+    @property
+    def session(self):
+        # Created on first use, inside the running event loop
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=self._timeout
+            )
+        return self._session
+
+    def _record_usage(self, message):
+        self.prompt_tokens += message.get('prompt_eval_count') or 0
+        self.completion_tokens += message.get('eval_count') or 0
+
+    @asynccontextmanager
+    async def _call(self, priority, payload, affinity=None):
+        """Admit a call through the scheduler and pool and record its outcome, like LLMClient._call"""
+        model = payload.get('model')
+        self.pool.ensure_available(model)
+        queued = time.monotonic()
+        await self.scheduler.acquire(priority, self.queue_timeout)
+        try:
+            backend = self.pool.acquire(model, affinity)
+        except CircuitOpen:
+            self.scheduler.release()
+            raise
+        started = time.monotonic()
+        self.observer('queue_wait', started - queued)
+        self.observer('prompt_chars', len(payload.get('prompt', '')))
+        recorded = []
+
+        def record(ok):
+            if not recorded:
+                recorded.append(ok)
+                self.pool.record(backend, ok, time.monotonic() - started)
+
+        try:
+            yield backend, record
+        except aiohttp.ClientConnectorError as e:
+            record(False)
+            raise ConnectionError(f"Cannot connect to Ollama at {backend.url}: {e}") from e
+        except Exception:
+            record(False)
+            raise
+        finally:
+            self.scheduler.release()
+            self.pool.release(backend)
+            self.observer('call', time.monotonic() - started)
+            if not recorded:
+                self.pool.cancel(backend)
+
+    async def generate(self, payload, priority=PRIORITY_INTERACTIVE, affinity=None):
+        """POST a non-streaming /api/generate call once a slot is free"""
+        async with self._call(priority, payload, affinity) as (backend, record):
+            async with self.session.post(f"{backend.url}/api/generate", json=dict(payload, stream=False)) as response:
+                result = GenerateResponse(response.status, await response.read())
+            record(result.status_code < 500)
+            if result.status_code == 200:
+                try:
+                    self._record_usage(result.json())
+                except ValueError:
+                    pass
+            return result
+
+    async def stream(self, payload, priority=PRIORITY_INTERACTIVE, result=None, affinity=None):
+        """Yield generated tokens, holding a slot until the stream ends or is closed"""
+        async with self._call(priority, payload, affinity) as (backend, record):
+            started = time.monotonic()
+            async with self.session.post(f"{backend.url}/api/generate", json=dict(payload, stream=True)) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"Ollama API error: {response.status}")
+                first_token_seen = False
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    message = json.loads(line)
+                    if message.get('error'):
+                        raise RuntimeError(message['error'])
+                    if message.get('response'):
+                        if not first_token_seen:
+                            first_token_seen = True
+                            self.observer('first_token', time.monotonic() - started)
+                        record(True)
+                        yield message['response']
+                    if message.get('done'):
+                        record(True)
+                        self._record_usage(message)
+                        if result is not None:
+                            result['final'] = message
+                        return
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self):
+        """Return scheduler, circuit breaker, routing and token usage metrics"""
+        return dict(self.scheduler.stats(), circuit=self.pool.circuit(), routing=self.pool.stats(),
+                    promptTokens=self.prompt_tokens, completionTokens=self.completion_tokens)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: concurrent calls with one key share one task
+
+    The shared task is shielded, so a leader whose client disconnects does
+    not cancel the answer other callers (and the response cache) wait for.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._calls = {}
+
+    async def do(self, key, fn, timeout=None):
+        """Await ``fn()`` once per concurrent key and return its result to every caller
+
+        Callers that joined a running task give up with SingleFlightTimeout
+        after ``timeout`` seconds.
+        """
+        task = self._calls.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), None if leader else timeout)
+        except asyncio.TimeoutError:
+            if task.done():
+                raise
+            self.timeouts += 1
+            raise SingleFlightTimeout(f"Timed out after {timeout}s waiting for a shared request")
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def stats(self):
+        """Return in-flight and coalescing counters"""
+        return {
+            'inFlight': len(self._calls),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts,
+            'errors': self.errors
+        }
@@ -0,0 +1,286 @@
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+from llm_client import CircuitBreaker, CircuitOpen
+
+LEAST_OUTSTANDING = 'least_outstanding'
+LATENCY = 'latency'
+STRATEGIES = (LEAST_OUTSTANDING, LATENCY)
+
+# Weight of the newest call in a backend's latency average
+LATENCY_SMOOTHING = 0.2
+
+
+class NoBackendAvailable(CircuitOpen):
+    """Raised immediately when no healthy backend serves the requested model"""
+
+
+def normalize_model(name):
+    """Ollama treats 'llama3.2' and 'llama3.2:latest' as the same model"""
+    return name if ':' in name else f"{name}:latest"
+
+
+class Backend:
+    """One Ollama server in a BackendPool
+
+    ``models`` restricts the backend to those models; when None the models
+    reported by its /api/tags are used once a health check has run, and
+    until then it is assumed to serve any model. Its circuit breaker ejects
+    it after failed or slow calls; a failed health check ejects it until a
+    later check passes.
+    """
+
+    def __init__(self, url, models=None, breaker=None):
+        self.url = url.rstrip('/')
+        self.configured_models = {normalize_model(model) for model in models} if models else None
+        self.models = self.configured_models
+        self.breaker = breaker or CircuitBreaker()
+        if self.breaker.probe is None:
+            self.breaker.probe = self.check
+        self.healthy = True
+        self.outstanding = 0
+        self.latency = None  # smoothed seconds per call (to the first token for streams)
+        self.calls = 0
+        self.failures = 0
+        self.health_failures = 0
+        self.last_error = None
+
+    def check(self, timeout=2):
+        """GET /api/tags; refresh the model list and return whether the backend answered"""
+        try:
+            response = requests.get(f"{self.url}/api/tags", timeout=timeout)
+            if response.status_code != 200:
+                self.last_error = f"HTTP {response.status_code}"
+                return False
+            if self.configured_models is None:
+                self.models = {normalize_model(model['name']) for model in response.json().get('models', [])
+                               if model.get('name')} or None
+            return True
+        except (requests.RequestException, ValueError) as e:
+            self.last_error = str(e)
+            return False
+
+    def serves(self, model):
+        return model is None or self.models is None or normalize_model(model) in self.models
+
+    def available(self):
+        return self.healthy and self.breaker.state != CircuitBreaker.OPEN
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'models': sorted(self.models) if self.models else None,
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'latencyMs': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'calls': self.calls,
+            'failures': self.failures,
+            'healthFailures': self.health_failures,
+            'lastError': self.last_error,
+            'circuit': self.breaker.stats()
+        }
+
+
+class BackendPool:
+    """Route generations across several Ollama servers
+
+    ``least_outstanding`` sends a call to the backend with the fewest calls
+    in progress; ``latency`` to the one with the lowest expected wait,
+    (outstanding + 1) x its smoothed call latency, so a faster server takes
+    a larger share. Only backends that serve the payload's model, passed
+    their last health check and whose breaker admits the call are
+    candidates; with none left NoBackendAvailable (a CircuitOpen) is raised
+    at once.
+
+    An ``affinity`` key (a conversation) sticks to the backend that served
+    it last, so follow-up turns reuse the KV cache Ollama holds for it, as
+    long as that backend is available and has at most ``sticky_slack`` more
+    calls outstanding than the least loaded candidate. A background thread
+    checks every backend's /api/tags each ``health_interval`` seconds.
+    """
+
+    def __init__(self, backends, strategy=LEAST_OUTSTANDING, health_interval=10.0,
+                 sticky_slack=4, max_affinities=10000, affinity_ttl=1800):
+        if not backends:
+            raise ValueError("A backend pool needs at least one backend")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown routing strategy {strategy!r}; use one of {', '.join(STRATEGIES)}")
+        self.backends = list(backends)
+        self.strategy = strategy
+        self.health_interval = health_interval
+        self.sticky_slack = sticky_slack
+        self.max_affinities = max_affinities
+        self.affinity_ttl = affinity_ttl
+        self.sticky_hits = 0
+        self.sticky_moves = 0
+        self._affinities = OrderedDict()  # key -> (backend, last used)
+        self._turn = 0
+        self._lock = threading.Lock()
+        self._health_thread = None
+        if health_interval and health_interval > 0:
+            self._health_thread = threading.Thread(target=self._check_health, name='llm-backend-health', daemon=True)
+            self._health_thread.start()
+
+    @classmethod
+    def from_spec(cls, spec, breaker=None, **options):
+        """Build a pool from ``url[=model|model],url...``, e.g. OLLAMA_URL
+
+        ``breaker`` is a callable returning a new CircuitBreaker per backend.
+        """
+        backends = []
+        for entry in filter(None, (part.strip() for part in spec.split(','))):
+            url, _, models = entry.partition('=')
+            backends.append(Backend(
+                url,
+                models=[model for model in models.split('|') if model] or None,
+                breaker=breaker() if breaker else None
+            ))
+        return cls(backends, **options)
+
+    @property
+    def urls(self):
+        return [backend.url for backend in self.backends]
+
+    def _check_health(self):
+        # The first round runs at once, so model lists are known early
+        while True:
+            for backend in self.backends:
+                healthy = backend.check()
+                with self._lock:
+                    if not healthy:
+                        backend.health_failures += 1
+                    backend.healthy = healthy
+            time.sleep(self.health_interval)
+
+    def _candidates(self, model):
+        return [backend for backend in self.backends if backend.serves(model) and backend.available()]
+
+    def ensure_available(self, model=None):
+        """Raise NoBackendAvailable unless some backend could take a call for model"""
+        with self._lock:
+            if not self._candidates(model):
+                raise NoBackendAvailable(f"No available LLM backend serves {model or 'any model'}")
+
+    def available(self, model=None):
+        with self._lock:
+            return bool(self._candidates(model))
+
+    def _cost(self, backend, fallback_latency):
+        if self.strategy == LATENCY:
+            latency = backend.latency if backend.latency is not None else fallback_latency
+            return (backend.outstanding + 1) * latency
+        return backend.outstanding
+
+    def acquire(self, model=None, affinity=None):
+        """Pick a backend for a call and count it as outstanding
+
+        The chosen backend's breaker has admitted the call; report its
+        outcome with ``record`` and always finish with ``release``.
+        """
+        with self._lock:
+            candidates = self._candidates(model)
+            if not candidates:
+                raise NoBackendAvailable(f"No available LLM backend serves {model or 'any model'}")
+            known = [backend.latency for backend in candidates if backend.latency is not None]
+            fallback_latency = min(known) if known else 1.0
+            # Ties go to the backend that has served fewest calls, then rotate
+            self._turn = (self._turn + 1) % len(candidates)
+            rotated = candidates[self._turn:] + candidates[:self._turn]
+            ordered = sorted(rotated, key=lambda backend: (self._cost(backend, fallback_latency), backend.calls))
+
+            sticky = self._sticky_backend(affinity)
+            if sticky is not None:
+                if sticky in candidates and sticky.outstanding <= ordered[0].outstanding + self.sticky_slack:
+                    ordered.remove(sticky)
+                    ordered.insert(0, sticky)
+                    self.sticky_hits += 1
+                else:
+                    self.sticky_moves += 1
+
+            for backend in ordered:
+                try:
+                    backend.breaker.allow()
+                except CircuitOpen:
+                    continue
+                backend.outstanding += 1
+                if affinity is not None:
+                    self._bind(affinity, backend)
+                return backend
+        raise NoBackendAvailable(f"No available LLM backend serves {model or 'any model'}")
+
+    def record(self, backend, ok, seconds):
+        """Report the outcome and duration of a call that reached ``backend``"""
+        backend.breaker.record(ok, seconds)
+        with self._lock:
+            backend.calls += 1
+            if ok:
+                backend.latency = seconds if backend.latency is None else (
+                    LATENCY_SMOOTHING * seconds + (1 - LATENCY_SMOOTHING) * backend.latency)
+            else:
+                backend.failures += 1
+
+    def cancel(self, backend):
+        """Forget an admitted call that never reached ``backend``"""
+        backend.breaker.cancel()
+
+    def release(self, backend):
+        with self._lock:
+            backend.outstanding -= 1
+
+    def _sticky_backend(self, affinity):
+        if affinity is None:
+            return None
+        entry = self._affinities.get(affinity)
+        if entry is None:
+            return None
+        backend, used_at = entry
+        if time.monotonic() - used_at > self.affinity_ttl:
+            del self._affinities[affinity]
+            return None
+        return backend
+
+    def _bind(self, affinity, backend):
+        self._affinities[affinity] = (backend, time.monotonic())
+        self._affinities.move_to_end(affinity)
+        while len(self._affinities) > self.max_affinities:
+            self._affinities.popitem(last=False)
+
+    def any_url(self):
+        """URL of an available backend (the first one when none is), for calls outside routing"""
+        with self._lock:
+            candidates = self._candidates(None)
+            return (candidates[0] if candidates else self.backends[0]).url
+
+    def circuit(self):
+        """Pool-wide circuit state: closed while any backend is available"""
+        states = [backend.breaker.stats() for backend in self.backends]
+        with self._lock:
+            available = [backend for backend in self.backends if backend.available()]
+        if any(backend.breaker.state == CircuitBreaker.CLOSED for backend in available):
+            state = CircuitBreaker.CLOSED
+        elif available:
+            state = CircuitBreaker.HALF_OPEN
+        else:
+            state = CircuitBreaker.OPEN
+        return {
+            'state': state,
+            'availableBackends': len(available),
+            'backends': len(self.backends),
+            'trips': sum(stats['trips'] for stats in states),
+            'rejected': sum(stats['rejected'] for stats in states),
+            'probes': sum(stats['probes'] for stats in states)
+        }
+
+    def stats(self):
+        """Return routing counters and per-backend figures"""
+        with self._lock:
+            return {
+                'strategy': self.strategy,
+                'stickyHits': self.sticky_hits,
+                'stickyMoves': self.sticky_moves,
+                'affinities': len(self._affinities),
+                'backends': [backend.stats() for backend in self.backends]
+            }
@@ -0,0 +1,115 @@
+"""Benchmark chunk storage memory against the previous dict-of-dicts layout
+
+Run from Backend/ai_service:
+    python benchmarks/bench_chunk_store.py [chunks_per_party]
+
+Builds the same chunks for several parties and measures the memory held by
+the old ``manifestos[party]['chunks']`` list of dicts, the packed ChunkStore,
+and the ChunkStore with compressed cold storage. It also times random chunk
+reads, since packed and compressed layouts rebuild chunk dicts on access.
+Memory is what tracemalloc reports as still allocated after each build.
+"""
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_chunker import synthetic_pages
+from chunk_store import ChunkStore
+from chunker import iter_chunks
+
+PARTIES = ['BJP', 'INC', 'AAP', 'CPI(M)', 'TMC', 'SP', 'BSP', 'DMK', 'SS', 'JDU']
+
+
+def party_chunks(chunks_per_party, chunk_size=200):
+    # ~2 chunks per synthetic page at 200 words per chunk
+    pages = synthetic_pages(chunks_per_party // 2 + 1)
+    return list(iter_chunks(pages, chunk_size=chunk_size))[:chunks_per_party]
+
+
+def legacy_layout(chunks):
+    manifestos = {}
+    for party in PARTIES:
+        party_chunks = []
+        for chunk in chunks:
+            # Copy the text as ingest would: every party's PDF is its own string
+            party_chunks.append(dict(
+                chunk,
+                text=''.join(list(chunk['text'])),
+                chunkId=f"{party}_chunk_{chunk['chunkIndex']}",
+                partyId=party,
+                partyName=f"{party} Party"
+            ))
+        manifestos[party] = {'partyName': f"{party} Party", 'chunks': party_chunks}
+    return manifestos
+
+
+def store_layout(chunks, **options):
+    store = ChunkStore(**options)
+    for party in PARTIES:
+        store.put(party, f"{party} Party", chunks)
+    return store
+
+
+def measure(build, *args, **kwargs):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, elapsed
+
+
+def read_time(read, reads=20000, seed=7):
+    rng = random.Random(seed)
+    keys = [(rng.choice(PARTIES), rng.randrange(CHUNKS_PER_PARTY)) for _ in range(reads)]
+    start = time.perf_counter()
+    for party, index in keys:
+        read(party, index)
+    return (time.perf_counter() - start) / reads * 1e6
+
+
+CHUNKS_PER_PARTY = int(sys.argv[1]) if len(sys.argv) > 1 else 1500
+
+
+def main():
+    chunks = party_chunks(CHUNKS_PER_PARTY)
+    total = len(chunks) * len(PARTIES)
+    text_mb = sum(len(c['text']) for c in chunks) * len(PARTIES) / 1e6
+    print(f"{len(PARTIES)} parties x {len(chunks)} chunks = {total} chunks, {text_mb:.1f} MB of text\n")
+
+    legacy, legacy_bytes, legacy_build = measure(legacy_layout, chunks)
+    rows = [('dict of dicts', legacy_bytes, legacy_build,
+             read_time(lambda p, i: legacy[p]['chunks'][i]))]
+    del legacy
+
+    packed, packed_bytes, packed_build = measure(store_layout, chunks)
+    rows.append(('ChunkStore', packed_bytes, packed_build, read_time(packed.chunk)))
+    del packed
+
+    for codec in ('zlib', 'zstd'):
+        try:
+            cold, cold_bytes, cold_build = measure(store_layout, chunks, compress=True, codec=codec, hot_parties=2)
+        except ValueError:
+            print(f"(skipping {codec}: zstandard is not installed)")
+            continue
+        # Measured before any read, so every party is still compressed. Uniform
+        # random reads over 10 parties with 2 hot is the worst case: most reads
+        # decompress a whole party buffer.
+        rows.append((f"ChunkStore {codec} (2 hot)", cold_bytes, cold_build, read_time(cold.chunk, reads=500)))
+        del cold
+
+    print(f"{'layout':<26}{'memory MB':>10}{'vs dict':>9}{'build s':>9}{'read us':>9}")
+    for name, size, build, read_us in rows:
+        print(f"{name:<26}{size / 1e6:>10.1f}{size / legacy_bytes:>8.0%}{build:>9.2f}{read_us:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
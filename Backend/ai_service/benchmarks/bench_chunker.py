@@ -0,0 +1,81 @@
+"""Benchmark manifesto chunking time against document size
+
+Run from Backend/ai_service:
+    python benchmarks/bench_chunker.py
+
+Compares the streaming chunker with the previous sentence loop from
+process_full_manifesto. The streaming chunker's time per page should stay
+flat as the document grows; the legacy loop's grows with chunk length.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunker import iter_chunks
+
+WORDS = ("government will ensure provide healthcare education farmers youth "
+         "infrastructure jobs women security economy water roads schools "
+         "hospitals digital rural urban investment welfare pension tax").split()
+
+
+def synthetic_pages(page_count, sentences_per_page=30, seed=42):
+    """Build deterministic manifesto-like page texts"""
+    rng = random.Random(seed)
+    pages = []
+    for page_number in range(page_count):
+        lines = [f"{page_number + 1}. SECTION {page_number + 1}"]
+        for _ in range(sentences_per_page):
+            lines.append(' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 25))) + '.')
+        pages.append('\n'.join(lines))
+    return pages
+
+
+def legacy_chunks(pages, chunk_size=500):
+    """The original quadratic sentence loop, kept for comparison"""
+    text = "".join(page + "\n" for page in pages)
+    sentences = text.split('. ')
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        if len((current_chunk + ". " + sentence).split()) > chunk_size and current_chunk:
+            chunks.append(current_chunk.strip())
+            current_chunk = sentence
+        else:
+            current_chunk = current_chunk + ". " + sentence if current_chunk else sentence
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    print("Ingest time vs document size (chunk_size=500)")
+    print(f"{'pages':>6} {'words':>9} {'legacy s':>10} {'stream s':>10} {'stream us/page':>15}")
+    for page_count in (25, 50, 100, 200, 400, 800, 1600):
+        pages = synthetic_pages(page_count)
+        word_count = sum(len(page.split()) for page in pages)
+        legacy_time, _ = timed(legacy_chunks, pages)
+        stream_time, _ = timed(lambda: list(iter_chunks(pages, chunk_size=500, overlap=50)))
+        print(f"{page_count:>6} {word_count:>9} {legacy_time:>10.4f} {stream_time:>10.4f} "
+              f"{stream_time / page_count * 1e6:>15.1f}")
+
+    print()
+    print("Ingest time vs chunk size (200 pages)")
+    print(f"{'chunk':>6} {'legacy s':>10} {'stream s':>10}")
+    pages = synthetic_pages(200)
+    for chunk_size in (250, 500, 1000, 2000, 4000):
+        legacy_time, _ = timed(legacy_chunks, pages, chunk_size)
+        stream_time, _ = timed(lambda: list(iter_chunks(pages, chunk_size=chunk_size)))
+        print(f"{chunk_size:>6} {legacy_time:>10.4f} {stream_time:>10.4f}")
+
+
+if __name__ == '__main__':
+    main()
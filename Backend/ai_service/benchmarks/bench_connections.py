@@ -0,0 +1,276 @@
+"""Connections held per MB of RAM: asyncio server vs the threaded Flask server
+
+Run from Backend/ai_service:
+    python benchmarks/bench_connections.py [--service manifesto_app] [--connections 250,1000,2000]
+        [--latency 10] [--tokens 16] [--stream] [--output connections.json]
+
+Starts a stub Ollama (in its own process) that takes ``--latency`` seconds
+per answer, then for each server mode and connection count starts a fresh
+service process and opens that many concurrent chat requests with distinct
+questions, so every one waits on the model at the same time:
+
+    flask   the app served as app.run(threaded=True) does: werkzeug's
+            threaded server, one thread per connection
+    asgi    asgi_app.py under uvicorn: one event loop, AsyncLLMClient
+
+Both get an Ollama slot and queue entry per connection, so nothing is
+rejected and the connection count is what is being held. The service's
+resident memory (VmRSS) and thread count are sampled while the requests
+are open; each row reports the idle and peak RSS, KB per held connection
+((peak - idle) / connections), connections per MB of peak RSS, and
+latency percentiles.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from bench_services import free_port, git_commit, summarize
+from synthetic_pdf import manifesto_pdf, manifesto_text
+
+FLASK_SERVER = """
+import sys
+sys.path.insert(0, {service!r})
+import {module} as service
+from werkzeug.serving import make_server
+make_server('127.0.0.1', {port}, service.app, threaded=True).serve_forever()
+"""
+
+CHAT_PATHS = {'simple_app': '/chat', 'manifesto_app': '/chat/manifesto'}
+
+
+def raise_fd_limit():
+    """Thousands of sockets need more than the usual 1024 descriptors"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def proc_status(pid):
+    """(RSS in MB, thread count) of a process, from /proc"""
+    rss_kb, threads = 0, 0
+    with open(f"/proc/{pid}/status") as handle:
+        for line in handle:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+            elif line.startswith('Threads:'):
+                threads = int(line.split()[1])
+    return rss_kb / 1024, threads
+
+
+def wait_for(url, process, log_path, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited during startup; see {log_path}")
+        try:
+            requests.get(url, timeout=2)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{url} did not start within {timeout}s; see {log_path}")
+
+
+def start_server(mode, service, env, log_path):
+    port = free_port()
+    if mode == 'flask':
+        command = [sys.executable, '-c', FLASK_SERVER.format(service=SERVICE_DIR, module=service, port=port)]
+    else:
+        command = [sys.executable, os.path.join(SERVICE_DIR, 'asgi_app.py'), '--service', service,
+                   '--host', '127.0.0.1', '--port', str(port)]
+    with open(log_path, 'wb') as log:
+        process = subprocess.Popen(command, env=env, cwd=SERVICE_DIR, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    wait_for(f"{base_url}/health", process, log_path)
+    return process, base_url
+
+
+async def hold_connections(base_url, service, pid, connections, manifesto, stream, timeout):
+    """Open ``connections`` chat requests at once while sampling the server's memory"""
+    url = base_url + CHAT_PATHS[service]
+    latencies, errors = [], []
+    peak = {'rss': 0.0, 'threads': 0, 'open': 0}
+    state = {'open': 0, 'done': False}
+
+    async def sample():
+        while not state['done']:
+            rss, threads = proc_status(pid)
+            peak['rss'] = max(peak['rss'], rss)
+            peak['threads'] = max(peak['threads'], threads)
+            peak['open'] = max(peak['open'], state['open'])
+            await asyncio.sleep(0.05)
+
+    async def chat(client, index):
+        question = f"What is the plan for schools and hospitals, question {index}?"
+        body = ({'message': question} if service == 'simple_app' else
+                {'question': question, 'manifesto_content': manifesto, 'party_name': 'Party 0'})
+        if stream:
+            body['stream'] = 'ndjson'
+        started = time.perf_counter()
+        state['open'] += 1
+        try:
+            async with client.post(url, json=body) as response:
+                text = await response.text()
+                if response.status != 200:
+                    raise RuntimeError(f"HTTP {response.status}: {text[:200]}")
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(repr(e))
+        finally:
+            state['open'] -= 1
+
+    connector = aiohttp.TCPConnector(limit=connections, force_close=True)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as client:
+        sampler = asyncio.ensure_future(sample())
+        started = time.perf_counter()
+        await asyncio.gather(*(chat(client, index) for index in range(connections)))
+        elapsed = time.perf_counter() - started
+        state['done'] = True
+        await sampler
+    return latencies, errors, peak, elapsed
+
+
+def run_row(mode, args, connections, env, workdir, manifesto):
+    log_path = os.path.join(workdir, f"{mode}-{connections}.log")
+    server_env = dict(
+        env,
+        OLLAMA_MAX_IN_FLIGHT=str(connections),
+        OLLAMA_MAX_QUEUE=str(connections),
+        OLLAMA_QUEUE_TIMEOUT=str(args.timeout),
+        ASYNC_OLLAMA_MAX_QUEUE=str(connections),
+        ASYNC_OLLAMA_MAX_CONNECTIONS=str(connections),
+        SNAPSHOT_DIR=os.path.join(workdir, f"snapshots-{mode}-{connections}")
+    )
+    process, base_url = start_server(mode, args.service, server_env, log_path)
+    try:
+        if args.service == 'simple_app':
+            requests.post(f"{base_url}/process-manifesto",
+                          files={'file': ('party-0.pdf', manifesto_pdf('Party 0', args.pages), 'application/pdf')},
+                          data={'partyId': 'party-0', 'partyName': 'Party 0'}, timeout=120).raise_for_status()
+        # One warm-up chat so imports, caches and pools are in the idle figure
+        body = ({'message': 'warm up schools'} if args.service == 'simple_app' else
+                {'question': 'warm up schools', 'manifesto_content': manifesto, 'party_name': 'Party 0'})
+        requests.post(base_url + CHAT_PATHS[args.service], json=body, timeout=args.timeout)
+        idle_rss, idle_threads = proc_status(process.pid)
+
+        latencies, errors, peak, elapsed = asyncio.run(hold_connections(
+            base_url, args.service, process.pid, connections, manifesto, args.stream, args.timeout))
+        held = len(latencies)
+        growth = max(peak['rss'] - idle_rss, 1e-6)
+        return {
+            'mode': mode,
+            'connections': connections,
+            'ok': held,
+            'errors': len(errors),
+            'sampleErrors': errors[:3],
+            'peakOpen': peak['open'],
+            'idleRssMb': round(idle_rss, 1),
+            'peakRssMb': round(peak['rss'], 1),
+            'kbPerConnection': round(growth * 1024 / held, 1) if held else None,
+            'connectionsPerMb': round(held / peak['rss'], 2) if held else 0.0,
+            'idleThreads': idle_threads,
+            'peakThreads': peak['threads'],
+            'seconds': round(elapsed, 2),
+            'latency': summarize(latencies)
+        }
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--service', choices=sorted(CHAT_PATHS), default='manifesto_app')
+    parser.add_argument('--modes', default='flask,asgi')
+    parser.add_argument('--connections', default='250,1000,2000')
+    parser.add_argument('--latency', type=float, default=10.0, help='stub Ollama seconds before the first token')
+    parser.add_argument('--token-delay', type=float, default=0.01)
+    parser.add_argument('--tokens', type=int, default=16)
+    parser.add_argument('--pages', type=int, default=3, help='pages of the manifesto chatted about')
+    parser.add_argument('--stream', action='store_true', help='request streamed chat answers')
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--output', help='results file (default bench-connections-<commit>.json)')
+    args = parser.parse_args()
+
+    levels = [int(value) for value in args.connections.split(',')]
+    fd_limit = raise_fd_limit()
+    if fd_limit < 2 * max(levels) + 64:
+        print(f"⚠️ Open file limit {fd_limit} is low for {max(levels)} connections", file=sys.stderr)
+    commit, dirty = git_commit()
+    workdir = tempfile.mkdtemp(prefix='bench-connections-')
+    manifesto = manifesto_text('Party 0', args.pages)
+
+    stub_port = free_port()
+    stub_log = os.path.join(workdir, 'stub.log')
+    with open(stub_log, 'wb') as log:
+        stub = subprocess.Popen([sys.executable, os.path.join(HERE, 'stub_ollama.py'), '--port', str(stub_port),
+                                 '--latency', str(args.latency), '--token-delay', str(args.token_delay),
+                                 '--tokens', str(args.tokens)], stdout=log, stderr=subprocess.STDOUT)
+    results = []
+    try:
+        stub_url = f"http://127.0.0.1:{stub_port}"
+        wait_for(f"{stub_url}/api/tags", stub, stub_log)
+        env = dict(
+            os.environ,
+            OLLAMA_URL=stub_url,
+            INGEST_CACHE_DIR=os.path.join(workdir, 'ingest'),
+            RESPONSE_CACHE_DB='',
+            PYTHONUNBUFFERED='1'
+        )
+
+        print(f"{args.service}: stub latency {args.latency}s, {args.tokens} tokens{' streamed' if args.stream else ''}")
+        print(f"{'mode':<7}{'conns':>7}{'ok':>7}{'err':>5}{'idle MB':>9}{'peak MB':>9}{'KB/conn':>9}"
+              f"{'conn/MB':>9}{'threads':>9}{'p50 s':>8}{'p99 s':>8}")
+        for connections in levels:
+            for mode in args.modes.split(','):
+                row = run_row(mode, args, connections, env, workdir, manifesto)
+                results.append(row)
+                latency = row['latency'] or {}
+                print(f"{mode:<7}{connections:>7}{row['ok']:>7}{row['errors']:>5}{row['idleRssMb']:>9.1f}"
+                      f"{row['peakRssMb']:>9.1f}{row['kbPerConnection'] or 0:>9.1f}{row['connectionsPerMb']:>9.2f}"
+                      f"{row['peakThreads']:>9}{latency.get('p50', 0):>8.2f}{latency.get('p99', 0):>8.2f}")
+                for error in row['sampleErrors']:
+                    print(f"    {error}")
+
+        output = args.output or f"bench-connections-{(commit or 'unknown')[:12]}.json"
+        with open(output, 'w') as handle:
+            json.dump({
+                'meta': {
+                    'commit': commit,
+                    'dirty': dirty,
+                    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'cpus': os.cpu_count(),
+                    'config': vars(args)
+                },
+                'results': results
+            }, handle, indent=2)
+        print(f"\nResults written to {output}")
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
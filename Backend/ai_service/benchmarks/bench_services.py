@@ -0,0 +1,364 @@
+"""End-to-end load benchmark of simple_app and manifesto_app against a stub Ollama
+
+Run from Backend/ai_service:
+    python benchmarks/bench_services.py [--concurrency 1,4,16] [--requests 40] [--pages 5,20,60]
+        [--latency 0.2] [--token-delay 0.005] [--tokens 32] [--stream] [--backends 1]
+        [--output bench.json] [--compare previous.json] [--max-regression 25]
+
+Starts a StubOllama and both Flask apps (each in its own process, served
+by werkzeug's threaded server on a free port, with temporary cache and
+snapshot directories), ingests one synthetic manifesto per party, then
+drives each endpoint at every concurrency level:
+
+    /extract-pdf, /process-manifesto   one row per PDF size; every request
+                                       uploads a distinct PDF, so no cache hits
+    /search-manifesto                  random multi-term queries, some per party
+    /chat, /chat/manifesto             distinct questions, so every request
+                                       reaches the (stub) model
+
+Throughput and p50/p95/p99 latency (plus time to first byte with
+--stream) are printed and written to JSON along with the git commit and
+configuration. --compare prints the change against an earlier results
+file; with --max-regression the run exits non-zero if any p95 grew by
+more than that many percent.
+
+--backends N starts N stub Ollama servers and lists them all in
+OLLAMA_URL, so the apps route over a backend pool; the generations each
+stub served are printed at the end.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from bench_chunker import WORDS
+from stub_ollama import StubOllama
+from synthetic_pdf import manifesto_pdf, manifesto_text
+
+SERVER = """
+import sys
+sys.path.insert(0, {service!r})
+import {module} as service
+from werkzeug.serving import make_server
+make_server('127.0.0.1', {port}, service.app, threaded=True).serve_forever()
+"""
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_service(module, env, log_path):
+    """Run an app in a subprocess and wait until /health answers"""
+    port = free_port()
+    with open(log_path, 'wb') as log:
+        process = subprocess.Popen(
+            [sys.executable, '-c', SERVER.format(service=SERVICE_DIR, module=module, port=port)],
+            env=env, cwd=SERVICE_DIR, stdout=log, stderr=subprocess.STDOUT
+        )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{module} exited during startup; see {log_path}")
+        try:
+            requests.get(f"{base_url}/health", timeout=2)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{module} did not start within 60s; see {log_path}")
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    return {
+        'mean': round(sum(ordered) / len(ordered), 6),
+        'p50': round(percentile(ordered, 0.50), 6),
+        'p95': round(percentile(ordered, 0.95), 6),
+        'p99': round(percentile(ordered, 0.99), 6),
+        'max': round(ordered[-1], 6)
+    }
+
+
+def run_load(send, concurrency, total):
+    """Issue ``total`` calls of ``send(session, index)`` from ``concurrency`` threads
+
+    ``send`` returns the seconds to the first response byte (or None) and
+    raises on failure; latency is measured around the whole call.
+    """
+    counter = itertools.count()
+    latencies, first_bytes, errors = [], [], []
+    lock = threading.Lock()
+
+    def worker():
+        session = requests.Session()
+        while True:
+            index = next(counter)
+            if index >= total:
+                return
+            started = time.perf_counter()
+            try:
+                first_byte = send(session, index)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if first_byte is not None:
+                    first_bytes.append(first_byte)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    return {
+        'requests': total,
+        'errors': len(errors),
+        'firstError': errors[0] if errors else None,
+        'seconds': round(seconds, 4),
+        'throughput': round(len(latencies) / seconds, 3) if seconds else None,
+        'latency': summarize(latencies),
+        'firstByte': summarize(first_bytes)
+    }
+
+
+def post(session, url, stream=False, **kwargs):
+    """POST and fully read the response; return seconds to first byte when streaming"""
+    started = time.perf_counter()
+    response = session.post(url, stream=stream, timeout=300, **kwargs)
+    first_byte = None
+    if stream:
+        for _ in response.iter_content(chunk_size=None):
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+    else:
+        response.content
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+    return first_byte
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SERVICE_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--', '.'], cwd=SERVICE_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def compare(results, previous_path, max_regression):
+    """Print changes against an earlier results file; return True if p95 regressed too much"""
+    with open(previous_path) as handle:
+        previous = json.load(handle)
+    before = {(row['endpoint'], row['variant'], row['concurrency']): row for row in previous['results']}
+    print(f"\nCompared with {previous['meta'].get('commit') or previous_path}:")
+    print(f"{'endpoint':<34}{'conc':>5}{'p50 %':>9}{'p95 %':>9}{'req/s %':>9}")
+    regressed = False
+    for row in results:
+        old = before.get((row['endpoint'], row['variant'], row['concurrency']))
+        if old is None or not old['latency'] or not row['latency']:
+            continue
+
+        def change(new, base):
+            return (new - base) / base * 100 if base else 0.0
+
+        p95 = change(row['latency']['p95'], old['latency']['p95'])
+        print(f"{row['endpoint'] + row['variant']:<34}{row['concurrency']:>5}"
+              f"{change(row['latency']['p50'], old['latency']['p50']):>+9.1f}{p95:>+9.1f}"
+              f"{change(row['throughput'], old['throughput']):>+9.1f}")
+        if max_regression is not None and p95 > max_regression:
+            regressed = True
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', default='1,4,16', help='comma-separated client thread counts')
+    parser.add_argument('--requests', type=int, default=40, help='requests per endpoint and concurrency level')
+    parser.add_argument('--pages', default='5,20,60', help='comma-separated PDF sizes in pages')
+    parser.add_argument('--parties', type=int, default=4)
+    parser.add_argument('--endpoints', default='extract-pdf,process-manifesto,search-manifesto,chat,chat/manifesto')
+    parser.add_argument('--latency', type=float, default=0.2, help='stub Ollama time to first token')
+    parser.add_argument('--token-delay', type=float, default=0.005, help='stub Ollama seconds per token')
+    parser.add_argument('--tokens', type=int, default=32, help='stub Ollama tokens per answer')
+    parser.add_argument('--stream', action='store_true', help='request streamed chat answers')
+    parser.add_argument('--backends', type=int, default=1, help='stub Ollama servers in the backend pool')
+    parser.add_argument('--store', choices=('snapshot', 'memory'), default='snapshot',
+                        help="simple_app manifesto storage (SNAPSHOT_DIR set or empty)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='results file (default bench-services-<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--max-regression', type=float, help='fail if any p95 grew by more than this percent')
+    args = parser.parse_args()
+
+    concurrency_levels = [int(value) for value in args.concurrency.split(',')]
+    page_sizes = [int(value) for value in args.pages.split(',')]
+    endpoints = args.endpoints.split(',')
+    commit, dirty = git_commit()
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='bench-services-')
+    processes = []
+
+    stubs = [StubOllama(latency=args.latency, token_delay=args.token_delay, tokens=args.tokens).start()
+             for _ in range(args.backends)]
+    try:
+        env = dict(
+            os.environ,
+            OLLAMA_URL=','.join(stub.url for stub in stubs),
+            INGEST_CACHE_DIR=os.path.join(workdir, 'ingest'),
+            SNAPSHOT_DIR=os.path.join(workdir, 'snapshots') if args.store == 'snapshot' else '',
+            RESPONSE_CACHE_DB='',
+            PYTHONUNBUFFERED='1'
+        )
+        simple, simple_url = start_service('simple_app', env, os.path.join(workdir, 'simple_app.log'))
+        processes.append(simple)
+        manifesto, manifesto_url = start_service('manifesto_app', env, os.path.join(workdir, 'manifesto_app.log'))
+        processes.append(manifesto)
+
+        parties = [(f"party-{number}", f"Party {number}") for number in range(args.parties)]
+        middle_size = page_sizes[len(page_sizes) // 2]
+        texts = {name: manifesto_text(name, middle_size) for _, name in parties}
+
+        # Every run needs manifestos to search and chat about
+        session = requests.Session()
+        for party_id, name in parties:
+            post(session, f"{simple_url}/process-manifesto",
+                 files={'file': (f"{party_id}.pdf", manifesto_pdf(name, middle_size), 'application/pdf')},
+                 data={'partyId': party_id, 'partyName': name})
+
+        def search(level, total):
+            queries = [(' '.join(rng.sample(WORDS, rng.randint(1, 4))),
+                        rng.choice([None] + [party_id for party_id, _ in parties]))
+                       for _ in range(total)]
+
+            def send(session, index):
+                query, party_id = queries[index]
+                body = {'query': query}
+                if party_id:
+                    body['partyId'] = party_id
+                return post(session, f"{simple_url}/search-manifesto", json=body)
+            return send
+
+        def chat(level, total):
+            def send(session, index):
+                topic = ' and '.join(rng.sample(WORDS, 2))
+                body = {'message': f"What will the parties do about {topic}? (#{level}-{index})",
+                        'stream': args.stream}
+                return post(session, f"{simple_url}/chat", stream=args.stream, json=body)
+            return send
+
+        def chat_manifesto(level, total):
+            def send(session, index):
+                _, name = parties[index % len(parties)]
+                topic = ' and '.join(rng.sample(WORDS, 2))
+                body = {'question': f"What does the party promise on {topic}? (#{level}-{index})",
+                        'party_name': name, 'manifesto_content': texts[name], 'conversation_history': [],
+                        'stream': args.stream}
+                return post(session, f"{manifesto_url}/chat/manifesto", stream=args.stream, json=body)
+            return send
+
+        plan = []
+        for endpoint in endpoints:
+            if endpoint in ('extract-pdf', 'process-manifesto'):
+                plan.extend((endpoint, f"[{size}p]", None, size) for size in page_sizes)
+            else:
+                plan.append((endpoint, '[stream]' if args.stream and endpoint.startswith('chat') else '',
+                             {'search-manifesto': search, 'chat': chat, 'chat/manifesto': chat_manifesto}[endpoint],
+                             None))
+
+        results = []
+        print(f"{'endpoint':<34}{'conc':>5}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'err':>5}")
+        for endpoint, variant, builder, size in plan:
+            for level in concurrency_levels:
+                total = max(args.requests, level)
+                if builder is None:
+                    send = pdf_sender(simple_url, endpoint, parties, size, level, total, args.seed)
+                else:
+                    send = builder(level, total)
+                row = dict(endpoint=endpoint, variant=variant, concurrency=level, **run_load(send, level, total))
+                results.append(row)
+                latency = row['latency'] or {}
+                print(f"{endpoint + variant:<34}{level:>5}{row['throughput'] or 0:>9.2f}"
+                      f"{latency.get('p50', 0) * 1000:>9.1f}{latency.get('p95', 0) * 1000:>9.1f}"
+                      f"{latency.get('p99', 0) * 1000:>9.1f}{row['errors']:>5}")
+
+        output = args.output or f"bench-services-{(commit or 'unknown')[:12]}.json"
+        with open(output, 'w') as handle:
+            json.dump({
+                'meta': {
+                    'commit': commit,
+                    'dirty': dirty,
+                    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'cpus': os.cpu_count(),
+                    'config': vars(args)
+                },
+                'results': results
+            }, handle, indent=2)
+        print(f"\nResults written to {output}")
+        if len(stubs) > 1:
+            print("Generations per backend: " + ', '.join(f"{stub.url} {stub.generations}" for stub in stubs))
+
+        if args.compare and compare(results, args.compare, args.max_regression):
+            print(f"\nFAIL: p95 regressed by more than {args.max_regression}%")
+            sys.exit(1)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+        for stub in stubs:
+            stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def pdf_sender(base_url, endpoint, parties, size, level, total, seed):
+    """Sender that uploads a distinct synthetic PDF of ``size`` pages per request"""
+    pdfs = [manifesto_pdf(parties[index % len(parties)][1], size, seed=f"{seed}-{level}-{index}")
+            for index in range(total)]
+
+    def send(session, index):
+        party_id, name = parties[index % len(parties)]
+        return post(session, f"{base_url}/{endpoint}",
+                    files={'file': (f"{party_id}.pdf", pdfs[index], 'application/pdf')},
+                    data={'partyId': party_id, 'partyName': name})
+    return send
+
+
+if __name__ == '__main__':
+    main()
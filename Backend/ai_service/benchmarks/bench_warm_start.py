@@ -0,0 +1,119 @@
+"""Benchmark warm start from the persisted manifesto store
+
+Run from Backend/ai_service:
+    python benchmarks/bench_warm_start.py [--parties 300] [--chunks 60] [--max-seconds 1.0]
+
+Publishes synthetic manifestos into a temporary SNAPSHOT_DIR, then starts
+fresh interpreters that (a) open the SnapshotStore and answer one search,
+and (b) import simple_app and answer one /search-manifesto request through
+the test client. The first is the store's own cost; the second is what a
+restarted service pays before it can serve. The cold alternative of
+re-chunking and re-indexing every manifesto is timed for comparison.
+
+Exits non-zero if the simple_app warm start exceeds --max-seconds, so it
+can gate a deploy script. tests/test_warm_start.py runs the same probe on a
+small corpus as part of the test suite (python -m pytest tests).
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(HERE)
+sys.path.insert(0, SERVICE_DIR)
+
+from bench_chunker import synthetic_pages
+from chunker import iter_chunks
+from search_index import InvertedIndex
+from snapshot import SnapshotStore
+
+STORE_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+sys.path.insert(0, {service!r})
+from snapshot import SnapshotStore
+store = SnapshotStore({directory!r})
+opened = time.perf_counter()
+hits = store.search('healthcare schools farmers', 5)
+done = time.perf_counter()
+print(json.dumps({{'open': opened - start, 'firstQuery': done - opened, 'total': done - start,
+                  'parties': len(store), 'hits': len(hits)}}))
+"""
+
+APP_PROBE = """
+import os, sys, time, json
+start = time.perf_counter()
+sys.path.insert(0, {service!r})
+os.environ['SNAPSHOT_DIR'] = {directory!r}
+os.environ['INGEST_CACHE_DIR'] = {ingest!r}
+import simple_app
+imported = time.perf_counter()
+response = simple_app.create_app().test_client().post('/search-manifesto', json={{'query': 'healthcare schools farmers'}})
+done = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'firstQuery': done - imported, 'total': done - start,
+                  'status': response.status_code, 'hits': response.json['totalFound']}}))
+"""
+
+
+def probe(template, **values):
+    code = template.format(service=SERVICE_DIR, **values)
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--parties', type=int, default=300)
+    parser.add_argument('--chunks', type=int, default=60, help='chunks per party')
+    parser.add_argument('--max-seconds', type=float, default=1.0)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='warm-start-')
+    directory = os.path.join(workdir, 'snapshots')
+    try:
+        pages = synthetic_pages(args.chunks // 2 + 1)
+        chunks = list(iter_chunks(pages, chunk_size=200))[:args.chunks]
+        store = SnapshotStore(directory)
+        start = time.perf_counter()
+        for number in range(args.parties):
+            store.put(f"party-{number}", f"Party {number}", chunks, page_count=len(pages),
+                      summary=[], processed_at='benchmark')
+        publish = time.perf_counter() - start
+        stats = store.stats()
+        print(f"{args.parties} parties x {len(chunks)} chunks, {stats['bytes'] / 1e6:.1f} MB on disk "
+              f"(published in {publish:.1f}s)\n")
+
+        start = time.perf_counter()
+        index = InvertedIndex()
+        for number in range(args.parties):
+            index.replace_party(f"party-{number}", list(iter_chunks(pages, chunk_size=200))[:args.chunks])
+        index.search('healthcare schools farmers', 5)
+        rebuild = time.perf_counter() - start
+
+        store_runs = [probe(STORE_PROBE, directory=directory) for _ in range(args.runs)]
+        app_runs = [probe(APP_PROBE, directory=directory, ingest=os.path.join(workdir, 'ingest'))
+                    for _ in range(args.runs)]
+
+        best_store = min(store_runs, key=lambda run: run['total'])
+        best_app = min(app_runs, key=lambda run: run['total'])
+        print(f"{'warm start':<34}{'best s':>8}{'first query s':>15}")
+        print(f"{'SnapshotStore open + search':<34}{best_store['total']:>8.3f}{best_store['firstQuery']:>15.3f}")
+        print(f"{'import simple_app + /search':<34}{best_app['total']:>8.3f}{best_app['firstQuery']:>15.3f}")
+        print(f"{'re-chunk + re-index (in process)':<34}{rebuild:>8.3f}")
+
+        if best_app['total'] > args.max_seconds:
+            print(f"\nFAIL: warm start took {best_app['total']:.3f}s (limit {args.max_seconds}s)")
+            sys.exit(1)
+        print(f"\nOK: warm start within {args.max_seconds}s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Stand-in for an Ollama server, for benchmarks and local testing
+
+Run from Backend/ai_service:
+    python benchmarks/stub_ollama.py --port 11434 --latency 0.2 --token-delay 0.01 --tokens 64
+
+Answers GET /api/tags and POST /api/generate like Ollama does, without a
+model: each generation waits ``latency`` seconds (time to first token),
+then produces ``tokens`` tokens ``token-delay`` seconds apart, streamed as
+NDJSON unless the request sets ``"stream": false``. The final message
+carries a ``context`` and token counts so KV-session reuse works.
+``--error-rate`` makes that share of generations fail with HTTP 500.
+Like Ollama, it answers 404 for a model other than ``--model``; run
+several on different ports to stand in for a pool of servers.
+
+Import StubOllama to run one in-process on a free port.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = "the party will invest in schools hospitals roads and jobs for every district".split()
+
+
+def _tagged(model):
+    return model if ':' in model else f"{model}:latest"
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # load tests open connections in bursts of thousands
+
+
+class StubOllama:
+    """Threaded HTTP server imitating Ollama's generate and tags endpoints"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, token_delay=0.0, tokens=32,
+                 error_rate=0.0, model='llama3.2:3b', seed=0):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.model = model
+        self.generations = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.server = _Server((host, port), self._handler())
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve on a background thread and return self"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name='stub-ollama', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def _should_fail(self):
+        with self._lock:
+            self.generations += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body):
+                encoded = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def do_GET(self):
+                if self.path == '/api/tags':
+                    self._send_json(200, {'models': [{'name': stub.model}]})
+                else:
+                    self._send_json(404, {'error': 'not found'})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if self.path != '/api/generate':
+                    self._send_json(404, {'error': 'not found'})
+                    return
+
+                model = payload.get('model')
+                if model and _tagged(model) != _tagged(stub.model):
+                    self._send_json(404, {'error': f"model '{model}' not found"})
+                    return
+
+                time.sleep(stub.latency)
+                if stub._should_fail():
+                    self._send_json(500, {'error': 'stub failure'})
+                    return
+
+                words = [WORDS[index % len(WORDS)] + ' ' for index in range(stub.tokens)]
+                prompt_tokens = len(payload.get('prompt', '')) // 4 + len(payload.get('context') or ())
+                final = {
+                    'model': payload.get('model', stub.model),
+                    'done': True,
+                    'context': list(range(1, prompt_tokens + stub.tokens + 1)),
+                    'prompt_eval_count': prompt_tokens,
+                    'eval_count': stub.tokens
+                }
+
+                if payload.get('stream', True) is False:
+                    time.sleep(stub.token_delay * stub.tokens)
+                    self._send_json(200, dict(final, response=''.join(words)))
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for word in words:
+                    self._write_chunk({'model': final['model'], 'response': word, 'done': False})
+                    time.sleep(stub.token_delay)
+                self._write_chunk(dict(final, response=''))
+                self.wfile.write(b'0\r\n\r\n')
+
+            def _write_chunk(self, message):
+                line = json.dumps(message).encode('utf-8') + b'\n'
+                self.wfile.write(f"{len(line):x}\r\n".encode('ascii') + line + b'\r\n')
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds before the first token')
+    parser.add_argument('--token-delay', type=float, default=0.01, help='seconds between tokens')
+    parser.add_argument('--tokens', type=int, default=32, help='tokens per answer')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of generations answered with 500')
+    parser.add_argument('--model', default='llama3.2:3b', help='the one model this server has')
+    args = parser.parse_args()
+
+    stub = StubOllama(args.host, args.port, args.latency, args.token_delay, args.tokens, args.error_rate, args.model)
+    print(f"Stub Ollama on {stub.url} serving {args.model} "
+          f"(latency {args.latency}s, {args.tokens} tokens x {args.token_delay}s)")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
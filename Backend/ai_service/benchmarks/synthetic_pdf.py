@@ -0,0 +1,103 @@
+"""Deterministic synthetic manifesto PDFs for benchmarks
+
+    python benchmarks/synthetic_pdf.py --parties 4 --pages 5,20,60 --out /tmp/manifestos
+
+Writes minimal single-font PDFs (no dependencies) whose pages read like
+manifesto sections, so the real extraction, chunking and indexing code
+paths do the same work they would on an uploaded document.
+"""
+import argparse
+import os
+import random
+
+from bench_chunker import WORDS
+
+PAGE_HEIGHT = 842
+LINE_HEIGHT = 12
+MAX_LINE_CHARS = 95
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_pdf(pages):
+    """Return the bytes of a PDF with one page per list of text lines"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    kids = []
+    for lines in pages:
+        content = "BT /F1 9 Tf {0} TL 40 {1} Td {2} ET".format(
+            LINE_HEIGHT,
+            PAGE_HEIGHT - 40,
+            ' '.join(f"({_escape(line)}) Tj T*" for line in lines)
+        ).encode('latin-1', 'replace')
+        page_number = len(objects) + 1
+        kids.append(f"{page_number} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_number + 1} 0 R >>".encode('ascii')
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode('ascii')
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode('ascii') + body + b"\nendobj\n"
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('ascii')
+    output += b''.join(f"{offset:010d} 00000 n \n".encode('ascii') for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('ascii')
+    return bytes(output)
+
+
+def manifesto_pages(party_name, page_count, seed=0, sentences_per_page=24):
+    """Page line lists for a synthetic manifesto; the same seed gives the same text"""
+    rng = random.Random(f"{party_name}:{seed}")
+    pages = []
+    for page_number in range(page_count):
+        lines = [f"{party_name} Manifesto - Section {page_number + 1}"]
+        for _ in range(sentences_per_page):
+            sentence = f"We will {' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 22)))}."
+            while len(sentence) > MAX_LINE_CHARS:
+                cut = sentence.rfind(' ', 0, MAX_LINE_CHARS)
+                lines.append(sentence[:cut])
+                sentence = sentence[cut + 1:]
+            lines.append(sentence)
+        pages.append(lines[:(PAGE_HEIGHT - 80) // LINE_HEIGHT])
+    return pages
+
+
+def manifesto_text(party_name, page_count, seed=0):
+    """Plain text of the same synthetic manifesto, as the Node backend would send it"""
+    return "\n".join(" ".join(lines) for lines in manifesto_pages(party_name, page_count, seed))
+
+
+def manifesto_pdf(party_name, page_count, seed=0):
+    """PDF bytes of a synthetic manifesto"""
+    return make_pdf(manifesto_pages(party_name, page_count, seed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--parties', type=int, default=4)
+    parser.add_argument('--pages', default='5,20,60', help='comma-separated page counts')
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for party in range(args.parties):
+        for page_count in (int(value) for value in args.pages.split(',')):
+            path = os.path.join(args.out, f"party-{party}-{page_count}p.pdf")
+            with open(path, 'wb') as handle:
+                handle.write(manifesto_pdf(f"Party {party}", page_count))
+            print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+"""Offline bulk ingest: build the manifesto snapshot for a batch of party PDFs
+
+Usage (from Backend/ai_service):
+    python bulk_ingest.py ../src/uploads/manifestos --snapshot-dir ./cache/snapshots
+    python bulk_ingest.py parties.json [--workers 8] [--replace] [--report ingest.json]
+
+The input is a directory of PDFs or a JSON manifest listing
+``{"path": ..., "partyId": ..., "partyName": ...}`` objects (paths relative
+to the manifest). In a directory, files named as the Node backend stores
+uploads, ``<partyId>-<timestamp>-<name>.pdf``, keep their party id and the
+newest upload per party wins; other files use their name as the party.
+
+Pages of every PDF are extracted in ranges across ``--workers`` processes
+(all cores by default); once a party's pages are in, a worker chunks them,
+builds the extractive summary and writes the party's segment (chunks,
+BM25 postings and sentence table) straight into the snapshot directory.
+All segments are then published as one snapshot version, which running
+services (simple_app, every serve.py worker) swap to within
+SNAPSHOT_POLL_SECONDS. ``--replace`` drops parties not in the batch.
+Each PDF's pages (with page fingerprints), its chunks and the party's
+last-upload pointer also go into the service's ingest cache
+(``--ingest-cache-dir``), as /process-manifesto writes them, so a later
+upload of the same PDF is a cache hit and a revised one only re-extracts
+its changed pages.
+The exit status is 0 once a version is published, including one that
+``--skip-errors`` published without the unreadable PDFs, and 1 when
+nothing was published.
+
+Throughput is reported as pages/sec and MB/sec: per party over the
+worker time it took, and in total over the wall-clock run.
+The chunking settings must match the service's CHUNK_SIZE and
+CHUNK_OVERLAP (read from the same environment variables by default).
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chunker import iter_chunks
+from ingest_cache import IngestCache
+from pdf_extract import mapped_reader, page_fingerprints
+from response_cache import ResponseCache, fingerprint
+from snapshot import SnapshotStore, write_segment
+from summarizer import extractive_summary
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'snapshots')
+DEFAULT_INGEST_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'ingest')
+INGEST_CACHE_MAX_MB = int(os.environ.get('INGEST_CACHE_MAX_MB', 512))
+
+# <partyId>-<millisecond timestamp>-<original name>.pdf, as multer stores uploads
+UPLOAD_NAME = re.compile(r'^(?P<party>.+?)-(?P<timestamp>\d{13})-(?P<name>.+)\.pdf$', re.IGNORECASE)
+
+
+def directory_entries(directory):
+    """Party entries for the PDFs in a directory, newest upload per party"""
+    entries = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.lower().endswith('.pdf'):
+            continue
+        match = UPLOAD_NAME.match(filename)
+        stem = match.group('name') if match else os.path.splitext(filename)[0]
+        party_id = match.group('party') if match and match.group('party') != 'undefined' else None
+        party_id = party_id or re.sub(r'[^a-z0-9]+', '-', stem.lower()).strip('-')
+        timestamp = int(match.group('timestamp')) if match else 0
+        previous = entries.get(party_id)
+        if previous is None or timestamp >= previous['timestamp']:
+            entries[party_id] = {
+                'path': os.path.join(directory, filename),
+                'partyId': party_id,
+                'partyName': stem.replace('_', ' '),
+                'timestamp': timestamp
+            }
+    return list(entries.values())
+
+
+def manifest_entries(path):
+    """Party entries from a JSON manifest, with paths resolved against its directory"""
+    with open(path) as handle:
+        listed = json.load(handle)
+    base = os.path.dirname(os.path.abspath(path))
+    entries = []
+    for number, entry in enumerate(listed, start=1):
+        if not entry.get('path') or not entry.get('partyId'):
+            raise ValueError(f"Manifest entry {number} needs 'path' and 'partyId'")
+        entries.append({
+            'path': os.path.join(base, entry['path']),
+            'partyId': str(entry['partyId']),
+            'partyName': entry.get('partyName') or str(entry['partyId'])
+        })
+    if len({entry['partyId'] for entry in entries}) != len(entries):
+        raise ValueError('Manifest lists a partyId more than once')
+    return entries
+
+
+def _page_count(path):
+    with mapped_reader(path) as reader:
+        return len(reader.pages)
+
+
+_ingest_caches = {}  # directory -> IngestCache of this worker process
+
+
+def _ingest_cache(directory):
+    if directory not in _ingest_caches:
+        _ingest_caches[directory] = IngestCache(directory, max_bytes=INGEST_CACHE_MAX_MB * 1024 * 1024)
+    return _ingest_caches[directory]
+
+
+def _file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as pdf_file:
+        for block in iter(lambda: pdf_file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _extract_range(path, start, stop):
+    """Text of pages [start, stop) of a PDF and the seconds taken (runs in a worker process)"""
+    began = time.perf_counter()
+    with mapped_reader(path) as reader:
+        pages = [reader.pages[index].extract_text() or '' for index in range(start, stop)]
+    return pages, time.perf_counter() - began
+
+
+def _build_segment(directory, entry, pages, chunk_size, overlap, cache_dir=None):
+    """Chunk, summarize and write one party's segment (runs in a worker process)
+
+    Returns the segment's temporary path in ``directory``, the response
+    cache dependency ids of its chunks and the PDF's SHA-256. With
+    ``cache_dir``, the pages and chunks are also stored in that ingest cache.
+    """
+    began = time.perf_counter()
+    chunks = list(iter_chunks(pages, chunk_size=chunk_size, overlap=overlap))
+    sha256 = _file_sha256(entry['path'])
+    if cache_dir:
+        cache = _ingest_cache(cache_dir)
+        cache.put(IngestCache.pages_key(sha256), {'pages': pages, 'pageHashes': page_fingerprints(entry['path'])})
+        cache.put(IngestCache.chunks_key(sha256, chunk_size=chunk_size, overlap=overlap),
+                  {'pageCount': len(pages), 'chunks': chunks})
+    metadata = {
+        'page_count': len(pages),
+        'summary': extractive_summary(chunks),
+        'processed_at': str(datetime.datetime.now())
+    }
+    fd, path = tempfile.mkstemp(dir=directory, prefix='.bulk-', suffix='.tmp')
+    os.close(fd)
+    try:
+        write_segment(path, [(entry['partyId'], entry['partyName'], chunks, metadata)])
+    except BaseException:
+        os.unlink(path)
+        raise
+    dependencies = [fingerprint(entry['partyId'], chunk['text']) for chunk in chunks]
+    return path, len(chunks), dependencies, sha256, time.perf_counter() - began
+
+
+def build_segments(entries, directory, workers, chunk_size, overlap, pages_per_task=8, cache_dir=None):
+    """Extract and index every entry across a process pool
+
+    Returns ``(results, failures)``: per-party dicts with the segment path
+    and figures, and ``{party_id: error}`` for PDFs that could not be read.
+    A party's ``workerSeconds`` is the time workers spent on it, excluding
+    time queued behind other parties.
+    """
+    results, failures = {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}  # extraction future -> (party id, first page)
+        texts = {}  # party id -> [page text or None]
+        started = {}
+        for entry in entries:
+            party_id = entry['partyId']
+            started[party_id] = time.perf_counter()
+            try:
+                count = _page_count(entry['path'])
+            except Exception as e:
+                failures[party_id] = str(e)
+                continue
+            texts[party_id] = [None] * count
+            results[party_id] = dict(entry, pages=count, bytes=os.path.getsize(entry['path']), workerSeconds=0.0)
+            # Large PDFs are split so every core has work; small ones stay whole
+            step = max(pages_per_task, math.ceil(count / workers))
+            for start in range(0, max(count, 1), step):
+                future = executor.submit(_extract_range, entry['path'], start, min(start + step, count))
+                pending[future] = (party_id, start)
+
+        builds = {}
+        remaining = {party_id: sum(1 for owner, _ in pending.values() if owner == party_id) for party_id in texts}
+        for future in as_completed(list(pending)):
+            party_id, start = pending[future]
+            if party_id in failures:
+                continue
+            try:
+                pages, seconds = future.result()
+            except Exception as e:
+                failures[party_id] = str(e)
+                results.pop(party_id, None)
+                continue
+            texts[party_id][start:start + len(pages)] = pages
+            results[party_id]['workerSeconds'] += seconds
+            remaining[party_id] -= 1
+            if remaining[party_id] == 0:
+                entry = results[party_id]
+                builds[executor.submit(_build_segment, directory, entry, texts.pop(party_id),
+                                       chunk_size, overlap, cache_dir)] = party_id
+
+        for future in as_completed(builds):
+            party_id = builds[future]
+            try:
+                path, chunk_count, dependencies, sha256, seconds = future.result()
+            except Exception as e:
+                failures[party_id] = str(e)
+                results.pop(party_id, None)
+                continue
+            result = results[party_id]
+            result.update(segment=path, chunks=chunk_count, dependencies=dependencies, sha256=sha256,
+                          indexSeconds=seconds, workerSeconds=result['workerSeconds'] + seconds,
+                          seconds=time.perf_counter() - started[party_id])
+    return results, failures
+
+
+def stale_dependencies(view, results, replace=False):
+    """Dependency ids of stored chunks that the published version no longer contains"""
+    if view is None:
+        return []
+    stale = []
+    for party_id, _ in view.items():
+        if party_id not in results and not replace:
+            continue
+        current = set(results[party_id]['dependencies']) if party_id in results else set()
+        for chunk in view.iter_party(party_id):
+            dependency = fingerprint(party_id, chunk['text'])
+            if dependency not in current:
+                stale.append(dependency)
+    return stale
+
+
+def rate(amount, seconds):
+    return amount / seconds if seconds > 0 else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help='directory of PDFs or JSON manifest of {path, partyId, partyName}')
+    parser.add_argument('--snapshot-dir', default=os.environ.get('SNAPSHOT_DIR') or DEFAULT_SNAPSHOT_DIR)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=int(os.environ.get('CHUNK_SIZE', 500)))
+    parser.add_argument('--chunk-overlap', type=int, default=int(os.environ.get('CHUNK_OVERLAP', 0)))
+    parser.add_argument('--replace', action='store_true', help='drop stored parties that are not in this batch')
+    parser.add_argument('--skip-errors', action='store_true', help='publish the readable PDFs when some fail')
+    parser.add_argument('--response-cache-db', default=os.environ.get('RESPONSE_CACHE_DB') or None,
+                        help='persisted answer cache whose answers quoting replaced chunks are dropped')
+    parser.add_argument('--ingest-cache-dir', default=os.environ.get('INGEST_CACHE_DIR', DEFAULT_INGEST_CACHE_DIR),
+                        help="the service's ingest cache to fill with pages and chunks ('' to skip)")
+    parser.add_argument('--report', help='write per-party figures and totals to this JSON file')
+    args = parser.parse_args()
+
+    entries = directory_entries(args.source) if os.path.isdir(args.source) else manifest_entries(args.source)
+    if not entries:
+        print(f"❌ No PDFs found in {args.source}", file=sys.stderr)
+        sys.exit(1)
+
+    store = SnapshotStore(args.snapshot_dir)
+    print(f"📚 Ingesting {len(entries)} manifestos with {args.workers} workers into {args.snapshot_dir}")
+    began = time.perf_counter()
+    results, failures = build_segments(entries, args.snapshot_dir, args.workers, args.chunk_size, args.chunk_overlap,
+                                       cache_dir=args.ingest_cache_dir)
+    built = time.perf_counter() - began
+
+    for party_id, error in failures.items():
+        print(f"❌ {party_id}: {error}", file=sys.stderr)
+    if failures and not args.skip_errors:
+        for result in results.values():
+            if result.get('segment'):
+                os.unlink(result['segment'])
+        print("Nothing published; fix the PDFs above or pass --skip-errors", file=sys.stderr)
+        sys.exit(1)
+    if not results:
+        # Publishing an empty batch (with --replace, an empty corpus) would
+        # switch every running service to it
+        print("Nothing published; no PDF could be read", file=sys.stderr)
+        sys.exit(1)
+
+    stale = stale_dependencies(store.current(force=True), results, args.replace)
+    view = store.put_segments({party_id: result['segment'] for party_id, result in results.items()},
+                              replace=args.replace)
+    if args.ingest_cache_dir:
+        # Point each party at this PDF only once it is the published one
+        ingest_cache = _ingest_cache(args.ingest_cache_dir)
+        for party_id, result in results.items():
+            ingest_cache.put(IngestCache.party_key(party_id), {'sha256': result['sha256']})
+    elapsed = time.perf_counter() - began
+    invalidated = 0
+    if args.response_cache_db and stale:
+        invalidated = ResponseCache(db_path=args.response_cache_db).invalidate_dependencies(stale)
+
+    # Per party: rates over the worker time it took; total: over wall-clock time
+    print(f"{'party':<28}{'pages':>7}{'MB':>8}{'chunks':>8}{'seconds':>9}{'pages/s':>9}{'MB/s':>8}")
+    for result in sorted(results.values(), key=lambda result: result['partyId']):
+        mb = result['bytes'] / (1024 * 1024)
+        print(f"{result['partyId'][:27]:<28}{result['pages']:>7}{mb:>8.2f}{result['chunks']:>8}"
+              f"{result['workerSeconds']:>9.2f}{rate(result['pages'], result['workerSeconds']):>9.1f}"
+              f"{rate(mb, result['workerSeconds']):>8.2f}")
+    pages = sum(result['pages'] for result in results.values())
+    mb = sum(result['bytes'] for result in results.values()) / (1024 * 1024)
+    chunks = sum(result['chunks'] for result in results.values())
+    print(f"{'total':<28}{pages:>7}{mb:>8.2f}{chunks:>8}{elapsed:>9.2f}{rate(pages, elapsed):>9.1f}"
+          f"{rate(mb, elapsed):>8.2f}")
+    print(f"✅ Published snapshot version {view.version} ({len(view)} parties); "
+          f"running services pick it up within SNAPSHOT_POLL_SECONDS"
+          + (f"; {invalidated} cached answers invalidated" if invalidated else ""))
+    if failures:
+        print(f"⚠️ Skipped {len(failures)} unreadable PDFs: {', '.join(sorted(failures))}", file=sys.stderr)
+
+    if args.report:
+        with open(args.report, 'w') as handle:
+            json.dump({
+                'version': view.version,
+                'workers': args.workers,
+                'buildSeconds': round(built, 3),
+                'seconds': round(elapsed, 3),
+                'pages': pages,
+                'megabytes': round(mb, 3),
+                'chunks': chunks,
+                'pagesPerSecond': round(rate(pages, elapsed), 2),
+                'megabytesPerSecond': round(rate(mb, elapsed), 3),
+                'invalidatedAnswers': invalidated,
+                'failures': failures,
+                'parties': [
+                    {key: value for key, value in result.items() if key not in ('segment', 'dependencies')}
+                    for result in results.values()
+                ]
+            }, handle, indent=2)
+        print(f"Report written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
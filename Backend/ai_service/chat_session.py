@@ -0,0 +1,132 @@
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from response_cache import fingerprint
+
+# Rough size of an English token for llama-family tokenizers; there is no
+# tokenizer in this service, so budgets are estimates with some headroom
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Estimate how many model tokens a piece of text takes"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def format_history(messages):
+    """Render conversation messages as Human/Assistant lines"""
+    return "\n".join(
+        f"{'Human' if message['role'] == 'user' else 'Assistant'}: {message['content']}"
+        for message in messages
+    )
+
+
+def trim_history(messages, budget_tokens, max_messages=None):
+    """Keep the most recent messages that fit in ``budget_tokens``"""
+    kept = []
+    used = 0
+    for message in reversed(messages[-max_messages:] if max_messages else messages):
+        cost = estimate_tokens(message['content']) + 2
+        if used + cost > budget_tokens:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def transcript_key(party_name, manifesto_hash, messages):
+    """Session key for a conversation as of the given transcript
+
+    The frontend sends the whole conversation on every turn, so the key a
+    turn is stored under (its history plus the new question and answer) is
+    the key the next turn looks up. Editing history or a new manifesto text
+    simply misses and starts a new session.
+    """
+    return fingerprint(
+        party_name,
+        manifesto_hash,
+        *(f"{message['role']}:{message['content'].strip()}" for message in messages)
+    )
+
+
+class ChatSession:
+    """Ollama KV context for one conversation plus the excerpts it already contains
+
+    ``pending`` holds messages of turns answered from the response cache,
+    which the model never saw; the next generated turn replays them.
+    """
+
+    __slots__ = ('context', 'excerpt_ids', 'turns', 'pending', 'updated_at')
+
+    def __init__(self, context, excerpt_ids, turns=1, pending=()):
+        self.context = array('I', context)
+        self.excerpt_ids = excerpt_ids  # chunk fingerprint -> citation number
+        self.turns = turns
+        self.pending = list(pending)
+        self.updated_at = time.time()
+
+    @property
+    def tokens(self):
+        return len(self.context)
+
+
+class SessionCache:
+    """LRU cache of chat sessions bounded by count, total context tokens and age"""
+
+    def __init__(self, max_sessions=256, max_tokens=2_000_000, ttl_seconds=1800):
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Remove and return the live session for key, or None
+
+        A session is taken rather than read because the turn that resumes it
+        replaces it with a longer one under the next transcript key.
+        """
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            if session is not None:
+                self._tokens -= session.tokens
+                if time.time() - session.updated_at <= self.ttl_seconds:
+                    self.hits += 1
+                    return session
+            self.misses += 1
+            return None
+
+    def put(self, key, session):
+        """Store a session and evict the least recently used ones over the limits"""
+        with self._lock:
+            previous = self._sessions.pop(key, None)
+            if previous is not None:
+                self._tokens -= previous.tokens
+            self._sessions[key] = session
+            self._tokens += session.tokens
+            while self._sessions and (
+                len(self._sessions) > self.max_sessions or self._tokens > self.max_tokens
+            ):
+                _, evicted = self._sessions.popitem(last=False)
+                self._tokens -= evicted.tokens
+                self.evictions += 1
+
+    def stats(self):
+        """Return session count, held context tokens and hit counters"""
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'maxSessions': self.max_sessions,
+                'contextTokens': self._tokens,
+                'maxTokens': self.max_tokens,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
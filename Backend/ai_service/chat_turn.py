@@ -0,0 +1,139 @@
+import asyncio
+
+from llm_client import PRIORITY_INTERACTIVE
+from ollama_stream import relay_tokens, relay_tokens_async
+
+
+class GenerationFailed(Exception):
+    """Raised when Ollama answers a generation with an error status"""
+
+    def __init__(self, status_code):
+        super().__init__(f"Ollama API error: {status_code}")
+        self.status_code = status_code
+
+
+class ChatReply:
+    """A chat response that needs no model call
+
+    ``streamable`` replies (cache hits, extractive answers) are sent as a
+    one-token event stream when the client asked for one; the others
+    (validation errors, nothing retrieved) are always plain JSON.
+    """
+
+    def __init__(self, body, status=200, streamable=False):
+        self.body = body
+        self.status = status
+        self.streamable = streamable
+
+
+class ChatTurn:
+    """A chat answer that needs exactly one Ollama generation
+
+    Chat routes do the quick work themselves (validation, retrieval, prompt
+    building, cache lookups) and describe the generation with a ChatTurn, so
+    the same route logic runs on the Flask server with the blocking
+    LLMClient and on the asyncio server with AsyncLLMClient.
+
+    ``extra`` holds the response fields sent alongside the answer, in the
+    JSON body and in the stream's ``done`` event. ``complete(text, final)``
+    stores a generated answer (response cache, chat session) and returns the
+    text to send; ``final`` is Ollama's last message. ``failure(error)``
+    returns the response fields to send when the generation failed, and
+    ``fallback()`` the answer text for a stream that failed before its
+    first token. ``key`` coalesces concurrent identical generations;
+    ``affinity`` names the conversation, so the backend pool keeps its
+    turns on one Ollama server.
+    """
+
+    def __init__(self, payload, key, extra, complete, failure, fallback, priority=PRIORITY_INTERACTIVE,
+                 affinity=None):
+        self.payload = payload
+        self.key = key
+        self.extra = extra
+        self.complete = complete
+        self.failure = failure
+        self.fallback = fallback
+        self.priority = priority
+        self.affinity = affinity
+
+    def finish(self, response):
+        """Turn a non-streaming generate response into the answer text"""
+        if response.status_code != 200:
+            raise GenerationFailed(response.status_code)
+        final = response.json()
+        return self.complete(final.get('response', ''), final)
+
+    def answer(self, text):
+        return dict(self.extra, response=text, degraded=False)
+
+    def failed(self, error):
+        return dict(self.extra, **self.failure(error))
+
+
+def reply_events(reply, fmt):
+    """Stream a ChatReply's answer as a single token and a done event"""
+    extra = {name: value for name, value in reply.body.items() if name != 'response'}
+    return relay_tokens(iter([reply.body['response']]), fmt, extra=extra)
+
+
+def answer_turn(turn, client, flights, timeout=None):
+    """Generate a turn's answer with the blocking LLMClient and return the response body
+
+    Concurrent turns with the same key wait for one shared generation.
+    """
+    def generate():
+        return turn.finish(client.generate(turn.payload, turn.priority, affinity=turn.affinity))
+
+    try:
+        return turn.answer(flights.do(turn.key, generate, timeout=timeout))
+    except Exception as e:
+        return turn.failed(e)
+
+
+def stream_turn(turn, client, fmt):
+    """Relay a turn's tokens from the blocking LLMClient as SSE or NDJSON events"""
+    result = {}
+
+    def capture():
+        result['final'] = yield from client.stream(turn.payload, turn.priority, affinity=turn.affinity)
+
+    return relay_tokens(
+        capture(),
+        fmt,
+        extra=turn.extra,
+        on_complete=lambda text: turn.complete(text, result.get('final')),
+        fallback=turn.fallback
+    )
+
+
+async def answer_turn_async(turn, client, flights, timeout=None, executor=None):
+    """answer_turn for the asyncio server: AsyncLLMClient and AsyncSingleFlight
+
+    Storing the answer (a SQLite write with RESPONSE_CACHE_DB) and the
+    failure answer (an extractive fallback) run on ``executor`` to keep them
+    off the event loop.
+    """
+    async def generate():
+        response = await client.generate(turn.payload, turn.priority, affinity=turn.affinity)
+        return await asyncio.get_running_loop().run_in_executor(executor, turn.finish, response)
+
+    try:
+        return turn.answer(await flights.do(turn.key, generate, timeout=timeout))
+    except Exception as e:
+        return await asyncio.get_running_loop().run_in_executor(executor, turn.failed, e)
+
+
+def stream_turn_async(turn, client, fmt, executor=None):
+    """stream_turn for the asyncio server: an async generator of encoded events
+
+    The finished answer is stored on ``executor``, off the event loop.
+    """
+    result = {}
+    return relay_tokens_async(
+        client.stream(turn.payload, turn.priority, result=result, affinity=turn.affinity),
+        fmt,
+        extra=turn.extra,
+        on_complete=lambda text: turn.complete(text, result.get('final')),
+        fallback=turn.fallback,
+        executor=executor
+    )
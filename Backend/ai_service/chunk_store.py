@@ -0,0 +1,211 @@
+import sys
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+
+from sentences import SentenceTable
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib is always available
+    zstandard = None
+
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class PartyChunks:
+    """One party's chunks packed into a single text buffer plus offset arrays
+
+    ``offsets[i]`` and ``lengths[i]`` locate chunk ``i`` inside the buffer.
+    Page ranges and word counts live in parallel arrays. When the store
+    compresses cold data, only the compressed bytes are kept here and the
+    text is decompressed on demand. The sentence table for extractive
+    answers is built here, at ingest, and never compressed.
+    """
+
+    __slots__ = ('party_id', 'party_name', 'page_count', 'summary', 'processed_at',
+                 'offsets', 'lengths', 'page_starts', 'page_ends', 'word_counts',
+                 'text', 'compressed', 'codec', 'sentences')
+
+    def __init__(self, party_id, party_name, chunks, page_count=None, summary=None, processed_at=None):
+        self.party_id = sys.intern(party_id) if isinstance(party_id, str) else party_id
+        self.party_name = sys.intern(party_name) if isinstance(party_name, str) else party_name
+        self.page_count = page_count
+        self.summary = summary or []
+        self.processed_at = processed_at
+        self.offsets = array('I')
+        self.lengths = array('I')
+        self.page_starts = array('I')
+        self.page_ends = array('I')
+        self.word_counts = array('I')
+        parts = []
+        position = 0
+        for chunk in chunks:
+            text = chunk['text']
+            parts.append(text)
+            self.offsets.append(position)
+            self.lengths.append(len(text))
+            self.page_starts.append(chunk.get('pageStart') or 0)
+            self.page_ends.append(chunk.get('pageEnd') or 0)
+            self.word_counts.append(chunk.get('wordCount') or len(text.split()))
+            position += len(text)
+        self.text = ''.join(parts)
+        self.compressed = None
+        self.codec = None
+        self.sentences = SentenceTable.build(parts)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def freeze(self, codec):
+        """Replace the text buffer with its compressed bytes"""
+        if self.compressed is None:
+            self.compressed = _compress(self.text.encode('utf-8'), codec)
+            self.codec = codec
+        self.text = None
+
+    def thaw(self):
+        """Decompress the text buffer if it is cold and return it
+
+        Callers slice the returned string, never ``self.text``: ChunkStore
+        may re-freeze the record from another thread at any moment.
+        """
+        text = self.text
+        if text is None:
+            text = _decompress(self.compressed, self.codec).decode('utf-8')
+            self.text = text
+        return text
+
+    def chunk_text(self, index):
+        offset = self.offsets[index]
+        return self.thaw()[offset:offset + self.lengths[index]]
+
+    def chunk(self, index):
+        """Materialize chunk ``index`` as the dict shape the endpoints return"""
+        return {
+            'chunkId': f"{self.party_id}_chunk_{index}",
+            'partyId': self.party_id,
+            'partyName': self.party_name,
+            'text': self.chunk_text(index),
+            'chunkIndex': index,
+            'pageStart': self.page_starts[index],
+            'pageEnd': self.page_ends[index],
+            'wordCount': self.word_counts[index]
+        }
+
+    def top_sentences(self, index, terms, limit=2):
+        """Return up to ``limit`` ``(score, position, sentence)`` of chunk ``index`` for query terms"""
+        return self.sentences.top(index, self.chunk_text(index), self.sentences.term_ids(terms), limit)
+
+    def iter_chunks(self):
+        for index in range(len(self)):
+            yield self.chunk(index)
+
+    def nbytes(self):
+        """Approximate bytes held by the buffers and arrays"""
+        arrays = (self.offsets, self.lengths, self.page_starts, self.page_ends, self.word_counts)
+        size = sum(a.itemsize * len(a) for a in arrays) + self.sentences.nbytes()
+        text = self.text
+        if text is not None:
+            size += sys.getsizeof(text)
+        if self.compressed is not None:
+            size += len(self.compressed)
+        return size
+
+
+class ChunkStore:
+    """Compact per-party chunk storage with optional compressed cold storage
+
+    With ``compress`` enabled, every party's text is kept compressed and at
+    most ``hot_parties`` decompressed buffers are held at a time (LRU); other
+    parties are decompressed lazily when a chunk is read.
+    """
+
+    def __init__(self, compress=False, codec=None, hot_parties=8):
+        self.compress = compress
+        self.codec = codec or ('zstd' if zstandard is not None else 'zlib')
+        if self.codec == 'zstd' and zstandard is None:
+            raise ValueError('zstd compression requires the zstandard package')
+        self.hot_parties = hot_parties
+        self._parties = {}
+        self._hot = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, party_id, party_name, chunks, **metadata):
+        """Pack and store a party's chunks, replacing any previous ones"""
+        record = PartyChunks(party_id, party_name, chunks, **metadata)
+        if self.compress:
+            record.freeze(self.codec)
+        with self._lock:
+            self._parties[party_id] = record
+            self._hot.pop(party_id, None)
+        return record
+
+    def remove(self, party_id):
+        with self._lock:
+            self._hot.pop(party_id, None)
+            return self._parties.pop(party_id, None)
+
+    def get(self, party_id):
+        """Return the PartyChunks record for a party, or None"""
+        return self._parties.get(party_id)
+
+    def __contains__(self, party_id):
+        return party_id in self._parties
+
+    def __len__(self):
+        return len(self._parties)
+
+    def items(self):
+        return list(self._parties.items())
+
+    def chunk(self, party_id, index):
+        """Return one chunk dict, or None if it does not exist"""
+        record = self._parties.get(party_id)
+        if record is None or not 0 <= index < len(record):
+            return None
+        if self.compress:
+            self._touch(party_id, record)
+        return record.chunk(index)
+
+    def top_sentences(self, party_id, index, terms, limit=2):
+        """Best sentences of one chunk for query terms, from its precomputed sentence table"""
+        record = self._parties.get(party_id)
+        if record is None or not 0 <= index < len(record):
+            return []
+        if self.compress:
+            self._touch(party_id, record)
+        return record.top_sentences(index, terms, limit)
+
+    def _touch(self, party_id, record):
+        # Keep recently read parties decompressed; re-freeze the coldest
+        with self._lock:
+            self._hot[party_id] = record
+            self._hot.move_to_end(party_id)
+            while len(self._hot) > self.hot_parties:
+                _, cold = self._hot.popitem(last=False)
+                cold.freeze(self.codec)
+        record.thaw()
+
+    def stats(self):
+        """Return party, chunk and memory figures"""
+        with self._lock:
+            return {
+                'parties': len(self._parties),
+                'chunks': sum(len(record) for record in self._parties.values()),
+                'bytes': sum(record.nbytes() for record in self._parties.values()),
+                'compressed': self.compress,
+                'codec': self.codec if self.compress else None,
+                'hotParties': len(self._hot)
+            }
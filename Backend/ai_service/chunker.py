@@ -0,0 +1,98 @@
+import re
+from collections import deque
+
+NUMBERED_HEADING = re.compile(r'^(\d+(\.\d+)*\.?|[IVXLC]+\.|chapter\s+\d+|section\s+\d+)\s', re.IGNORECASE)
+
+
+def is_heading(line):
+    """Heuristic check for a stripped, non-empty line being a section heading"""
+    if len(line) > 80 or line[-1] in '.,;:':
+        return False
+    if line.count(' ') > 9:
+        return False
+    if line.isupper() and len(line) > 2:
+        return True
+    return bool(NUMBERED_HEADING.match(line))
+
+
+def split_sentences(paragraph):
+    """Split a single-line paragraph after sentence-ending punctuation"""
+    for mark in '.!?':
+        paragraph = paragraph.replace(mark + ' ', mark + '\n')
+    return paragraph.split('\n')
+
+
+def iter_units(page_text):
+    """Yield ``(text, is_heading)`` units for one page, one sentence at a time"""
+    paragraph = []
+    for line in page_text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if is_heading(line):
+            if paragraph:
+                yield from ((sentence, False) for sentence in split_sentences(' '.join(paragraph)))
+                paragraph = []
+            yield line, True
+        else:
+            paragraph.append(line)
+    if paragraph:
+        yield from ((sentence, False) for sentence in split_sentences(' '.join(paragraph)))
+
+
+def iter_chunks(pages, chunk_size=500, overlap=0, min_chunk_words=50):
+    """Stream chunk dicts from an iterable of page texts in linear time
+
+    Chunks hold at most ``chunk_size`` words. ``overlap`` words of trailing
+    sentences are carried into the next chunk. A heading starts a new chunk
+    once the current one holds ``min_chunk_words``, and sentences never span
+    a page break. Each chunk records the pages it was taken from.
+    """
+    if overlap >= chunk_size:
+        raise ValueError('overlap must be smaller than chunk_size')
+
+    current = deque()  # (sentence, word_count, page_number)
+    current_words = 0
+    chunk_index = 0
+
+    def emit():
+        return {
+            'text': ' '.join(sentence for sentence, _, _ in current),
+            'chunkIndex': chunk_index,
+            'wordCount': current_words,
+            'pageStart': current[0][2],
+            'pageEnd': current[-1][2]
+        }
+
+    def carry_overlap(incoming_words):
+        # Keep the trailing sentences that fit in the overlap window and
+        # still leave room for the incoming sentence
+        nonlocal current_words
+        budget = min(overlap, chunk_size - incoming_words)
+        while current and current_words > budget:
+            current_words -= current.popleft()[1]
+
+    for page_number, page_text in enumerate(pages, start=1):
+        for unit, heading in iter_units(page_text or ''):
+            words = unit.split()
+            if len(words) <= chunk_size:
+                pieces = [(unit, len(words))] if words else []
+            else:
+                # Break over-long runs of text (tables, missing punctuation) into windows
+                pieces = [(' '.join(words[i:i + chunk_size]), len(words[i:i + chunk_size]))
+                          for i in range(0, len(words), chunk_size)]
+            for piece, word_count in pieces:
+                force_break = heading and current_words >= min_chunk_words
+                if current and (force_break or current_words + word_count > chunk_size):
+                    yield emit()
+                    chunk_index += 1
+                    if force_break:
+                        current.clear()
+                        current_words = 0
+                    else:
+                        carry_overlap(word_count)
+                current.append((piece, word_count, page_number))
+                current_words += word_count
+
+    if current:
+        yield emit()
@@ -0,0 +1,137 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class IngestCache:
+    """Content-addressed on-disk cache for extracted pages and chunk lists
+
+    Entries are gzipped JSON files named by their key. Recency is tracked in
+    memory (seeded from file mtimes at startup) and the least recently used
+    entries are deleted once the directory grows past ``max_bytes``. Entries
+    written by other processes sharing the directory (serve.py workers,
+    bulk_ingest) are picked up on their first lookup.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> size in bytes, oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing()
+
+    @staticmethod
+    def pages_key(sha256):
+        """Key for the extracted page texts of a PDF"""
+        return f"pages-{sha256}"
+
+    @staticmethod
+    def party_key(party_id):
+        """Key for the SHA-256 of the last PDF ingested for a party"""
+        return f"party-{hashlib.sha256(party_id.encode('utf-8')).hexdigest()[:32]}"
+
+    @staticmethod
+    def chunks_key(sha256, **chunker_settings):
+        """Key for a PDF's chunk list under specific chunker settings"""
+        settings = json.dumps(chunker_settings, sort_keys=True)
+        return f"chunks-{sha256}-{hashlib.sha256(settings.encode()).hexdigest()[:16]}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def _load_existing(self):
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json.gz'):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            found.append((stat.st_mtime, name[:-len('.json.gz')], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            known = key in self._entries
+            if known:
+                self._entries.move_to_end(key)
+        if not known and not self._adopt(key):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            with gzip.open(self._path(key), 'rt', encoding='utf-8') as cached:
+                value = json.load(cached)
+            os.utime(self._path(key))
+        except (OSError, ValueError):
+            # Entry vanished or is corrupt; treat it as a miss
+            self._forget(key)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store value under key and evict least recently used entries"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=3) as cached:
+                cached.write(json.dumps(value).encode('utf-8'))
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            evicted = []
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.unlink(self._path(old_key))
+            except OSError:
+                pass
+
+    def _adopt(self, key):
+        """Start tracking an entry another process wrote, if its file exists"""
+        try:
+            size = os.path.getsize(self._path(key))
+        except OSError:
+            return False
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = size
+                self._total_bytes += size
+        return True
+
+    def _forget(self, key):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+
+    def stats(self):
+        """Return entry count, size and hit/miss counters"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,193 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Seconds between progress writes to a shared job database
+PROGRESS_SAVE_INTERVAL = 0.5
+
+FIELDS = ('id', 'party_id', 'party_name', 'status', 'stage', 'pages_done', 'page_count',
+          'created_at', 'started_at', 'finished_at', 'result', 'error', 'pid')
+
+
+class IngestJob:
+    """Progress and outcome of one background manifesto ingest"""
+
+    def __init__(self, party_id, party_name, on_change=None):
+        self.id = uuid.uuid4().hex
+        self.party_id = party_id
+        self.party_name = party_name
+        self.status = 'queued'  # queued -> running -> complete | failed
+        self.stage = 'queued'
+        self.pages_done = 0
+        self.page_count = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.pid = os.getpid()
+        self._on_change = on_change or (lambda job, force: None)
+
+    @classmethod
+    def from_row(cls, row):
+        """Rebuild a job read from the shared job database"""
+        job = cls(None, None)
+        for field, value in zip(FIELDS, row):
+            setattr(job, field, json.loads(value) if field == 'result' and value is not None else value)
+        return job
+
+    def row(self):
+        return tuple(json.dumps(self.result) if field == 'result' and self.result is not None
+                     else getattr(self, field) for field in FIELDS)
+
+    def progress(self, stage, pages_done=None, page_count=None):
+        """Record the current pipeline stage and page counters"""
+        stage_changed = stage != self.stage
+        self.stage = stage
+        if pages_done is not None:
+            self.pages_done = pages_done
+        if page_count is not None:
+            self.page_count = page_count
+        self._on_change(self, stage_changed)
+
+    def eta_seconds(self):
+        """Estimate remaining extraction time from the page rate so far"""
+        if self.status != 'running' or not self.page_count or not self.pages_done:
+            return None
+        elapsed = time.time() - self.started_at
+        remaining = self.page_count - self.pages_done
+        return round(elapsed / self.pages_done * remaining, 2)
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        return {
+            'jobId': self.id,
+            'partyId': self.party_id,
+            'partyName': self.party_name,
+            'status': self.status,
+            'stage': self.stage,
+            'pagesDone': self.pages_done,
+            'pageCount': self.page_count,
+            'elapsedSeconds': round(end - self.started_at, 2) if self.started_at else 0.0,
+            'etaSeconds': self.eta_seconds(),
+            'result': self.result,
+            'error': self.error
+        }
+
+
+class IngestJobQueue:
+    """Run manifesto ingests on a background worker pool and track their progress
+
+    Finished jobs are kept for ``retention_seconds`` so clients can poll for
+    the outcome, then pruned. When ``db_path`` is set, job state is written
+    through to SQLite, so every serve.py worker can report on a job started
+    by another; a job whose worker process died is reported as failed.
+    """
+
+    def __init__(self, workers=2, retention_seconds=3600, db_path=None):
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest')
+        self._jobs = {}
+        self._saved_at = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS ingest_jobs ({', '.join(FIELDS)}, PRIMARY KEY (id))")
+            self._db.commit()
+
+    def submit(self, party_id, party_name, run, cleanup=None):
+        """Queue ``run(job)`` and return the job; its return value becomes the result
+
+        ``cleanup`` is called once the job finishes either way, e.g. to
+        remove the spooled upload.
+        """
+        job = IngestJob(party_id, party_name, on_change=self._save)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._save(job)
+        self._executor.submit(self._run, job, run, cleanup)
+        return job
+
+    def _run(self, job, run, cleanup):
+        job.status = 'running'
+        job.started_at = time.time()
+        self._save(job)
+        try:
+            job.result = run(job)
+            job.status = 'complete'
+            job.stage = 'complete'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            self._save(job)
+            if cleanup is not None:
+                cleanup()
+
+    def _save(self, job, force=True):
+        # Page progress is written at most every PROGRESS_SAVE_INTERVAL seconds
+        if self._db is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._saved_at.get(job.id, 0.0) < PROGRESS_SAVE_INTERVAL:
+                return
+            self._saved_at[job.id] = now
+            self._db.execute(f"INSERT OR REPLACE INTO ingest_jobs VALUES ({', '.join('?' * len(FIELDS))})",
+                             job.row())
+            self._db.commit()
+
+    def get(self, job_id):
+        """Return the job with this id, or None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None or self._db is None:
+                return job
+            row = self._db.execute(
+                f"SELECT {', '.join(FIELDS)} FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._orphan_check(IngestJob.from_row(row)) if row else None
+
+    @staticmethod
+    def _orphan_check(job):
+        # A worker that exited mid-ingest never finishes its job
+        if job.finished_at is None:
+            try:
+                os.kill(job.pid, 0)
+            except ProcessLookupError:
+                job.status = 'failed'
+                job.error = 'The worker running this ingest exited'
+                job.finished_at = time.time()
+            except PermissionError:
+                pass
+        return job
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+            self._saved_at.pop(job_id, None)
+        if self._db is not None:
+            self._db.execute('DELETE FROM ingest_jobs WHERE finished_at < ?', (cutoff,))
+            self._db.commit()
+
+    def stats(self):
+        """Count jobs by status (across all workers sharing the job database)"""
+        with self._lock:
+            if self._db is not None:
+                rows = self._db.execute(f"SELECT {', '.join(FIELDS)} FROM ingest_jobs").fetchall()
+                jobs = [self._orphan_check(IngestJob.from_row(row)) for row in rows]
+            else:
+                jobs = list(self._jobs.values())
+            counts = {}
+            for job in jobs:
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
@@ -0,0 +1,374 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ollama_stream import iter_ollama_tokens
+
+# Lower numbers are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+class QueueFull(Exception):
+    """Raised immediately when the LLM queue is already at capacity"""
+
+
+class QueueTimeout(Exception):
+    """Raised when a request waited too long for an LLM slot"""
+
+
+class CircuitOpen(Exception):
+    """Raised immediately while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Fail fast after too many failed or slow LLM calls, and probe for recovery
+
+    The outcomes of the last ``window`` calls are kept. Once at least
+    ``min_calls`` are recorded and either the failure rate reaches
+    ``failure_rate`` or the share of calls slower than ``slow_call_seconds``
+    reaches ``slow_rate``, the circuit opens and calls raise CircuitOpen
+    without touching the backend. A background thread then runs ``probe``
+    every ``probe_interval`` seconds; each pool Backend supplies a GET /api/tags
+    probe when none is given. After a successful probe the circuit is half-open: one trial
+    call goes through, and its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, probe=None, window=20, min_calls=5, failure_rate=0.5,
+                 slow_call_seconds=20.0, slow_rate=0.8, probe_interval=5.0):
+        self.probe = probe
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.probe_interval = probe_interval
+        self.state = self.CLOSED
+        self.trips = 0
+        self.rejected = 0
+        self.probes = 0
+        self.opened_at = None
+        self._outcomes = deque(maxlen=window)  # (failed, slow)
+        self._trial_in_flight = False
+        self._prober = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raise CircuitOpen unless a call may go to the backend now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+            raise CircuitOpen('The LLM backend is unavailable; failing fast until it recovers')
+
+    def cancel(self):
+        """Forget an admitted call that never reached the backend"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record(self, ok, seconds):
+        """Record the outcome and duration of a call that reached the backend"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if ok and seconds < self.slow_call_seconds:
+                    self.state = self.CLOSED
+                    self.opened_at = None
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                self._trial_in_flight = False
+                return
+            if self.state == self.OPEN:
+                return  # a call that started before the circuit opened
+
+            self._outcomes.append((not ok, seconds >= self.slow_call_seconds))
+            if len(self._outcomes) < self.min_calls:
+                return
+            failed = sum(1 for failure, _ in self._outcomes if failure)
+            slow = sum(1 for _, is_slow in self._outcomes if is_slow)
+            if (failed / len(self._outcomes) >= self.failure_rate
+                    or slow / len(self._outcomes) >= self.slow_rate):
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.trips += 1
+        self._outcomes.clear()
+        if self._prober is None:
+            self._prober = threading.Thread(target=self._probe_until_healthy, name='llm-circuit-probe', daemon=True)
+            self._prober.start()
+
+    def _probe_until_healthy(self):
+        while True:
+            time.sleep(self.probe_interval)
+            with self._lock:
+                if self.state != self.OPEN:
+                    self._prober = None
+                    return
+                self.probes += 1
+            try:
+                healthy = self.probe() if self.probe is not None else True
+            except Exception:
+                healthy = False
+            if healthy:
+                with self._lock:
+                    if self.state == self.OPEN:
+                        self.state = self.HALF_OPEN
+                        self._trial_in_flight = False
+                    self._prober = None
+                    return
+
+    def stats(self):
+        """Return the circuit state and trip counters"""
+        with self._lock:
+            return {
+                'state': self.state,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'probes': self.probes,
+                'openSeconds': round(time.time() - self.opened_at, 1) if self.opened_at else None,
+                'recentCalls': len(self._outcomes),
+                'recentFailures': sum(1 for failure, _ in self._outcomes if failure),
+                'recentSlowCalls': sum(1 for _, is_slow in self._outcomes if is_slow)
+            }
+
+
+class PriorityScheduler:
+    """Bound concurrent LLM calls and admit waiting callers by priority
+
+    At most ``max_in_flight`` callers hold a slot at once. Others wait in a
+    priority queue (FIFO within a priority). Once ``max_queue`` callers are
+    waiting, new arrivals are rejected with QueueFull instead of queueing.
+    """
+
+    def __init__(self, max_in_flight=2, max_queue=64):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._in_flight = 0
+        self._queue = []  # heap of [priority, sequence]
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _admit(self, waited):
+        self._in_flight += 1
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Block until a slot is free for this priority"""
+        started = time.monotonic()
+        with self._cond:
+            if self._in_flight < self.max_in_flight and not self._queue:
+                self._admit(0.0)
+                return
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"LLM queue is full ({self.max_queue} waiting)")
+
+            entry = [priority, next(self._sequence)]
+            heapq.heappush(self._queue, entry)
+            while not (self._queue[0] is entry and self._in_flight < self.max_in_flight):
+                remaining = None if timeout is None else timeout - (time.monotonic() - started)
+                if remaining is not None and remaining <= 0:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self.timeouts += 1
+                    self._cond.notify_all()
+                    raise QueueTimeout(f"Waited {timeout}s for an LLM slot")
+                self._cond.wait(remaining)
+            heapq.heappop(self._queue)
+            self._admit(time.monotonic() - started)
+            self._cond.notify_all()
+
+    def release(self):
+        """Give a slot back and wake the next waiter"""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Hold a slot for the duration of the block"""
+        self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        """Return in-flight, queue-depth and wait-time figures"""
+        with self._cond:
+            by_priority = {}
+            for priority, _ in self._queue:
+                by_priority[priority] = by_priority.get(priority, 0) + 1
+            return {
+                'inFlight': self._in_flight,
+                'maxInFlight': self.max_in_flight,
+                'queued': len(self._queue),
+                'queuedByPriority': by_priority,
+                'maxQueue': self.max_queue,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'avgWaitSeconds': round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+                'maxWaitSeconds': round(self.max_wait, 4)
+            }
+
+
+class LLMClient:
+    """Shared Ollama client with keep-alive pooling, a priority scheduler and a circuit breaker
+
+    ``backends`` is an Ollama URL or a BackendPool of several servers; each
+    admitted call goes to the backend the pool picks for its model and
+    ``affinity`` key. While no backend is available (a single server's
+    breaker is open, or every backend is ejected), generate() and stream()
+    raise CircuitOpen before queueing, so callers can serve their fallback
+    immediately.
+
+    ``observer(event, value)``, if given, is called with ``queue_wait``,
+    ``first_token`` and ``call`` durations in seconds and with the
+    ``prompt_chars`` of every admitted request. Prompt and completion token
+    counts reported by Ollama are totalled in stats().
+    """
+
+    def __init__(self, backends, max_in_flight=2, max_queue=64, queue_timeout=30,
+                 timeout=(5, 120), pool_size=16, breaker=None, observer=None):
+        # Imported here: backend_pool builds on CircuitBreaker above
+        from backend_pool import Backend, BackendPool
+
+        if isinstance(backends, BackendPool):
+            self.pool = backends
+        else:
+            self.pool = BackendPool([Backend(backends, breaker=breaker)], health_interval=0)
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.observer = observer or (lambda event, value: None)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._usage_lock = threading.Lock()
+        self.scheduler = PriorityScheduler(max_in_flight, max_queue)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _record_usage(self, message):
+        # Ollama's final message carries the evaluated token counts
+        with self._usage_lock:
+            self.prompt_tokens += message.get('prompt_eval_count') or 0
+            self.completion_tokens += message.get('eval_count') or 0
+
+    @contextmanager
+    def _call(self, priority, payload, affinity=None):
+        """Admit a call through the scheduler and pool and record its outcome
+
+        Yields ``(backend, record(ok))``. A call that raises is recorded as
+        failed; one that ends without recording (e.g. a stream closed before
+        its first token) is not counted.
+        """
+        model = payload.get('model')
+        self.pool.ensure_available(model)
+        queued = time.monotonic()
+        self.scheduler.acquire(priority, self.queue_timeout)
+        try:
+            backend = self.pool.acquire(model, affinity)
+        except CircuitOpen:
+            self.scheduler.release()
+            raise
+        started = time.monotonic()
+        self.observer('queue_wait', started - queued)
+        self.observer('prompt_chars', len(payload.get('prompt', '')))
+        recorded = []
+
+        def record(ok):
+            if not recorded:
+                recorded.append(ok)
+                self.pool.record(backend, ok, time.monotonic() - started)
+
+        try:
+            yield backend, record
+        except Exception:
+            record(False)
+            raise
+        finally:
+            self.scheduler.release()
+            self.pool.release(backend)
+            self.observer('call', time.monotonic() - started)
+            if not recorded:
+                self.pool.cancel(backend)
+
+    def generate(self, payload, priority=PRIORITY_INTERACTIVE, timeout=None, affinity=None):
+        """POST a non-streaming /api/generate call once a slot is free"""
+        with self._call(priority, payload, affinity) as (backend, record):
+            response = self.session.post(
+                f"{backend.url}/api/generate",
+                json=dict(payload, stream=False),
+                timeout=timeout or self.timeout
+            )
+            record(response.status_code < 500)
+            if response.status_code == 200:
+                try:
+                    self._record_usage(response.json())
+                except ValueError:
+                    pass
+            return response
+
+    def stream(self, payload, priority=PRIORITY_INTERACTIVE, timeout=None, affinity=None):
+        """Yield generated tokens, holding a slot until the stream ends or is closed
+
+        The breaker sees the time to the first token, not the whole answer.
+        """
+        with self._call(priority, payload, affinity) as (backend, record):
+            started = time.monotonic()
+            tokens = iter_ollama_tokens(
+                f"{backend.url}/api/generate",
+                payload,
+                timeout=timeout or self.timeout,
+                session=self.session
+            )
+            first_token_seen = False
+            try:
+                while True:
+                    try:
+                        token = next(tokens)
+                    except StopIteration as finished:
+                        record(True)
+                        self._record_usage(finished.value or {})
+                        return finished.value
+                    if not first_token_seen:
+                        first_token_seen = True
+                        self.observer('first_token', time.monotonic() - started)
+                    record(True)
+                    yield token
+            finally:
+                tokens.close()
+
+    def get(self, path, timeout=5):
+        """GET an Ollama endpoint of an available backend, outside the scheduler"""
+        return self.session.get(f"{self.pool.any_url()}{path}", timeout=timeout)
+
+    def stats(self):
+        """Return scheduler, circuit breaker, routing and token usage metrics"""
+        with self._usage_lock:
+            usage = {'promptTokens': self.prompt_tokens, 'completionTokens': self.completion_tokens}
+        return dict(self.scheduler.stats(), circuit=self.pool.circuit(), routing=self.pool.stats(), **usage)
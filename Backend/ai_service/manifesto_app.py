@@ -4,22 +4,159 @@ import requests
 import json
 import os
 import logging
+import threading
+import time
+from backend_pool import BackendPool
+from chat_session import (ChatSession, SessionCache, estimate_tokens, format_history,
+                          transcript_key, trim_history)
+from chat_turn import ChatReply, ChatTurn, GenerationFailed, answer_turn, reply_events, stream_turn
+from response_cache import ResponseCache, fingerprint
+from llm_client import (
+    CircuitBreaker, CircuitOpen, LLMClient, QueueFull, QueueTimeout, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+)
+from map_reduce import MapReduceEngine
+from metrics import ServiceMetrics
+from ollama_stream import stream_format, event_stream_response
+from retrieval import ManifestoRetriever, content_hash
+from sentences import extractive_answer
+from singleflight import SingleFlight, SingleFlightTimeout
 
 app = Flask(__name__)
 CORS(app)
 
+# Per-stage latency histograms, cache/queue gauges and token counters for /metrics
+metrics = ServiceMetrics('manifesto_app')
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Ollama configuration
-OLLAMA_URL = "http://localhost:11434"
+# Ollama configuration. OLLAMA_URL takes a comma-separated list of servers,
+# each optionally limited to some models: url=model|model
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
 MODEL_NAME = "llama3.2:3b"  # or your preferred model
 
-def call_ollama(prompt, context=""):
-    """Call Ollama API with context-aware prompting"""
-    try:
-        full_prompt = f"""Context: {context}
+# Generations go to the least busy healthy server (OLLAMA_ROUTING=latency weighs
+# servers by their recent speed), and follow-up turns of a conversation stay on
+# the server holding its context. Each server has its own circuit breaker and
+# a periodic health check; while no server is available, calls fail immediately
+# and chat answers with the retrieved excerpts instead of waiting.
+ollama_backends = BackendPool.from_spec(
+    OLLAMA_URL,
+    breaker=lambda: CircuitBreaker(
+        window=int(os.environ.get("LLM_BREAKER_WINDOW", 20)),
+        min_calls=int(os.environ.get("LLM_BREAKER_MIN_CALLS", 5)),
+        failure_rate=float(os.environ.get("LLM_BREAKER_FAILURE_RATE", 0.5)),
+        slow_call_seconds=float(os.environ.get("LLM_BREAKER_SLOW_SECONDS", 60)),
+        slow_rate=float(os.environ.get("LLM_BREAKER_SLOW_RATE", 0.8)),
+        probe_interval=float(os.environ.get("LLM_BREAKER_PROBE_SECONDS", 5))
+    ),
+    strategy=os.environ.get("OLLAMA_ROUTING", "least_outstanding"),
+    health_interval=float(os.environ.get("OLLAMA_HEALTH_SECONDS", 10))
+)
+
+# Shared Ollama client: pooled connections, bounded concurrency, voter chat first
+ollama_client = LLMClient(
+    ollama_backends,
+    max_in_flight=int(os.environ.get("OLLAMA_MAX_IN_FLIGHT", 2 * len(ollama_backends.backends))),
+    max_queue=int(os.environ.get("OLLAMA_MAX_QUEUE", 64)),
+    queue_timeout=float(os.environ.get("OLLAMA_QUEUE_TIMEOUT", 30)),
+    timeout=(5, float(os.environ.get("OLLAMA_TIMEOUT", 120))),
+    observer=metrics.observe_llm
+)
+
+# Retrieval configuration: only the top-k manifesto chunks go into the prompt
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", 4))
+RETRIEVAL_CHUNK_SIZE = int(os.environ.get("RETRIEVAL_CHUNK_SIZE", 200))
+RETRIEVAL_MAX_MANIFESTOS = int(os.environ.get("RETRIEVAL_MAX_MANIFESTOS", 64))
+
+retriever = ManifestoRetriever(
+    max_manifestos=RETRIEVAL_MAX_MANIFESTOS,
+    chunk_size=RETRIEVAL_CHUNK_SIZE,
+    overlap=RETRIEVAL_CHUNK_SIZE // 8
+)
+
+# Cache of generated chat answers (set RESPONSE_CACHE_DB to persist it)
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", 1024)),
+    ttl_seconds=int(os.environ.get("RESPONSE_CACHE_TTL", 3600)),
+    db_path=os.environ.get("RESPONSE_CACHE_DB") or None
+)
+party_content_hashes = {}  # party name -> hash of the last manifesto text seen
+
+# Identical concurrent chat generations share one Ollama call
+inflight_generations = SingleFlight()
+COALESCE_WAIT_SECONDS = float(os.environ.get("COALESCE_WAIT_SECONDS", 120))
+
+# Map-reduce for analysis and comparison; map outputs are cached by chunk hash
+map_cache = ResponseCache(
+    max_entries=int(os.environ.get("MAP_CACHE_SIZE", 8192)),
+    ttl_seconds=int(os.environ.get("MAP_CACHE_TTL", 7 * 24 * 3600)),
+    db_path=os.environ.get("MAP_CACHE_DB") or None
+)
+COMPARE_NOTES_BUDGET = int(os.environ.get("COMPARE_NOTES_BUDGET", 4000))
+
+# Conversation sessions: follow-up turns resume the Ollama KV context of the
+# previous turn instead of re-sending the whole prompt
+MODEL_CONTEXT_TOKENS = int(os.environ.get("MODEL_CONTEXT_TOKENS", 4096))
+RESPONSE_TOKEN_RESERVE = int(os.environ.get("RESPONSE_TOKEN_RESERVE", 1000))
+CHAT_HISTORY_MAX_MESSAGES = int(os.environ.get("CHAT_HISTORY_MAX_MESSAGES", 4))
+chat_sessions = SessionCache(
+    max_sessions=int(os.environ.get("CHAT_SESSIONS_MAX", 256)),
+    max_tokens=int(os.environ.get("CHAT_SESSIONS_MAX_TOKENS", 2_000_000)),
+    ttl_seconds=int(os.environ.get("CHAT_SESSIONS_TTL", 1800))
+)
+
+metrics.cache_gauges({
+    "responses": response_cache.stats,
+    "map": map_cache.stats,
+    "sessions": lambda: dict(chat_sessions.stats(), entries=chat_sessions.stats()["sessions"])
+})
+metrics.llm_gauges(ollama_client)
+metrics.gauge("inflight_generations", "Distinct chat answers being generated",
+              lambda: inflight_generations.stats()["inFlight"])
+metrics.gauge("retriever_manifestos", "Manifesto texts with a cached chunk index", lambda: len(retriever))
+metrics.gauge("session_context_tokens", "Ollama context tokens held by chat sessions",
+              lambda: chat_sessions.stats()["contextTokens"])
+
+# PROFILE_DIR enables cProfile dumps for requests sent with "X-Profile: 1",
+# plus a random PROFILE_SAMPLE_RATE share of all requests
+metrics.install(
+    app,
+    profile_dir=os.environ.get("PROFILE_DIR") or None,
+    profile_sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+)
+
+# Load balancer probes hit /health often; Ollama is asked at most this often
+HEALTH_CACHE_SECONDS = float(os.environ.get("HEALTH_CACHE_SECONDS", 10))
+health_state = {"ollama": None, "checkedAt": 0.0}
+health_lock = threading.Lock()
+
+class OllamaUnavailable(Exception):
+    """Raised when Ollama cannot produce a response; the message is user-facing"""
+
+def build_payload(prompt, context="", kv_context=None):
+    """Build the Ollama /api/generate payload with context-aware prompting
+
+    With ``kv_context`` (the ``context`` Ollama returned for an earlier turn)
+    the prompt is sent as-is: the formatting instructions are already part
+    of that context.
+    """
+    if kv_context is not None:
+        return {
+            "model": MODEL_NAME,
+            "prompt": prompt,
+            "context": kv_context,
+            "stream": False,
+            "options": {
+                "temperature": 0.3,
+                "top_p": 0.9,
+                "max_tokens": 1000,
+                "num_ctx": MODEL_CONTEXT_TOKENS
+            }
+        }
+
+    full_prompt = f"""Context: {context}
 
 Question: {prompt}
 
@@ -34,120 +171,394 @@ Please provide a detailed, accurate answer based only on the provided context. U
 
 Format your response in clean, readable markdown."""
 
-        payload = {
-            "model": MODEL_NAME,
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.3,
-                "top_p": 0.9,
-                "max_tokens": 1000
-            }
+    payload = {
+        "model": MODEL_NAME,
+        "prompt": full_prompt,
+        "stream": False,
+        "options": {
+            "temperature": 0.3,
+            "top_p": 0.9,
+            "max_tokens": 1000,
+            "num_ctx": MODEL_CONTEXT_TOKENS
         }
+    }
 
-        response = requests.post(
-            f"{OLLAMA_URL}/api/generate",
-            json=payload
-        )
+    return payload
 
-        if response.status_code == 200:
-            return response.json().get("response", "").strip()
-        else:
-            logger.error(f"Ollama API error: {response.status_code}")
-            return "I'm having trouble processing your request right now. Please try again."
+def number_excerpts(chunks, excerpt_ids):
+    """Give each chunk a citation number, reusing numbers already in ``excerpt_ids``
+
+    Returns ``(number, chunk, is_new)`` tuples; ``excerpt_ids`` is updated
+    with the numbers of new chunks.
+    """
+    numbered = []
+    for chunk in chunks:
+        chunk_id = fingerprint(chunk['text'])
+        is_new = chunk_id not in excerpt_ids
+        if is_new:
+            excerpt_ids[chunk_id] = len(excerpt_ids) + 1
+        numbered.append((excerpt_ids[chunk_id], chunk, is_new))
+    return numbered
+
+def build_chat_prompt(party_name, numbered, conversation_history, question):
+    """Build the first-turn chat prompt, trimming history to the model window"""
+    excerpts = "\n\n".join(f"[{number}] {chunk['text']}" for number, chunk, _ in numbered)
+
+    def render(history):
+        return f"""You are an AI assistant helping voters understand {party_name}'s political manifesto and policies.
+
+PARTY: {party_name}
 
-    except requests.exceptions.ConnectionError:
+RELEVANT MANIFESTO EXCERPTS:
+{excerpts}
+
+RECENT CONVERSATION:
+{history}
+
+CURRENT QUESTION: {question}
+
+INSTRUCTIONS:
+1. Answer based ONLY on the provided manifesto excerpts
+2. Be specific, quote relevant sections when possible and cite excerpts by their [number]
+3. If the question isn't covered in the manifesto, clearly state that
+4. Maintain a neutral, informative tone
+5. Focus on {party_name}'s policies and promises
+6. If asked about other parties, redirect to focus on {party_name}
+7. Provide factual information without bias
+
+Please answer the voter's question about {party_name}'s manifesto:"""
+
+    fixed_tokens = estimate_tokens(build_payload(render(""))["prompt"])
+    budget = MODEL_CONTEXT_TOKENS - RESPONSE_TOKEN_RESERVE - fixed_tokens
+    history = trim_history(conversation_history, max(budget, 0), CHAT_HISTORY_MAX_MESSAGES)
+    return render(format_history(history))
+
+def build_followup_prompt(numbered, question, pending=()):
+    """Build a follow-up turn that only carries excerpts the session has not seen
+
+    ``pending`` messages (turns answered from the cache) are replayed first
+    so the model's context catches up with the conversation.
+    """
+    parts = []
+    if pending:
+        parts.append("EARLIER IN THIS CONVERSATION:\n" + format_history(pending))
+    new_excerpts = [(number, chunk) for number, chunk, is_new in numbered if is_new]
+    if new_excerpts:
+        parts.append("ADDITIONAL MANIFESTO EXCERPTS:\n" + "\n\n".join(
+            f"[{number}] {chunk['text']}" for number, chunk in new_excerpts
+        ))
+    seen = [number for number, _, is_new in numbered if not is_new]
+    if seen:
+        parts.append("Earlier excerpts relevant to this question: " + ", ".join(f"[{number}]" for number in seen))
+    parts.append(f"FOLLOW-UP QUESTION: {question}")
+    parts.append("Answer using only the manifesto excerpts in this conversation, following the same instructions as before.")
+    return "\n\n".join(parts)
+
+def excerpt_answer(question, party_name, manifesto_hash, chunks, notice=None):
+    """Answer with the retrieved chunks' best sentences, without the model"""
+    with metrics.stage("extractive_answer"):
+        answer = extractive_answer(
+            question,
+            [dict(chunk, partyName=party_name) for chunk in chunks],
+            lambda chunk, terms, limit: retriever.top_sentences(manifesto_hash, chunk['chunkIndex'], terms, limit)
+        )
+    return f"{notice}\n\n{answer}" if notice else answer
+
+def unavailable_message(error):
+    """Map a failed Ollama call to the user-facing message, logging the cause"""
+    if isinstance(error, OllamaUnavailable):
+        return str(error)
+    if isinstance(error, GenerationFailed):
+        logger.error(f"Ollama API error: {error.status_code}")
+        return "I'm having trouble processing your request right now. Please try again."
+    if isinstance(error, CircuitOpen):
+        return "The AI service is temporarily unavailable. Please try again shortly."
+    if isinstance(error, (QueueFull, QueueTimeout)):
+        logger.warning(f"Ollama request not admitted: {str(error)}")
+        return "The AI service is busy right now. Please try again in a moment."
+    if isinstance(error, (requests.exceptions.ConnectionError, ConnectionError)):
         logger.error("Cannot connect to Ollama service")
         return "AI service is currently unavailable. Please make sure Ollama is running."
+    logger.error(f"Error calling Ollama: {str(error)}")
+    return "An error occurred while processing your request."
+
+def request_generation(payload, priority=PRIORITY_INTERACTIVE):
+    """POST a generate payload and return Ollama's JSON body, raising OllamaUnavailable on failure"""
+    try:
+        response = ollama_client.generate(payload, priority=priority)
+        if response.status_code != 200:
+            raise GenerationFailed(response.status_code)
+        return response.json()
     except Exception as e:
-        logger.error(f"Error calling Ollama: {str(e)}")
-        return "An error occurred while processing your request."
+        raise OllamaUnavailable(unavailable_message(e))
+
+def generate(prompt, context="", priority=PRIORITY_INTERACTIVE):
+    """Call Ollama API with context-aware prompting, raising OllamaUnavailable on failure"""
+    return request_generation(build_payload(prompt, context), priority).get("response", "").strip()
+
+map_reduce = MapReduceEngine(
+    lambda prompt: generate(prompt, priority=PRIORITY_BATCH),
+    map_cache,
+    MODEL_NAME,
+    workers=int(os.environ.get("MAP_WORKERS", 4)),
+    chunk_size=int(os.environ.get("MAP_CHUNK_SIZE", 600)),
+    notes_budget=int(os.environ.get("MAP_NOTES_BUDGET", 2500))
+)
+
+def call_ollama(prompt, context="", priority=PRIORITY_INTERACTIVE):
+    """Call Ollama API, returning a user-facing message instead of raising"""
+    try:
+        return generate(prompt, context, priority)
+    except OllamaUnavailable as e:
+        return str(e)
+
+def chunk_dependency(party_name, text):
+    """Dependency id recorded on cached answers built from a chunk"""
+    return fingerprint(party_name, text)
+
+def invalidate_changed_chunks(party_name, previous_hash, content):
+    """Drop cached answers that quoted chunks missing from the new manifesto text
+
+    Map-reduce notes need no invalidation: they are keyed by chunk text.
+    """
+    old_chunks = retriever.cached_chunks(previous_hash)
+    if old_chunks is None:
+        # The old chunks were evicted, so there is no way to tell what changed
+        response_cache.invalidate_party(party_name)
+        return
+    new_texts = {chunk['text'] for chunk in retriever.chunks(content)}
+    response_cache.invalidate_dependencies(
+        chunk_dependency(party_name, chunk['text'])
+        for chunk in old_chunks if chunk['text'] not in new_texts
+    )
+
+def conversation_key(party_name, manifesto_hash, conversation_history, question):
+    """Stable key of a conversation, from its party, manifesto and opening question
+
+    The backend pool keeps every turn with the same key on one Ollama
+    server, the one holding the conversation's KV cache.
+    """
+    opening = next((message.get("content", "") for message in conversation_history
+                    if message.get("role") == "user"), question)
+    return fingerprint(party_name, manifesto_hash, opening)
+
+def ollama_status():
+    """'connected' or 'disconnected', re-checked against Ollama at most every HEALTH_CACHE_SECONDS"""
+    if not ollama_client.pool.available():
+        return "disconnected"  # the breakers and health checks are already probing in the background
+    with health_lock:
+        if time.monotonic() - health_state["checkedAt"] >= HEALTH_CACHE_SECONDS:
+            try:
+                response = ollama_client.get("/api/tags", timeout=2)
+                health_state["ollama"] = "connected" if response.status_code == 200 else "disconnected"
+            except Exception:
+                health_state["ollama"] = "disconnected"
+            health_state["checkedAt"] = time.monotonic()
+        return health_state["ollama"]
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    try:
-        # Test Ollama connection
-        response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=5)
-        ollama_status = "connected" if response.status_code == 200 else "disconnected"
-    except:
-        ollama_status = "disconnected"
-
     return jsonify({
         "status": "healthy",
-        "ollama": ollama_status,
+        "ollama": ollama_status(),
         "model": MODEL_NAME
     })
 
-@app.route('/chat/manifesto', methods=['POST'])
-def chat_with_manifesto():
-    """Chat with party manifesto using AI"""
-    try:
-        data = request.get_json()
-
-        if not data:
-            return jsonify({"error": "No JSON data provided"}), 400
-
-        question = data.get('question', '').strip()
-        manifesto_content = data.get('manifesto_content', '')
-        party_name = data.get('party_name', 'the party')
-        conversation_history = data.get('conversation_history', [])
+@app.route('/llm/stats', methods=['GET'])
+def llm_stats():
+    """Ollama queue depth, concurrency and wait-time statistics"""
+    return jsonify(ollama_client.stats())
 
-        if not question:
-            return jsonify({"error": "Question is required"}), 400
-
-        if not manifesto_content:
-            return jsonify({
-                "response": f"I don't have access to {party_name}'s manifesto content. Please ask the party to upload their manifesto first.",
-                "sources": []
-            })
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Response cache size and hit-rate statistics"""
+    return jsonify({
+        "responses": response_cache.stats(),
+        "mapReduce": dict(map_reduce.stats(), cache=map_cache.stats()),
+        "inflight": inflight_generations.stats(),
+        "sessions": chat_sessions.stats(),
+        "retrievalIndexes": len(retriever)
+    })
 
-        logger.info(f"Processing question for {party_name}: {question[:50]}...")
+def plan_manifesto_chat(data, mode=None):
+    """Retrieve excerpts and build the Ollama payload for a /chat/manifesto request
 
-        # Build conversation context
-        context_history = ""
-        if conversation_history:
-            recent_history = conversation_history[-4:]  # Last 4 exchanges
-            context_history = "\n".join([
-                f"{'Human' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}"
-                for msg in recent_history
-            ])
+    Returns a ChatReply when the answer is known without the model
+    (validation errors, no manifesto, extractive mode, a cached answer) and
+    a ChatTurn otherwise.
+    """
+    if not data:
+        return ChatReply({"error": "No JSON data provided"}, 400)
 
-        # Create enhanced prompt with manifesto context
-        enhanced_prompt = f"""You are an AI assistant helping voters understand {party_name}'s political manifesto and policies.
+    question = data.get('question', '').strip()
+    manifesto_content = data.get('manifesto_content', '')
+    party_name = data.get('party_name', 'the party')
+    conversation_history = data.get('conversation_history', [])
 
-PARTY: {party_name}
+    if not question:
+        return ChatReply({"error": "Question is required"}, 400)
 
-MANIFESTO CONTENT:
-{manifesto_content}
+    if not manifesto_content:
+        return ChatReply({
+            "response": f"I don't have access to {party_name}'s manifesto content. Please ask the party to upload their manifesto first.",
+            "sources": []
+        })
 
-RECENT CONVERSATION:
-{context_history}
+    logger.info(f"Processing question for {party_name}: {question[:50]}...")
+
+    # A new manifesto text for this party makes answers that quoted
+    # changed chunks stale
+    manifesto_hash = content_hash(manifesto_content)
+    previous_hash = party_content_hashes.get(party_name)
+    if previous_hash != manifesto_hash:
+        if previous_hash is not None:
+            invalidate_changed_chunks(party_name, previous_hash, manifesto_content)
+        party_content_hashes[party_name] = manifesto_hash
+
+    # Retrieve only the manifesto chunks relevant to this question
+    with metrics.stage("retrieval"):
+        relevant_chunks = retriever.retrieve(manifesto_content, question, RETRIEVAL_TOP_K)
+    dependencies = [chunk_dependency(party_name, chunk['text']) for chunk in relevant_chunks]
+
+    # Extractive mode: answer at once with the best manifesto sentences, no model call
+    if mode == 'extractive':
+        return ChatReply({
+            "response": excerpt_answer(question, party_name, manifesto_hash, relevant_chunks),
+            "sources": [
+                {"id": number, "chunkIndex": chunk['chunkIndex'], "score": round(chunk['score'], 4),
+                 "excerpt": chunk['text'][:200]}
+                for number, chunk in enumerate(relevant_chunks, start=1)
+            ],
+            "party_name": party_name,
+            "model": None,
+            "mode": "extractive",
+            "timestamp": "2024-11-01T00:00:00Z"
+        }, streamable=True)
+
+    # Resume the conversation's Ollama context when the previous turn left
+    # one and the follow-up still fits the model window; otherwise start
+    # a new session with the full prompt and budget-trimmed history
+    with metrics.stage("prompt_build"):
+        session = chat_sessions.take(transcript_key(party_name, manifesto_hash, conversation_history))
+        payload = None
+        if session is not None:
+            excerpt_ids = dict(session.excerpt_ids)
+            numbered = number_excerpts(relevant_chunks, excerpt_ids)
+            prompt = build_followup_prompt(numbered, question, session.pending)
+            if session.tokens + estimate_tokens(prompt) + RESPONSE_TOKEN_RESERVE <= MODEL_CONTEXT_TOKENS:
+                payload = build_payload(prompt, kv_context=session.context.tolist())
+        resumed = payload is not None
+        if not resumed:
+            excerpt_ids = {}
+            numbered = number_excerpts(relevant_chunks, excerpt_ids)
+            payload = build_payload(build_chat_prompt(party_name, numbered, conversation_history, question))
+    turns = session.turns + 1 if resumed else 1
+
+    excerpts = "\n\n".join(f"[{number}] {chunk['text']}" for number, chunk, _ in numbered)
+    sources = [
+        {
+            "id": number,
+            "chunkIndex": chunk['chunkIndex'],
+            "score": round(chunk['score'], 4),
+            "excerpt": chunk['text'][:200]
+        }
+        for number, chunk, _ in numbered
+    ]
+    extra = {
+        "sources": sources,
+        "party_name": party_name,
+        "model": MODEL_NAME,
+        "cached": False,
+        "sessionResumed": resumed,
+        "timestamp": "2024-11-01T00:00:00Z"
+    }
+
+    # Reuse a cached answer for the same question and context
+    recent_history = format_history(conversation_history[-CHAT_HISTORY_MAX_MESSAGES:])
+    cache_key = response_cache.make_key(
+        MODEL_NAME, party_name, question, fingerprint(excerpts, recent_history)
+    )
+    ai_response = response_cache.get(cache_key)
+    if ai_response is not None:
+        if session is not None:
+            # The taken session is still good for the next turn, which sends
+            # this exchange in its history; re-key it and let the next
+            # generated turn replay the exchange the model did not see
+            exchange = [
+                {"role": "user", "content": question},
+                {"role": "assistant", "content": ai_response}
+            ]
+            chat_sessions.put(
+                transcript_key(party_name, manifesto_hash, conversation_history + exchange),
+                ChatSession(session.context, session.excerpt_ids, session.turns, session.pending + exchange)
+            )
+        return ChatReply(dict(extra, response=ai_response, cached=True, sessionResumed=False, degraded=False),
+                         streamable=True)
+
+    def complete(text, final):
+        answer = text.strip()
+        response_cache.put(cache_key, answer, party=party_name, depends_on=dependencies)
+        # Key the session by the transcript the next turn will send
+        context = (final or {}).get("context")
+        if context:
+            transcript = conversation_history + [
+                {"role": "user", "content": question},
+                {"role": "assistant", "content": answer}
+            ]
+            chat_sessions.put(
+                transcript_key(party_name, manifesto_hash, transcript),
+                ChatSession(context, excerpt_ids, turns)
+            )
+        logger.info(f"Generated response for {party_name} (length: {len(answer)})")
+        return answer
+
+    def failure(error):
+        if isinstance(error, SingleFlightTimeout):
+            logger.warning(f"Gave up waiting for a shared answer for {party_name}")
+            return {
+                "response": "This question is still being answered for other voters. Please try again in a moment.",
+                "degraded": False
+            }
+        # Not cached: the next question after recovery gets a real answer
+        return {
+            "response": excerpt_answer(question, party_name, manifesto_hash, relevant_chunks,
+                                       unavailable_message(error)),
+            "degraded": True
+        }
 
-CURRENT QUESTION: {question}
+    return ChatTurn(
+        payload,
+        cache_key,
+        extra,
+        complete,
+        failure,
+        fallback=lambda: excerpt_answer(
+            question, party_name, manifesto_hash, relevant_chunks,
+            "The AI service is temporarily unavailable."
+        ),
+        affinity=conversation_key(party_name, manifesto_hash, conversation_history, question)
+    )
 
-INSTRUCTIONS:
-1. Answer based ONLY on the provided manifesto content
-2. Be specific and quote relevant sections when possible
-3. If the question isn't covered in the manifesto, clearly state that
-4. Maintain a neutral, informative tone
-5. Focus on {party_name}'s policies and promises
-6. If asked about other parties, redirect to focus on {party_name}
-7. Provide factual information without bias
+@app.route('/chat/manifesto', methods=['POST'])
+def chat_with_manifesto():
+    """Chat with party manifesto using AI"""
+    try:
+        data = request.get_json()
+        fmt = stream_format(request, data or {})
+        turn = plan_manifesto_chat(data, (data or {}).get('mode') or request.args.get('mode'))
 
-Please answer the voter's question about {party_name}'s manifesto:"""
+        if isinstance(turn, ChatReply):
+            if fmt and turn.streamable:
+                return event_stream_response(reply_events(turn, fmt), fmt)
+            return jsonify(turn.body), turn.status
 
-        # Get AI response
-        ai_response = call_ollama(enhanced_prompt)
+        # Streaming mode: relay tokens to the client as they are generated
+        if fmt:
+            return event_stream_response(stream_turn(turn, ollama_client, fmt), fmt)
 
-        logger.info(f"Generated response for {party_name} (length: {len(ai_response)})")
-
-        return jsonify({
-            "response": ai_response,
-            "party_name": party_name,
-            "model": MODEL_NAME,
-            "timestamp": "2024-11-01T00:00:00Z"
-        })
+        # Concurrent identical questions wait for one shared generation
+        return jsonify(answer_turn(turn, ollama_client, inflight_generations, COALESCE_WAIT_SECONDS))
 
     except Exception as e:
         logger.error(f"Error in manifesto chat: {str(e)}")
@@ -167,6 +578,18 @@ def analyze_manifesto():
         if not manifesto_text:
             return jsonify({"error": "Manifesto text is required"}), 400
 
+        # Map: extract notes chunk by chunk (cached); reduce: one small analysis prompt
+        try:
+            with metrics.stage("map_notes"):
+                notes, map_stats = map_reduce.map_notes(manifesto_text)
+        except OllamaUnavailable as e:
+            return jsonify({
+                "analysis": str(e),
+                "party_name": party_name,
+                "text_length": len(manifesto_text),
+                "processed_at": "2024-11-01T00:00:00Z"
+            })
+
         analysis_prompt = f"""Analyze the following political manifesto for {party_name} and extract:
 
 1. Key policy areas and promises
@@ -177,17 +600,18 @@ def analyze_manifesto():
 6. Environmental policies
 7. Main slogans or themes
 
-MANIFESTO TEXT:
-{manifesto_text}
+MANIFESTO NOTES (extracted section by section):
+{chr(10).join(notes)}
 
 Please provide a structured analysis in JSON format with clear categories and key points."""
 
-        analysis = call_ollama(analysis_prompt)
+        analysis = call_ollama(analysis_prompt, priority=PRIORITY_BATCH)
 
         return jsonify({
             "analysis": analysis,
             "party_name": party_name,
             "text_length": len(manifesto_text),
+            "map_reduce": map_stats,
             "processed_at": "2024-11-01T00:00:00Z"
         })
 
@@ -206,10 +630,21 @@ def compare_manifestos():
         if len(party_manifestos) < 2:
             return jsonify({"error": "At least 2 party manifestos required for comparison"}), 400
 
-        # Build comparison prompt
+        # Map each manifesto to cached notes, sharing the budget between parties
+        party_budget = max(500, COMPARE_NOTES_BUDGET // len(party_manifestos))
         manifesto_sections = []
-        for party, content in party_manifestos.items():
-            manifesto_sections.append(f"=== {party} MANIFESTO ===\n{content}\n")
+        map_stats = {}
+        try:
+            for party, content in party_manifestos.items():
+                notes, map_stats[party] = map_reduce.map_notes(content, budget=party_budget)
+                manifesto_sections.append(f"=== {party} MANIFESTO NOTES ===\n{chr(10).join(notes)}\n")
+        except OllamaUnavailable as e:
+            return jsonify({
+                "comparison": str(e),
+                "topic": comparison_topic,
+                "parties_compared": list(party_manifestos.keys()),
+                "compared_at": "2024-11-01T00:00:00Z"
+            })
 
         comparison_prompt = f"""Compare the following political party manifestos on the topic of "{comparison_topic}":
 
@@ -223,12 +658,13 @@ Please provide a detailed comparison highlighting:
 
 Be neutral and factual in your comparison."""
 
-        comparison = call_ollama(comparison_prompt)
+        comparison = call_ollama(comparison_prompt, priority=PRIORITY_BATCH)
 
         return jsonify({
             "comparison": comparison,
             "topic": comparison_topic,
             "parties_compared": list(party_manifestos.keys()),
+            "map_reduce": map_stats,
             "compared_at": "2024-11-01T00:00:00Z"
         })
 
@@ -239,5 +675,5 @@ Be neutral and factual in your comparison."""
 if __name__ == '__main__':
     print("🤖 Starting Manifesto AI Service...")
     print(f"📋 Using model: {MODEL_NAME}")
-    print(f"🔗 Ollama URL: {OLLAMA_URL}")
+    print(f"🔗 Ollama backends: {', '.join(ollama_backends.urls)} ({ollama_backends.strategy})")
     app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
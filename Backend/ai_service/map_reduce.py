@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from chunker import iter_chunks
+from response_cache import fingerprint
+
+MAP_PROMPT = """Extract the concrete policy positions and promises from this manifesto excerpt.
+List them as short bullet points under these headings, skipping headings the excerpt does not cover:
+Economy, Social, Infrastructure, Education, Healthcare, Environment, Themes and Slogans.
+Only use information that appears in the excerpt.
+
+EXCERPT:
+{text}"""
+
+CONDENSE_PROMPT = """Merge these bullet-point notes from one manifesto into a single shorter list.
+Keep the same headings, remove duplicates and keep every distinct promise.
+
+NOTES:
+{text}"""
+
+
+class MapReduceEngine:
+    """Map-reduce pipeline for running LLM analyses over large manifestos
+
+    Each manifesto is split into chunks. A topic-independent extraction
+    prompt runs on each chunk across a bounded thread pool (the map step).
+    Map outputs are cached by the hash of the chunk text, so re-analysing an
+    edited manifesto or comparing on a new topic only pays for new chunks.
+    Callers build the small reduce prompt from the returned notes.
+    """
+
+    def __init__(self, generate, cache, model, workers=4, chunk_size=600, notes_budget=2500):
+        self.generate = generate
+        self.cache = cache
+        self.model = model
+        self.chunk_size = chunk_size
+        self.notes_budget = notes_budget
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='map-reduce')
+        self._lock = threading.Lock()
+        self.map_calls = 0
+        self.map_hits = 0
+
+    def _cached_generate(self, template_id, prompt_template, text):
+        key = fingerprint(template_id, self.model, text)
+        notes = self.cache.get(key)
+        if notes is not None:
+            with self._lock:
+                self.map_hits += 1
+            return notes, True
+        notes = self.generate(prompt_template.format(text=text))
+        self.cache.put(key, notes)
+        with self._lock:
+            self.map_calls += 1
+        return notes, False
+
+    def _run_all(self, template_id, prompt_template, texts):
+        futures = [
+            self._executor.submit(self._cached_generate, template_id, prompt_template, text)
+            for text in texts
+        ]
+        try:
+            results = [future.result() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+        return [notes for notes, _ in results], sum(1 for _, hit in results if hit)
+
+    def map_notes(self, text, budget=None):
+        """Return ``(notes, stats)`` for one manifesto, notes fitting the word budget"""
+        budget = budget or self.notes_budget
+        chunks = [chunk['text'] for chunk in iter_chunks([text], chunk_size=self.chunk_size)]
+        notes, hits = self._run_all('map-v1', MAP_PROMPT, chunks)
+        rounds = 0
+        # Condense in groups until the notes fit in one reduce prompt
+        while len(notes) > 1 and sum(len(note.split()) for note in notes) > budget:
+            groups, group, group_words = [], [], 0
+            for note in notes:
+                words = len(note.split())
+                if group and group_words + words > budget:
+                    groups.append("\n\n".join(group))
+                    group, group_words = [], 0
+                group.append(note)
+                group_words += words
+            groups.append("\n\n".join(group))
+            if len(groups) == len(notes):
+                break  # each note alone exceeds the budget; nothing left to merge
+            notes, _ = self._run_all('condense-v1', CONDENSE_PROMPT, groups)
+            rounds += 1
+        return notes, {'chunks': len(chunks), 'cachedChunks': hits, 'condenseRounds': rounds}
+
+    def stats(self):
+        """Return map-call and map-cache counters"""
+        with self._lock:
+            return {'mapCalls': self.map_calls, 'mapCacheHits': self.map_hits}
@@ -0,0 +1,298 @@
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+# Latency buckets in seconds, from a cache hit to a slow model answer
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Prompt sizes in characters, about 4 characters per token
+PROMPT_BUCKETS = (500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[position] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the with-block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        samples = []
+        for key, series in snapshot.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key + (('le', _format_value(float(bound))),), cumulative))
+            samples.append((f"{self.name}_count", key, cumulative))
+            samples.append((f"{self.name}_sum", key, series[-1]))
+        return samples
+
+
+class CallbackMetric:
+    """Gauge or counter read from a callback at scrape time
+
+    The callback returns a number, or a list of ``(labels dict, value)``
+    pairs. Existing ``stats()`` methods feed these, so nothing is
+    double-counted and the values cost nothing between scrapes.
+    """
+
+    def __init__(self, name, help_text, callback, kind='gauge'):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.kind = kind
+
+    def samples(self):
+        value = self.callback()
+        if isinstance(value, list):
+            return [(self.name, tuple(sorted(labels.items())), number) for labels, number in value
+                    if number is not None]
+        return [] if value is None else [(self.name, (), value)]
+
+
+class Registry:
+    """Named metrics for one service, rendered in the Prometheus text format
+
+    Every metric name gets ``prefix`` and every sample the ``service`` label,
+    so both apps can be scraped into the same dashboards.
+    """
+
+    def __init__(self, service, prefix='manifesto_ai_'):
+        self.service = service
+        self.prefix = prefix
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self._register(Counter(self.prefix + name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self.prefix + name, help_text, buckets))
+
+    def gauge(self, name, help_text, callback):
+        return self._register(CallbackMetric(self.prefix + name, help_text, callback))
+
+    def counter_callback(self, name, help_text, callback):
+        return self._register(CallbackMetric(self.prefix + name, help_text, callback, kind='counter'))
+
+    def render(self):
+        lines = []
+        service = (('service', self.service),)
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception:
+                continue  # one broken stats() must not take down the scrape
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(service + labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class ServiceMetrics:
+    """The metrics both manifesto services export
+
+    ``stage`` times a pipeline stage (PDF parsing, chunking, scoring, prompt
+    building, waiting on Ollama ...) into one histogram labelled by stage.
+    ``observe_llm`` is passed to LLMClient as its observer.
+    """
+
+    def __init__(self, service):
+        self.registry = Registry(service)
+        self.stage_seconds = self.registry.histogram(
+            'stage_seconds', 'Seconds spent per pipeline stage')
+        self.request_seconds = self.registry.histogram(
+            'http_request_seconds', 'Seconds from request start to response headers')
+        self.prompt_chars = self.registry.histogram(
+            'llm_prompt_chars', 'Characters per prompt sent to Ollama', PROMPT_BUCKETS)
+        self.profiles = self.registry.counter(
+            'profiles_total', 'Requests profiled with cProfile')
+        self._llm_clients = []
+
+    def stage(self, name):
+        return self.stage_seconds.time(stage=name)
+
+    def observe_stage(self, name, seconds):
+        self.stage_seconds.observe(seconds, stage=name)
+
+    def observe_llm(self, event, value):
+        if event == 'prompt_chars':
+            self.prompt_chars.observe(value)
+        else:
+            self.stage_seconds.observe(value, stage=f"llm_{event}")
+
+    def gauge(self, name, help_text, callback):
+        return self.registry.gauge(name, help_text, callback)
+
+    def counter_callback(self, name, help_text, callback):
+        return self.registry.counter_callback(name, help_text, callback)
+
+    def cache_gauges(self, caches):
+        """Export entries, hits and misses of ``{name: stats callable}``"""
+        def read(field):
+            def callback():
+                return [({'cache': name}, stats().get(field)) for name, stats in caches.items()]
+            return callback
+        self.gauge('cache_entries', 'Entries held per cache', read('entries'))
+        self.counter_callback('cache_hits_total', 'Cache hits per cache', read('hits'))
+        self.counter_callback('cache_misses_total', 'Cache misses per cache', read('misses'))
+
+    def llm_gauges(self, client):
+        """Export an LLMClient's queue, circuit and token figures
+
+        Further clients (the asyncio server's AsyncLLMClient) are added to
+        the same series, which then report the sum over all clients.
+        """
+        self._llm_clients.append(client)
+        if len(self._llm_clients) > 1:
+            return
+
+        def total(field):
+            return lambda: sum(client.stats()[field] for client in self._llm_clients)
+
+        self.gauge('llm_in_flight', 'Ollama requests being generated', total('inFlight'))
+        self.gauge('llm_queued', 'Requests waiting for an Ollama slot', total('queued'))
+        self.gauge('llm_circuit_open', '1 while the Ollama circuit breaker is open or half-open',
+                   lambda: int(any(client.stats()['circuit']['state'] != 'closed' for client in self._llm_clients)))
+        self.counter_callback('llm_rejected_total', 'Requests rejected by a full queue', total('rejected'))
+        self.counter_callback('llm_prompt_tokens_total', 'Prompt tokens evaluated by Ollama', total('promptTokens'))
+        self.counter_callback('llm_completion_tokens_total', 'Tokens generated by Ollama', total('completionTokens'))
+
+        # Clients of one process share a backend pool: report each backend once
+        def backends(field, convert=lambda value: value):
+            def callback():
+                return [({'backend': backend['url']}, convert(backend[field]))
+                        for backend in client.pool.stats()['backends']]
+            return callback
+
+        self.gauge('llm_backend_outstanding', 'Ollama calls in progress per backend', backends('outstanding'))
+        self.gauge('llm_backend_available', '1 while a backend passes its health check and its breaker is not open',
+                   lambda: [({'backend': backend.url}, int(backend.available())) for backend in client.pool.backends])
+        self.gauge('llm_backend_latency_seconds', 'Smoothed call latency per backend',
+                   backends('latencyMs', lambda value: None if value is None else value / 1000))
+        self.counter_callback('llm_backend_calls_total', 'Ollama calls per backend', backends('calls'))
+
+    def install(self, app, profile_dir=None, profile_sample_rate=0.0):
+        """Add request timing, the /metrics route and the optional profiling hook to app
+
+        With ``profile_dir`` set, a request carrying ``X-Profile: 1`` (or a
+        random ``profile_sample_rate`` share of requests) runs under
+        cProfile and the stats are dumped to a .prof file whose name is
+        returned in the ``X-Profile-File`` header. Streamed bodies are only
+        profiled up to the response headers.
+        """
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+        @app.before_request
+        def start_request_timer():
+            g.metrics_started = time.perf_counter()
+            if profile_dir and (request.headers.get('X-Profile') == '1'
+                                or (profile_sample_rate and random.random() < profile_sample_rate)):
+                g.profiler = cProfile.Profile()
+                g.profiler.enable()
+
+        @app.after_request
+        def record_request(response):
+            profiler = g.pop('profiler', None)
+            if profiler is not None:
+                profiler.disable()
+                endpoint = re.sub(r'[^A-Za-z0-9_.-]+', '_', request.endpoint or 'unknown')
+                path = os.path.join(profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{os.getpid()}-"
+                                                 f"{random.randrange(1 << 30):x}.prof")
+                profiler.dump_stats(path)
+                self.profiles.inc(endpoint=endpoint)
+                response.headers['X-Profile-File'] = path
+            started = g.pop('metrics_started', None)
+            if started is not None and request.endpoint != 'metrics':
+                self.request_seconds.observe(
+                    time.perf_counter() - started,
+                    endpoint=request.endpoint or 'unknown',
+                    status=response.status_code
+                )
+            return response
+
+        def metrics():
+            return Response(self.registry.render(), mimetype=PROMETHEUS_MIMETYPE)
+
+        app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
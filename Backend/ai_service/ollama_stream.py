@@ -0,0 +1,153 @@
+import asyncio
+import json
+import time
+
+import requests
+from flask import Response, stream_with_context
+
+SSE_MIMETYPE = 'text/event-stream'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def stream_format(request, data):
+    """Pick 'sse' or 'ndjson' if the client asked for a streamed answer, else None"""
+    accept = request.headers.get('Accept', '')
+    if NDJSON_MIMETYPE in accept:
+        return 'ndjson'
+    if SSE_MIMETYPE in accept:
+        return 'sse'
+    stream = data.get('stream')
+    if stream in ('ndjson', 'sse'):
+        return stream
+    return 'sse' if stream is True or stream in ('true', '1') else None
+
+
+def event_stream_response(events, fmt):
+    """Wrap relayed events in a streaming Flask response"""
+    return Response(
+        stream_with_context(events),
+        mimetype=SSE_MIMETYPE if fmt == 'sse' else NDJSON_MIMETYPE,
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def format_event(event, payload, fmt):
+    """Encode one event as an SSE message or an NDJSON line"""
+    if fmt == 'sse':
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    return json.dumps(dict(payload, type=event)) + "\n"
+
+
+def iter_ollama_tokens(url, payload, timeout=None, session=None):
+    """Yield response tokens from a streaming Ollama /api/generate call
+
+    The final message's stats are returned as the generator's value. Closing
+    the generator closes the HTTP connection, which makes Ollama abandon the
+    generation.
+    """
+    http = session or requests
+    response = http.post(url, json=dict(payload, stream=True), stream=True, timeout=timeout)
+    try:
+        if response.status_code != 200:
+            raise RuntimeError(f"Ollama API error: {response.status_code}")
+        for line in response.iter_lines():
+            if not line:
+                continue
+            message = json.loads(line)
+            if message.get('error'):
+                raise RuntimeError(message['error'])
+            if message.get('response'):
+                yield message['response']
+            if message.get('done'):
+                return message
+    finally:
+        response.close()
+
+
+def relay_tokens(tokens, fmt, extra=None, on_complete=None, fallback=None):
+    """Relay a token iterator to the client as SSE or NDJSON events
+
+    Emits ``token`` events as they arrive and a closing ``done`` event with
+    the full response, time-to-first-token and total time. ``on_complete``
+    receives the full text of a successful stream. If the upstream fails
+    before any token was sent and ``fallback`` is given, its text is sent as
+    the answer instead of an ``error`` event. When the client disconnects the
+    token iterator is closed so the upstream generation is cancelled.
+    """
+    started = time.perf_counter()
+    first_token_at = None
+    parts = []
+    try:
+        try:
+            for token in tokens:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(token)
+                yield format_event('token', {'token': token}, fmt)
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            if fallback is None or parts:
+                yield format_event('error', {'error': str(e)}, fmt)
+                return
+            fallback_text = fallback()
+            yield format_event('token', {'token': fallback_text}, fmt)
+            yield format_event('done', dict(extra or {}, response=fallback_text, fallback=True), fmt)
+            return
+
+        text = ''.join(parts)
+        if on_complete is not None:
+            on_complete(text)
+        finished = time.perf_counter()
+        yield format_event('done', dict(
+            extra or {},
+            response=text,
+            ttftMs=round((first_token_at - started) * 1000, 1) if first_token_at else None,
+            totalMs=round((finished - started) * 1000, 1)
+        ), fmt)
+    finally:
+        close = getattr(tokens, 'close', None)
+        if close is not None:
+            close()
+
+
+async def relay_tokens_async(tokens, fmt, extra=None, on_complete=None, fallback=None, executor=None):
+    """relay_tokens for an async token iterator, as used by the asyncio server
+
+    Same events, fallback and cancellation behaviour: closing this generator
+    closes ``tokens`` and with it the upstream connection. ``on_complete``
+    runs on ``executor`` since it may block (cache writes).
+    """
+    started = time.perf_counter()
+    first_token_at = None
+    parts = []
+    try:
+        try:
+            async for token in tokens:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(token)
+                yield format_event('token', {'token': token}, fmt)
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            if fallback is None or parts:
+                yield format_event('error', {'error': str(e)}, fmt)
+                return
+            fallback_text = fallback()
+            yield format_event('token', {'token': fallback_text}, fmt)
+            yield format_event('done', dict(extra or {}, response=fallback_text, fallback=True), fmt)
+            return
+
+        text = ''.join(parts)
+        if on_complete is not None:
+            await asyncio.get_running_loop().run_in_executor(executor, on_complete, text)
+        finished = time.perf_counter()
+        yield format_event('done', dict(
+            extra or {},
+            response=text,
+            ttftMs=round((first_token_at - started) * 1000, 1) if first_token_at else None,
+            totalMs=round((finished - started) * 1000, 1)
+        ), fmt)
+    finally:
+        await tokens.aclose()
@@ -0,0 +1,181 @@
+import hashlib
+import heapq
+import math
+import mmap
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import PyPDF2
+
+# Uploads are copied to disk in blocks of this size
+SPOOL_BLOCK_SIZE = 1024 * 1024
+
+SpooledUpload = namedtuple('SpooledUpload', ['path', 'sha256', 'size'])
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+@contextmanager
+def spooled_pdf(file_storage):
+    """Spool an uploaded PDF to a temp file and yield a SpooledUpload
+
+    The upload is copied block by block, so it is never held in memory as a
+    single bytes object, and its SHA-256 is computed on the way through.
+    The temp file is removed when the context exits.
+    """
+    handle = tempfile.NamedTemporaryFile(prefix='manifesto-', suffix='.pdf', delete=False)
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with handle:
+            while True:
+                block = file_storage.stream.read(SPOOL_BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                handle.write(block)
+                size += len(block)
+        if size == 0:
+            raise ValueError('Uploaded file is empty')
+        yield SpooledUpload(handle.name, digest.hexdigest(), size)
+    finally:
+        os.unlink(handle.name)
+
+
+@contextmanager
+def mapped_reader(path):
+    """Open a PdfReader over a read-only mmap of the file at path"""
+    with open(path, 'rb') as pdf_file:
+        with mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield PyPDF2.PdfReader(mapped)
+
+
+def page_fingerprints(path):
+    """Return a SHA-256 per page of its content stream and font names
+
+    Hashing the raw page content is much cheaper than extracting its text,
+    so it is used to spot which pages of a re-uploaded PDF actually changed.
+    """
+    fingerprints = []
+    with mapped_reader(path) as reader:
+        for page in reader.pages:
+            digest = hashlib.sha256()
+            contents = page.get_contents()
+            if contents is not None:
+                digest.update(contents.get_data())
+            resources = page.get('/Resources')
+            fonts = resources.get_object().get('/Font') if resources is not None else None
+            if fonts is not None:
+                for name, font in sorted(fonts.get_object().items()):
+                    digest.update(f"{name}={font.get_object().get('/BaseFont')}".encode('utf-8'))
+            fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+def _extract_pages(path, indices):
+    """Extract the given pages and time each one (runs in a worker process)"""
+    results = []
+    with mapped_reader(path) as reader:
+        for index in indices:
+            began = time.perf_counter()
+            text = reader.pages[index].extract_text() or ''
+            results.append((text, time.perf_counter() - began))
+    return results
+
+
+def get_executor(workers):
+    """Return the shared extraction process pool, resizing it if needed"""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False, cancel_futures=True)
+            # spawn rather than fork: the Flask server runs request threads
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _executor_workers = workers
+        return _executor
+
+
+class PageExtractor:
+    """Yield a spooled PDF's page text in order, serially or across a process pool
+
+    Documents shorter than ``min_parallel_pages`` (or ``workers <= 1``) are
+    extracted in the calling thread. Larger ones are split into contiguous
+    page ranges that run in worker processes and are reassembled in order.
+    Per-page extraction time is recorded in ``timings``. ``only`` restricts
+    extraction to a subset of 0-based page indices.
+    """
+
+    def __init__(self, path, workers=1, min_parallel_pages=16, only=None):
+        self.path = path
+        with mapped_reader(path) as reader:
+            self.page_count = len(reader.pages)
+        self.indices = list(range(self.page_count)) if only is None else sorted(only)
+        parallel = workers > 1 and len(self.indices) >= min_parallel_pages
+        self.workers = workers if parallel else 1
+        self.mode = 'parallel' if parallel else 'serial'
+        self.timings = []  # (page_number, seconds)
+        self.elapsed = 0.0
+
+    def __iter__(self):
+        for _, text, _ in self.iter_pages():
+            yield text
+
+    def iter_pages(self):
+        """Yield ``(page_number, text, seconds)`` for each extracted page in order"""
+        began = time.perf_counter()
+        batches = self._serial_batches() if self.mode == 'serial' else self._parallel_batches()
+        page_numbers = (index + 1 for index in self.indices)
+        for batch in batches:
+            for text, seconds in batch:
+                page_number = next(page_numbers)
+                self.timings.append((page_number, seconds))
+                self.elapsed = time.perf_counter() - began
+                yield page_number, text, seconds
+
+    def _serial_batches(self):
+        with mapped_reader(self.path) as reader:
+            for index in self.indices:
+                began = time.perf_counter()
+                text = reader.pages[index].extract_text() or ''
+                yield [(text, time.perf_counter() - began)]
+
+    def _parallel_batches(self):
+        # A few ranges per worker keeps the pool busy when some pages are slow
+        batch_size = max(1, math.ceil(len(self.indices) / (self.workers * 4)))
+        executor = get_executor(self.workers)
+        futures = [
+            executor.submit(_extract_pages, self.path, self.indices[start:start + batch_size])
+            for start in range(0, len(self.indices), batch_size)
+        ]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def report(self, slowest=5):
+        """Summarize extraction mode, total time and the slowest pages"""
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'pages': len(self.timings),
+            'totalSeconds': round(self.elapsed, 4),
+            'pageSeconds': round(sum(seconds for _, seconds in self.timings), 4),
+            'slowestPages': [
+                {'page': page_number, 'seconds': round(seconds, 4)}
+                for page_number, seconds in heapq.nlargest(slowest, self.timings, key=lambda t: t[1])
+            ]
+        }
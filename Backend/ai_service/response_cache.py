@@ -0,0 +1,236 @@
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from search_index import tokenize
+
+
+def normalize_question(question):
+    """Lowercase a question and strip punctuation and extra whitespace"""
+    return ' '.join(tokenize(question))
+
+
+def fingerprint(*parts):
+    """Short stable hash of the retrieved context (or any strings) behind an answer"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:32]
+
+
+class ResponseCache:
+    """LRU cache with a TTL for generated LLM answers
+
+    Keys combine the model, party, normalized question and a fingerprint of
+    the context the answer was generated from. Entries are also indexed by
+    party, and by the dependencies (e.g. chunk fingerprints) they were built
+    from, so a re-uploaded manifesto can drop all of a party's answers or
+    only those that used changed chunks. When ``db_path`` is set, entries
+    are written through to SQLite and survive restarts; at most every
+    ``prune_seconds`` a lookup or put drops expired rows and all but the
+    newest ``max_entries``, so the shared file stays bounded too.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, db_path=None, prune_seconds=60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.prune_seconds = prune_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (party, value, stored_at, dependencies)
+        self._party_keys = {}          # party -> {key}
+        self._dependency_keys = {}     # dependency -> {key}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS responses '
+                '(key TEXT PRIMARY KEY, party TEXT, value TEXT, stored_at REAL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS responses_party ON responses (party)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS response_deps (dep TEXT, key TEXT)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS response_deps_dep ON response_deps (dep)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS response_deps_key ON response_deps (key)')
+            self._prune_db()
+
+    @staticmethod
+    def make_key(model, party, question, context_fingerprint):
+        """Build the cache key for one generated answer"""
+        return fingerprint(model, party or '', normalize_question(question), context_fingerprint)
+
+    @staticmethod
+    def _entry_size(key, value):
+        return sys.getsizeof(key) + sys.getsizeof(value)
+
+    def get(self, key):
+        """Return a fresh cached answer for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[2] <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(entry[1])
+                self._drop(key)
+
+            if self._db is not None:
+                if now - self._pruned_at >= self.prune_seconds:
+                    self._prune_db()
+                row = self._db.execute(
+                    'SELECT party, value, stored_at FROM responses WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None and now - row[2] <= self.ttl_seconds:
+                    dependencies = tuple(dep for (dep,) in self._db.execute(
+                        'SELECT dep FROM response_deps WHERE key = ?', (key,)
+                    ))
+                    self._store(key, row[0], row[1], row[2], dependencies)
+                    self.hits += 1
+                    return json.loads(row[1])
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value, party=None, depends_on=()):
+        """Cache a JSON-serializable answer under key
+
+        ``depends_on`` lists the dependencies (e.g. chunk fingerprints) the
+        answer was built from, for invalidate_dependencies.
+        """
+        encoded = json.dumps(value)
+        stored_at = time.time()
+        dependencies = tuple(set(depends_on))
+        with self._lock:
+            self._store(key, party, encoded, stored_at, dependencies)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO responses (key, party, value, stored_at) VALUES (?, ?, ?, ?)',
+                    (key, party, encoded, stored_at)
+                )
+                self._db.execute('DELETE FROM response_deps WHERE key = ?', (key,))
+                self._db.executemany(
+                    'INSERT INTO response_deps (dep, key) VALUES (?, ?)',
+                    [(dep, key) for dep in dependencies]
+                )
+                self._db.commit()
+                if stored_at - self._pruned_at >= self.prune_seconds:
+                    self._prune_db()
+
+    def invalidate_party(self, party):
+        """Drop every cached answer for a party, returning how many were removed"""
+        with self._lock:
+            keys = list(self._party_keys.get(party, ()))
+            for key in keys:
+                self._drop(key)
+            if self._db is not None:
+                self._db.execute(
+                    'DELETE FROM response_deps WHERE key IN (SELECT key FROM responses WHERE party = ?)',
+                    (party,)
+                )
+                removed = self._db.execute('DELETE FROM responses WHERE party = ?', (party,)).rowcount
+                self._db.commit()
+                return max(removed, len(keys))
+            return len(keys)
+
+    def invalidate_dependencies(self, dependencies):
+        """Drop every cached answer built from any of ``dependencies``, returning how many"""
+        dependencies = list(set(dependencies))
+        with self._lock:
+            keys = set()
+            for dep in dependencies:
+                keys.update(self._dependency_keys.get(dep, ()))
+            if self._db is not None:
+                # Also catch answers that are only on disk; chunk the IN list
+                # to stay under SQLite's variable limit
+                for start in range(0, len(dependencies), 500):
+                    batch = dependencies[start:start + 500]
+                    placeholders = ','.join('?' * len(batch))
+                    keys.update(key for (key,) in self._db.execute(
+                        f'SELECT key FROM response_deps WHERE dep IN ({placeholders})', batch
+                    ))
+            for key in keys:
+                if key in self._entries:
+                    self._drop(key)
+            if self._db is not None and keys:
+                self._db.executemany('DELETE FROM responses WHERE key = ?', [(key,) for key in keys])
+                self._db.executemany('DELETE FROM response_deps WHERE key = ?', [(key,) for key in keys])
+                self._db.commit()
+            return len(keys)
+
+    def clear(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self._party_keys.clear()
+            self._dependency_keys.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute('DELETE FROM responses')
+                self._db.execute('DELETE FROM response_deps')
+                self._db.commit()
+
+    def _prune_db(self):
+        """Delete expired rows and all but the newest max_entries from SQLite"""
+        now = time.time()
+        self._db.execute('DELETE FROM responses WHERE stored_at < ?', (now - self.ttl_seconds,))
+        self._db.execute(
+            'DELETE FROM responses WHERE key IN '
+            '(SELECT key FROM responses ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+        self._db.execute('DELETE FROM response_deps WHERE key NOT IN (SELECT key FROM responses)')
+        self._db.commit()
+        self._pruned_at = now
+
+    def _store(self, key, party, encoded, stored_at, dependencies=()):
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (party, encoded, stored_at, dependencies)
+        self._party_keys.setdefault(party, set()).add(key)
+        for dep in dependencies:
+            self._dependency_keys.setdefault(dep, set()).add(key)
+        self._bytes += self._entry_size(key, encoded)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key):
+        party, encoded, _, dependencies = self._entries.pop(key)
+        self._bytes -= self._entry_size(key, encoded)
+        keys = self._party_keys.get(party)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._party_keys[party]
+        for dep in dependencies:
+            keys = self._dependency_keys.get(dep)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._dependency_keys[dep]
+
+    def stats(self):
+        """Return size, memory estimate and hit-rate counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'ttlSeconds': self.ttl_seconds,
+                'memoryBytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'persistent': self._db is not None
+            }
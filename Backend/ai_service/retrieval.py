@@ -0,0 +1,87 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from chunker import iter_chunks
+from search_index import InvertedIndex
+from sentences import SentenceTable
+
+
+def content_hash(text):
+    """SHA-256 hex digest of a manifesto's text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ManifestoRetriever:
+    """Chunk indexes for manifesto texts, built once per distinct content hash
+
+    The Node backend sends the full manifesto text with every question. The
+    first request for a given text chunks and indexes it; later requests only
+    hash the text and query the existing index. The least recently used
+    indexes are dropped once more than ``max_manifestos`` are held. Each
+    entry also keeps the chunks' sentence table for extractive answers.
+    """
+
+    def __init__(self, max_manifestos=64, chunk_size=200, overlap=30):
+        self.max_manifestos = max_manifestos
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._entries = OrderedDict()  # content hash -> (chunks, index, sentences)
+        self._lock = threading.Lock()
+
+    def _entry(self, content, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                return entry
+
+        # Build outside the lock; a concurrent duplicate build is harmless
+        chunks = list(iter_chunks([content], chunk_size=self.chunk_size, overlap=self.overlap))
+        index = InvertedIndex()
+        for chunk in chunks:
+            index.add_document(digest, chunk['chunkIndex'], chunk['text'])
+        sentences = SentenceTable.build(chunk['text'] for chunk in chunks)
+
+        with self._lock:
+            self._entries[digest] = (chunks, index, sentences)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_manifestos:
+                self._entries.popitem(last=False)
+        return chunks, index, sentences
+
+    def chunks(self, content):
+        """Return the chunk list for a manifesto text, building its index if needed"""
+        return self._entry(content, content_hash(content))[0]
+
+    def cached_chunks(self, digest):
+        """Return the chunks held for a content hash, or None if they were evicted"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            return entry[0] if entry is not None else None
+
+    def retrieve(self, content, question, top_k=4):
+        """Return the top_k chunks of content most relevant to question
+
+        Each result is a chunk dict with an added ``score``. When no chunk
+        shares a term with the question, the opening chunks are returned so
+        general questions still get the manifesto's introduction.
+        """
+        digest = content_hash(content)
+        chunks, index, _ = self._entry(content, digest)
+        hits = index.search(question, top_k)
+        if not hits:
+            return [dict(chunk, score=0.0) for chunk in chunks[:top_k]]
+        return [dict(chunks[chunk_index], score=score) for score, (_, chunk_index) in hits]
+
+    def top_sentences(self, digest, chunk_index, terms, limit=2):
+        """Best sentences of one chunk for query terms, or [] if the manifesto was evicted"""
+        with self._lock:
+            entry = self._entries.get(digest)
+        if entry is None:
+            return []
+        chunks, _, sentences = entry
+        return sentences.top(chunk_index, chunks[chunk_index]['text'], sentences.term_ids(terms), limit)
+
+    def __len__(self):
+        return len(self._entries)
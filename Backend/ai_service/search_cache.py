@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+
+from search_index import tokenize
+
+# Rough per-hit overhead of a cached chunk dict beyond its text
+HIT_OVERHEAD_BYTES = 400
+
+
+def normalize_query(query):
+    """Canonical form of a query for BM25: its distinct terms, sorted
+
+    Case, punctuation, word order and repeated words do not change BM25
+    scores here, so they must not split the cache either.
+    """
+    return ' '.join(sorted(set(tokenize(query))))
+
+
+class SearchCache:
+    """LRU cache of search results tied to an index version
+
+    Keys are ``(normalized query, party filter, top_k)``. Every entry
+    belongs to the index version it was computed against; the first lookup
+    or store at a newer version drops everything older, so an ingest that
+    bumps the version invalidates the cache without any explicit call.
+    Bounded by entry count and by an estimate of the bytes held.
+    """
+
+    def __init__(self, max_entries=2048, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (results, size)
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(query, party_id, top_k):
+        return (normalize_query(query), party_id, top_k)
+
+    def _advance(self, version):
+        # Caller holds the lock; results from older versions can never be served again
+        if version != self._version:
+            if self._version is not None and version < self._version:
+                return False
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+        return True
+
+    def get(self, key, version):
+        """Return cached results for key at this index version, or None"""
+        with self._lock:
+            if not self._advance(version):
+                self.misses += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, version, results):
+        """Store ``(score, chunk)`` results computed against ``version``"""
+        size = sum(len(chunk['text']) + HIT_OVERHEAD_BYTES for _, chunk in results) + HIT_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if not self._advance(version):
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (results, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        """Return size, bounds and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
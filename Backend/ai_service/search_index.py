@@ -0,0 +1,166 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Query terms of PREFIX_MIN_LENGTH or more characters also match indexed
+# words they start ("health" finds "healthcare"), each scored at
+# PREFIX_WEIGHT of an exact match; at most PREFIX_MAX_EXPANSIONS per term
+PREFIX_MIN_LENGTH = 3
+PREFIX_WEIGHT = 0.5
+PREFIX_MAX_EXPANSIONS = 32
+
+
+def tokenize(text):
+    """Lowercase text and split it into alphanumeric tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def expand_query(terms, completions):
+    """Map query terms to ``{indexed term: weight}``, adding prefix completions
+
+    ``completions(prefix, limit)`` returns indexed terms starting with
+    ``prefix``. Exact terms weigh 1.0 and completions PREFIX_WEIGHT.
+    """
+    weights = {term: 1.0 for term in terms}
+    for term in terms:
+        if len(term) < PREFIX_MIN_LENGTH:
+            continue
+        for completion in completions(term, PREFIX_MAX_EXPANSIONS + 1):
+            if completion != term:
+                weights.setdefault(completion, PREFIX_WEIGHT)
+    return weights
+
+
+def sorted_completions(sorted_terms, prefix, limit):
+    """Terms starting with ``prefix`` from a sorted list, at most ``limit``"""
+    completions = []
+    for position in range(bisect.bisect_left(sorted_terms, prefix), len(sorted_terms)):
+        term = sorted_terms[position]
+        if not term.startswith(prefix) or len(completions) == limit:
+            break
+        completions.append(term)
+    return completions
+
+
+class InvertedIndex:
+    """BM25 inverted index over manifesto chunks
+
+    Documents are identified by ``(party_id, chunk_index)`` so callers can
+    resolve hits back to their own chunk storage.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)  # term -> {doc_id: term frequency}
+        self.doc_lengths = {}               # doc_id -> token count
+        self.doc_terms = {}                 # doc_id -> distinct terms
+        self.party_docs = defaultdict(set)  # party_id -> {doc_id}
+        self.total_length = 0
+        self.version = 0
+        self._sorted_terms = None  # vocabulary for prefix matching, rebuilt after it changes
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add_document(self, party_id, chunk_index, text):
+        """Tokenize a chunk and add its postings"""
+        doc_id = (party_id, chunk_index)
+        tokens = tokenize(text)
+
+        frequencies = defaultdict(int)
+        for token in tokens:
+            frequencies[token] += 1
+
+        with self._lock:
+            if doc_id in self.doc_lengths:
+                self._remove_document(doc_id)
+            for term, tf in frequencies.items():
+                if term not in self.postings:
+                    self._sorted_terms = None
+                self.postings[term][doc_id] = tf
+            self.doc_lengths[doc_id] = len(tokens)
+            self.doc_terms[doc_id] = tuple(frequencies)
+            self.party_docs[party_id].add(doc_id)
+            self.total_length += len(tokens)
+            self.version += 1
+
+    def remove_party(self, party_id):
+        """Drop every chunk indexed for a party"""
+        with self._lock:
+            for doc_id in list(self.party_docs.get(party_id, ())):
+                self._remove_document(doc_id)
+            self.party_docs.pop(party_id, None)
+            self.version += 1
+
+    def replace_party(self, party_id, chunks):
+        """Re-index a party's chunks, discarding the previous ones"""
+        with self._lock:
+            self.remove_party(party_id)
+            for chunk in chunks:
+                self.add_document(party_id, chunk['chunkIndex'], chunk['text'])
+
+    def apply_delta(self, party_id, chunks, changed):
+        """Re-index only the chunk indices in ``changed`` and drop any beyond the new end"""
+        with self._lock:
+            for chunk in chunks:
+                if chunk['chunkIndex'] in changed:
+                    self.add_document(party_id, chunk['chunkIndex'], chunk['text'])
+            for doc_id in [doc_id for doc_id in self.party_docs.get(party_id, ()) if doc_id[1] >= len(chunks)]:
+                self._remove_document(doc_id)
+            self.version += 1
+
+    def _remove_document(self, doc_id):
+        for term in self.doc_terms.pop(doc_id, ()):
+            docs = self.postings.get(term)
+            if docs is None:
+                continue
+            docs.pop(doc_id, None)
+            if not docs:
+                del self.postings[term]
+                self._sorted_terms = None
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+        self.party_docs[doc_id[0]].discard(doc_id)
+
+    def completions(self, prefix, limit):
+        """Indexed terms starting with ``prefix``, at most ``limit``"""
+        with self._lock:
+            if self._sorted_terms is None:
+                self._sorted_terms = sorted(self.postings)
+            return sorted_completions(self._sorted_terms, prefix, limit)
+
+    def search(self, query, top_k=5, party_id=None):
+        """Return up to top_k ``(score, doc_id)`` pairs ranked by BM25, with prefix matching"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            doc_count = len(self.doc_lengths)
+            if doc_count == 0:
+                return []
+            avg_length = self.total_length / doc_count
+
+            scores = defaultdict(float)
+            for term, weight in expand_query(terms, self.completions).items():
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = weight * math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in docs.items():
+                    if party_id is not None and doc_id[0] != party_id:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(
+            top_k,
+            ((score, doc_id) for doc_id, score in scores.items()),
+            key=lambda hit: hit[0]
+        )
@@ -0,0 +1,165 @@
+import heapq
+import math
+import re
+from array import array
+from collections import defaultdict
+
+from search_index import tokenize
+
+# A sentence runs up to terminal punctuation or a line break
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]*")
+
+# Fragments shorter than this (headings, list numbers) are not worth quoting
+MIN_SENTENCE_CHARS = 20
+
+
+def split_sentences(text):
+    """Return ``(start, end)`` character spans of the sentences in text"""
+    spans = []
+    for match in SENTENCE_PATTERN.finditer(text):
+        start, end = match.span()
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end - start >= MIN_SENTENCE_CHARS:
+            spans.append((start, end))
+    return spans
+
+
+class SentenceTable:
+    """Sentence spans and per-sentence term weights for a run of chunks
+
+    Sentences of chunk ``i`` are ``chunk_first[i]:chunk_first[i + 1]``;
+    sentence ``s`` spans ``spans[2s]:spans[2s + 1]`` of its chunk's text and
+    has terms ``terms[term_first[s]:term_first[s + 1]]`` with matching
+    ``weights``. Term ids index ``vocabulary`` (or a segment's term table).
+
+    Weights are log-scaled term frequency times the term's inverse sentence
+    frequency within the party, L2-normalized per sentence, so scoring a
+    query is a sum over the few terms of the retrieved chunks' sentences.
+    """
+
+    __slots__ = ('chunk_first', 'spans', 'term_first', 'terms', 'weights', 'vocabulary')
+
+    def __init__(self, chunk_first, spans, term_first, terms, weights, vocabulary=None):
+        self.chunk_first = chunk_first
+        self.spans = spans
+        self.term_first = term_first
+        self.terms = terms
+        self.weights = weights
+        self.vocabulary = vocabulary  # term -> id, when ids are table-local
+
+    @classmethod
+    def build(cls, texts):
+        """Segment and weight the sentences of ``texts`` (one party's chunks)"""
+        chunk_first = array('I', [0])
+        spans = array('I')
+        counted = []  # per sentence: {term: tf}
+        sentence_frequency = defaultdict(int)
+        for text in texts:
+            for start, end in split_sentences(text):
+                frequencies = defaultdict(int)
+                for token in tokenize(text[start:end]):
+                    frequencies[token] += 1
+                for term in frequencies:
+                    sentence_frequency[term] += 1
+                spans.extend((start, end))
+                counted.append(frequencies)
+            chunk_first.append(len(counted))
+
+        vocabulary = {term: term_id for term_id, term in enumerate(sorted(sentence_frequency))}
+        sentence_count = len(counted)
+        term_first = array('I', [0])
+        terms = array('I')
+        weights = array('f')
+        for frequencies in counted:
+            raw = [
+                (vocabulary[term], (1 + math.log(tf)) * math.log(1 + sentence_count / sentence_frequency[term]))
+                for term, tf in frequencies.items()
+            ]
+            norm = math.sqrt(sum(weight * weight for _, weight in raw)) or 1.0
+            for term_id, weight in raw:
+                terms.append(term_id)
+                weights.append(weight / norm)
+            term_first.append(len(terms))
+        return cls(chunk_first, spans, term_first, terms, weights, vocabulary)
+
+    def term_ids(self, terms):
+        """Map query terms to this table's term ids, skipping unknown ones"""
+        return {self.vocabulary[term] for term in terms if term in self.vocabulary}
+
+    def top(self, chunk_index, text, term_ids, limit=2):
+        """Return up to ``limit`` ``(score, position, sentence)`` of a chunk matching ``term_ids``"""
+        scored = []
+        first = self.chunk_first[chunk_index]
+        for sentence in range(first, self.chunk_first[chunk_index + 1]):
+            score = 0.0
+            for position in range(self.term_first[sentence], self.term_first[sentence + 1]):
+                if self.terms[position] in term_ids:
+                    score += self.weights[position]
+            if score > 0:
+                scored.append((score, sentence - first))
+        return [
+            (score, position, self.sentence(chunk_index, position, text))
+            for score, position in heapq.nlargest(limit, scored)
+        ]
+
+    def sentence(self, chunk_index, position, text):
+        """Return sentence ``position`` of a chunk given the chunk's text"""
+        sentence = self.chunk_first[chunk_index] + position
+        return text[self.spans[2 * sentence]:self.spans[2 * sentence + 1]]
+
+    def count(self, chunk_index):
+        """Number of sentences in a chunk"""
+        return self.chunk_first[chunk_index + 1] - self.chunk_first[chunk_index]
+
+    def nbytes(self):
+        arrays = (self.chunk_first, self.spans, self.term_first, self.terms, self.weights)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+
+def extractive_answer(query, hits, top_sentences, max_sentences=4):
+    """Compose an answer from the best-matching manifesto sentences
+
+    ``hits`` are retrieved chunk dicts (with ``partyId``, ``partyName``,
+    ``chunkIndex`` and ``text``) in rank order. ``top_sentences(chunk,
+    terms, limit)`` returns ``(score, position, sentence)`` for one chunk
+    from its precomputed sentence table. Sentences are grouped by party in
+    retrieval order; when nothing matches, the opening of the best chunk is
+    quoted instead.
+    """
+    terms = set(tokenize(query))
+    picked = []
+    for rank, chunk in enumerate(hits):
+        for score, position, sentence in top_sentences(chunk, terms, 2):
+            picked.append((score, rank, position, chunk, sentence))
+    # Overlapping chunks repeat sentences; quote each one once
+    unique = []
+    seen = set()
+    for item in sorted(picked, key=lambda item: -item[0]):
+        key = item[4].lower()
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+            if len(unique) == max_sentences:
+                break
+    picked = sorted(unique, key=lambda item: (item[1], item[2]))
+
+    if not picked:
+        if not hits:
+            return f"I couldn't find anything about '{query}' in the available manifestos."
+        chunk = hits[0]
+        return (f"Regarding '{query}', here's the closest passage I found:\n\n"
+                f"**{chunk['partyName']}**: {chunk['text'][:400].strip()}")
+
+    lines = [f"Regarding '{query}', here's what the manifestos say:", ""]
+    current = None
+    for _, _, _, chunk, sentence in picked:
+        if chunk['partyName'] != current:
+            if current is not None:
+                lines.append("")
+            current = chunk['partyName']
+            lines.append(f"**{current}:**")
+        lines.append(f"• {sentence}")
+    return "\n".join(lines)
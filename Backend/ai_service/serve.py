@@ -0,0 +1,109 @@
+"""Production entry point: N worker processes sharing one manifesto snapshot
+
+Usage (from Backend/ai_service):
+    python serve.py --workers 4 --port 5001 --snapshot-dir ./cache/snapshots
+
+The parent process binds the listening socket and forks the workers, which
+all accept on it. Each worker imports simple_app with SNAPSHOT_DIR set, so
+manifestos and the search index are read from the memory-mapped snapshot
+instead of process-local dicts. An ingest on any worker publishes a new
+snapshot and the others swap to it within SNAPSHOT_POLL_SECONDS. Workers
+that die are restarted; SIGTERM/SIGINT stop them all.
+
+Background ingest jobs are recorded in the snapshot directory, so any
+worker answers /jobs/<id>. OLLAMA_MAX_IN_FLIGHT stays the limit for the
+whole server: each worker admits its share of it.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'snapshots')
+
+
+def run_worker(listener, threads):
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    from simple_app import create_app
+
+    app = create_app()
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, app, threaded=threads, fd=listener.fileno())
+    server.serve_forever()
+
+
+def spawn(listener, threads, index):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            # Read by simple_app to take this worker's share of the Ollama budget
+            os.environ['SERVE_WORKER_INDEX'] = str(index)
+            run_worker(listener, threads)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--snapshot-dir', default=os.environ.get('SNAPSHOT_DIR') or DEFAULT_SNAPSHOT_DIR)
+    parser.add_argument('--no-threads', dest='threads', action='store_false',
+                        help='serve one request at a time per worker')
+    args = parser.parse_args()
+
+    # Set before any worker imports simple_app
+    os.environ['SNAPSHOT_DIR'] = os.path.abspath(args.snapshot_dir)
+    os.environ['SERVE_WORKERS'] = str(args.workers)
+    budget = os.environ.get('OLLAMA_MAX_IN_FLIGHT')
+    if budget and int(budget) < args.workers:
+        print(f"⚠️ OLLAMA_MAX_IN_FLIGHT={budget} is below --workers; every worker still admits one call",
+              file=sys.stderr)
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(128)
+    listener.set_inheritable(True)
+
+    print(f"🚀 Serving on http://{args.host}:{args.port} with {args.workers} workers")
+    print(f"📦 Snapshot directory: {os.environ['SNAPSHOT_DIR']}")
+
+    workers = {spawn(listener, args.threads, index): index for index in range(args.workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = workers.pop(pid, None)
+        if not stopping and index is not None:
+            print(f"⚠️ Worker {pid} exited with status {status}; restarting", file=sys.stderr)
+            time.sleep(0.5)
+            workers[spawn(listener, args.threads, index)] = index
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,334 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import PyPDF2
-import io
+from contextlib import ExitStack
 import json
 import os
-import requests
+import threading
+from backend_pool import BackendPool
+from chat_turn import ChatReply, ChatTurn, GenerationFailed, answer_turn, reply_events, stream_turn
+from chunk_store import ChunkStore
+from chunker import iter_chunks
+from ingest_cache import IngestCache
+from ingest_jobs import IngestJobQueue
+from llm_client import CircuitBreaker, CircuitOpen, LLMClient
+from metrics import ServiceMetrics
+from ollama_stream import stream_format, event_stream_response
+from pdf_extract import spooled_pdf, page_fingerprints, PageExtractor
+from response_cache import ResponseCache, fingerprint
+from search_cache import SearchCache
+from search_index import InvertedIndex
+from sentences import extractive_answer
+from singleflight import SingleFlight
+from snapshot import SnapshotStore
+from summarizer import extractive_summary
 
 app = Flask(__name__)
 CORS(app)
 
-# Simple in-memory storage for manifestos
-manifestos = {}
+# Per-stage latency histograms, cache/queue gauges and token counters for /metrics
+metrics = ServiceMetrics('simple_app')
+
+# PROFILE_DIR enables cProfile dumps for requests sent with "X-Profile: 1",
+# plus a random PROFILE_SAMPLE_RATE share of all requests
+metrics.install(
+    app,
+    profile_dir=os.environ.get('PROFILE_DIR') or None,
+    profile_sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+)
+
+# Processed manifestos and their BM25 index are persisted in SNAPSHOT_DIR as
+# memory-mapped per-party segments, so restarts and every serve.py worker
+# serve them without re-uploading. Set SNAPSHOT_DIR= (empty) to keep them
+# in process memory only.
+SNAPSHOT_DIR = os.environ.get(
+    'SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'snapshots')
+)
 processed_chunks = {}
 
+# Ollama servers and model used for /chat. OLLAMA_URL takes a comma-separated
+# list of servers, each optionally limited to some models: url=model|model
+OLLAMA_URL = os.environ.get('OLLAMA_URL', 'http://localhost:11434')
+OLLAMA_MODEL = 'llama3.2:3b'
+
+# OLLAMA_MAX_IN_FLIGHT is the budget of the whole service: serve.py workers
+# (SERVE_WORKERS of them, this one numbered SERVE_WORKER_INDEX) split it
+def worker_share(total):
+    workers = int(os.environ.get('SERVE_WORKERS', 1))
+    index = int(os.environ.get('SERVE_WORKER_INDEX', 0))
+    return max(1, total // workers + (1 if index < total % workers else 0))
+
+# Search results per (normalized query, party filter, top-k), dropped whenever the index version changes
+search_cache = SearchCache(
+    max_entries=int(os.environ.get('SEARCH_CACHE_SIZE', 2048)),
+    max_bytes=int(os.environ.get('SEARCH_CACHE_MAX_MB', 32)) * 1024 * 1024
+)
+
+# Identical concurrent /chat generations share one Ollama call
+inflight_generations = SingleFlight()
+COALESCE_WAIT_SECONDS = float(os.environ.get('COALESCE_WAIT_SECONDS', 60))
+
+# Chunking settings (words per chunk, words carried into the next chunk)
+CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', 500))
+CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP', 0))
+
+# PDF extraction settings (worker processes, smallest document worth parallelizing)
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', os.cpu_count() or 1))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 16))
+
+# Content-addressed cache of extracted pages and chunk lists
+INGEST_CACHE_DIR = os.environ.get(
+    'INGEST_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'ingest')
+)
+INGEST_CACHE_MAX_MB = int(os.environ.get('INGEST_CACHE_MAX_MB', 512))
+
+# Background ingest jobs for /process-manifesto?async=true. With a snapshot,
+# job state lives next to it so any serve.py worker can answer /jobs/<id>
+INGEST_JOBS_DB = os.environ.get(
+    'INGEST_JOBS_DB',
+    os.path.join(SNAPSHOT_DIR, 'ingest-jobs.db') if SNAPSHOT_DIR else ''
+)
+
+# Stores, caches, the Ollama pool and the job queue open files and start
+# threads, so create_app() builds them rather than the import: spawned PDF
+# extraction workers import this module too
+manifestos = search_index = None
+ollama_backends = ollama_client = None
+response_cache = ingest_cache = ingest_jobs = None
+
+def create_app():
+    """Build the service once per process and return the Flask app"""
+    global manifestos, search_index, ollama_backends, ollama_client, response_cache, ingest_cache, ingest_jobs
+    if ollama_client is not None:
+        return app
+
+    if SNAPSHOT_DIR:
+        manifestos = SnapshotStore(SNAPSHOT_DIR, poll_interval=float(os.environ.get('SNAPSHOT_POLL_SECONDS', 1)))
+        search_index = manifestos
+    else:
+        # In-memory storage for manifestos: one packed text buffer per party
+        # (set CHUNK_STORE_COMPRESS=true to keep cold parties zlib/zstd-compressed)
+        manifestos = ChunkStore(
+            compress=os.environ.get('CHUNK_STORE_COMPRESS', 'false').lower() == 'true',
+            codec=os.environ.get('CHUNK_STORE_CODEC') or None,
+            hot_parties=int(os.environ.get('CHUNK_STORE_HOT_PARTIES', 8))
+        )
+
+        # BM25 index over every stored chunk, updated at ingest time
+        search_index = InvertedIndex()
+
+    # Generations go to the least busy healthy server (OLLAMA_ROUTING=latency weighs
+    # servers by their recent speed instead). Each server has its own circuit
+    # breaker, which stops calling it after repeated failures or slow answers until
+    # a background probe sees it recover; servers failing the periodic health check
+    # are skipped too. With no server left, /chat serves the extractive fallback.
+    ollama_backends = BackendPool.from_spec(
+        OLLAMA_URL,
+        breaker=lambda: CircuitBreaker(
+            window=int(os.environ.get('LLM_BREAKER_WINDOW', 20)),
+            min_calls=int(os.environ.get('LLM_BREAKER_MIN_CALLS', 5)),
+            failure_rate=float(os.environ.get('LLM_BREAKER_FAILURE_RATE', 0.5)),
+            slow_call_seconds=float(os.environ.get('LLM_BREAKER_SLOW_SECONDS', 20)),
+            slow_rate=float(os.environ.get('LLM_BREAKER_SLOW_RATE', 0.8)),
+            probe_interval=float(os.environ.get('LLM_BREAKER_PROBE_SECONDS', 5))
+        ),
+        strategy=os.environ.get('OLLAMA_ROUTING', 'least_outstanding'),
+        health_interval=float(os.environ.get('OLLAMA_HEALTH_SECONDS', 10))
+    )
+
+    # Shared Ollama client: pooled connections, bounded concurrency, fast rejection when saturated
+    ollama_client = LLMClient(
+        ollama_backends,
+        max_in_flight=worker_share(int(os.environ.get('OLLAMA_MAX_IN_FLIGHT', 2 * len(ollama_backends.backends)))),
+        max_queue=int(os.environ.get('OLLAMA_MAX_QUEUE', 64)),
+        queue_timeout=float(os.environ.get('OLLAMA_QUEUE_TIMEOUT', 30)),
+        timeout=(5, 30),
+        observer=metrics.observe_llm
+    )
+
+    # Cache of generated chat answers (set RESPONSE_CACHE_DB to persist it)
+    response_cache = ResponseCache(
+        max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', 1024)),
+        ttl_seconds=int(os.environ.get('RESPONSE_CACHE_TTL', 3600)),
+        db_path=os.environ.get('RESPONSE_CACHE_DB') or None
+    )
+
+    ingest_cache = IngestCache(INGEST_CACHE_DIR, max_bytes=INGEST_CACHE_MAX_MB * 1024 * 1024)
+    ingest_jobs = IngestJobQueue(workers=int(os.environ.get('INGEST_WORKERS', 2)), db_path=INGEST_JOBS_DB or None)
+
+    metrics.cache_gauges({
+        'responses': response_cache.stats,
+        'search': search_cache.stats,
+        'ingest': ingest_cache.stats
+    })
+    metrics.llm_gauges(ollama_client)
+    metrics.gauge('inflight_generations', 'Distinct chat answers being generated',
+                  lambda: inflight_generations.stats()['inFlight'])
+    metrics.gauge('ingest_jobs', 'Background ingest jobs by status',
+                  lambda: [({'status': status}, count) for status, count in ingest_jobs.stats().items()])
+    metrics.gauge('manifesto_parties', 'Manifestos loaded', lambda: manifestos.stats()['parties'])
+    metrics.gauge('manifesto_chunks', 'Manifesto chunks loaded', lambda: manifestos.stats()['chunks'])
+    metrics.gauge('manifesto_bytes', 'Bytes held by manifesto storage', lambda: manifestos.stats()['bytes'])
+    return app
+
+def page_extractor(pdf_path, only=None):
+    """Build a PageExtractor with the configured worker settings"""
+    return PageExtractor(pdf_path, workers=PDF_WORKERS, min_parallel_pages=PDF_PARALLEL_MIN_PAGES, only=only)
+
+def previous_page_texts(party_id):
+    """Map page fingerprint -> text for the last PDF ingested for a party"""
+    if not party_id:
+        return {}
+    pointer = ingest_cache.get(IngestCache.party_key(party_id))
+    previous = ingest_cache.get(IngestCache.pages_key(pointer['sha256'])) if pointer else None
+    if not previous or 'pageHashes' not in previous:
+        return {}
+    return dict(zip(previous['pageHashes'], previous['pages']))
+
+# One lock per party, held by an ingest from its diff to the index update
+ingest_locks = {}
+ingest_locks_guard = threading.Lock()
+
+def party_ingest_lock(party_id):
+    with ingest_locks_guard:
+        return ingest_locks.setdefault(party_id, threading.Lock())
+
+def chunk_dependency(party_id, text):
+    """Dependency id recorded on cached answers built from a chunk"""
+    return fingerprint(party_id, text)
+
+def iter_upload_pages(upload, report, party_id=None):
+    """Yield ``(page_number, text, seconds)`` for an upload, reusing cached pages
+
+    ``report`` is filled in with the cache status, the page count and, when
+    the PDF had to be parsed, the extraction report. If the exact PDF is not
+    cached but the party's previous upload is, only pages whose content
+    fingerprint changed are extracted (cache status ``partial``, with their
+    numbers in ``changedPages``). Fresh pages are cached once all of them
+    have been read.
+    """
+    key = IngestCache.pages_key(upload.sha256)
+    cached = ingest_cache.get(key)
+    if cached is not None:
+        report['cache'] = 'hit'
+        report['extraction'] = None
+        report['pageCount'] = len(cached['pages'])
+        for page_number, page_text in enumerate(cached['pages'], start=1):
+            yield page_number, page_text, None
+        return
+
+    with metrics.stage('pdf_fingerprint'):
+        fingerprints = page_fingerprints(upload.path)
+    previous = previous_page_texts(party_id)
+    changed = [index for index, page_hash in enumerate(fingerprints) if page_hash not in previous]
+    report['cache'] = 'partial' if len(changed) < len(fingerprints) else 'miss'
+    if report['cache'] == 'partial':
+        report['changedPages'] = [index + 1 for index in changed]
+    extractor = page_extractor(upload.path, only=changed)
+    report['pageCount'] = extractor.page_count
+    extracted = extractor.iter_pages()
+    pages = []
+    for index, page_hash in enumerate(fingerprints):
+        if page_hash in previous:
+            page_text, seconds = previous[page_hash], None
+        else:
+            _, page_text, seconds = next(extracted)
+            if seconds is not None:
+                metrics.observe_stage('pdf_page', seconds)
+        pages.append(page_text)
+        yield index + 1, page_text, seconds
+    report['extraction'] = extractor.report()
+    ingest_cache.put(key, {'pages': pages, 'pageHashes': fingerprints})
+
+def ingest_manifesto(upload, party_id, party_name, progress=None):
+    """Run the extract -> chunk -> index -> summarize pipeline for a spooled upload
+
+    ``progress(stage, pages_done=None, page_count=None)`` is called as the
+    pipeline advances. Returns the /process-manifesto response body.
+    """
+    if not party_id:
+        raise ValueError('partyId is required')
+    progress = progress or (lambda *args, **kwargs: None)
+
+    # Step 1 + 2: Extract PDF text page by page and chunk it as it streams in,
+    # unless this exact PDF was already chunked with the same settings.
+    # Pages unchanged since the party's last upload are not re-extracted.
+    report = {}
+    progress('extracting')
+    chunks_key = IngestCache.chunks_key(upload.sha256, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+    cached = ingest_cache.get(chunks_key)
+    if cached is not None:
+        report = {'cache': 'hit', 'extraction': None}
+        page_count = cached['pageCount']
+        chunks = cached['chunks']
+        progress('extracting', pages_done=page_count, page_count=page_count)
+    else:
+        def pages():
+            for page_number, page_text, _ in iter_upload_pages(upload, report, party_id):
+                progress('extracting', pages_done=page_number, page_count=report.get('pageCount'))
+                yield page_text
+
+        # Extraction and chunking are interleaved; pdf_page holds the parsing share
+        with metrics.stage('extract_chunk'):
+            chunks = list(iter_chunks(pages(), chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP))
+        page_count = report['pageCount']
+        report['cache'] = 'partial' if report['cache'] == 'partial' else 'miss'
+        ingest_cache.put(chunks_key, {'pageCount': page_count, 'chunks': chunks})
+    ingest_cache.put(IngestCache.party_key(party_id), {'sha256': upload.sha256})
+
+    # Step 3: Precompute the extractive summary before the manifesto goes live
+    progress('summarizing')
+    with metrics.stage('summarize'):
+        summary = extractive_summary(chunks)
+
+    # Step 4: Store (in memory, or as a published snapshot) and index for search.
+    # The diff against the stored chunks decides which answers are stale and,
+    # in memory, which chunks are re-indexed; a snapshot publish re-tokenizes
+    # the party's whole segment. Overlapping ingests of one party (a job and a
+    # sync upload) take turns so each diffs against what the last one stored.
+    progress('indexing')
+    with party_ingest_lock(party_id):
+        previous = manifestos.get(party_id)
+        old_texts = [manifestos.chunk(party_id, index)['text'] for index in range(len(previous))] if previous else []
+        changed = {
+            chunk['chunkIndex'] for chunk in chunks
+            if chunk['chunkIndex'] >= len(old_texts) or old_texts[chunk['chunkIndex']] != chunk['text']
+        }
+        current_texts = {chunk['text'] for chunk in chunks}
+        stale = [chunk_dependency(party_id, text) for text in old_texts if text not in current_texts]
+
+        with metrics.stage('store_index'):
+            manifestos.put(
+                party_id,
+                party_name,
+                chunks,
+                page_count=page_count,
+                summary=summary,
+                processed_at=str(__import__('datetime').datetime.now())
+            )
+            if search_index is not manifestos:  # a snapshot indexes as it publishes
+                search_index.apply_delta(party_id, chunks, changed)
+
+        # Answers quoting removed chunk text are stale; the rest stay cached
+        invalidated = response_cache.invalidate_dependencies(stale)
+
+    return {
+        'success': True,
+        'message': f'Successfully processed manifesto for {party_name}',
+        'totalChunks': len(chunks),
+        'partyId': party_id,
+        'partyName': party_name,
+        'cache': report['cache'],
+        'extraction': report['extraction'],
+        'delta': {
+            'changedPages': report.get('changedPages'),
+            'changedChunks': len(changed),
+            'removedChunks': max(len(old_texts) - len(chunks), 0),
+            'invalidatedAnswers': invalidated
+        }
+    }
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -22,6 +338,40 @@ def health_check():
         'note': 'Running without ML dependencies for demo'
     })
 
+def wants_ndjson():
+    """Whether the client asked for a streamed NDJSON response"""
+    stream_flag = request.args.get('stream') or request.form.get('stream') or ''
+    return (stream_flag.lower() in ('1', 'true', 'ndjson')
+            or 'application/x-ndjson' in request.headers.get('Accept', ''))
+
+def stream_pdf_pages(file, party_id, party_name):
+    """Stream extracted page text as NDJSON, one line per page"""
+    cleanup = ExitStack()
+    upload = cleanup.enter_context(spooled_pdf(file))
+
+    def generate():
+        with cleanup:
+            try:
+                report = {}
+                for page_number, page_text, seconds in iter_upload_pages(upload, report, party_id):
+                    line = {'page': page_number, 'text': page_text}
+                    if seconds is not None:
+                        line['seconds'] = round(seconds, 4)
+                    yield json.dumps(line) + "\n"
+                yield json.dumps({
+                    'success': True,
+                    'done': True,
+                    'partyId': party_id,
+                    'partyName': party_name,
+                    'pageCount': report['pageCount'],
+                    'cache': report['cache'],
+                    'extraction': report['extraction']
+                }) + "\n"
+            except Exception as e:
+                yield json.dumps({'error': str(e)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/extract-pdf', methods=['POST'])
 def extract_pdf_text():
     """Extract text from uploaded PDF"""
@@ -33,23 +383,27 @@ def extract_pdf_text():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
 
-        # Extract text from PDF
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
-        text = ""
-
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-
         # Get metadata from form
         party_id = request.form.get('partyId')
         party_name = request.form.get('partyName')
 
+        if wants_ndjson():
+            return stream_pdf_pages(file, party_id, party_name)
+
+        # Extract text from PDF, one page at a time
+        report = {}
+        with spooled_pdf(file) as upload:
+            pages = [page_text for _, page_text, _ in iter_upload_pages(upload, report, party_id)]
+        text = "".join(page_text + "\n" for page_text in pages)
+
         return jsonify({
             'success': True,
             'text': text,
             'partyId': party_id,
             'partyName': party_name,
-            'pageCount': len(pdf_reader.pages)
+            'pageCount': len(pages),
+            'cache': report['cache'],
+            'extraction': report['extraction']
         })
 
     except Exception as e:
@@ -66,101 +420,76 @@ def process_full_manifesto():
         file = request.files['file']
         party_id = request.form.get('partyId')
         party_name = request.form.get('partyName')
+        if not party_id:
+            return jsonify({'error': 'partyId is required'}), 400
+
+        # Large uploads can be processed in the background and polled for progress
+        async_flag = (request.args.get('async') or request.form.get('async') or '').lower()
+        if async_flag in ('1', 'true'):
+            cleanup = ExitStack()
+            upload = cleanup.enter_context(spooled_pdf(file))
+            job = ingest_jobs.submit(
+                party_id,
+                party_name,
+                lambda job: ingest_manifesto(upload, party_id, party_name, job.progress),
+                cleanup=cleanup.close
+            )
+            return jsonify({
+                'success': True,
+                'jobId': job.id,
+                'status': job.status,
+                'statusUrl': f"/jobs/{job.id}"
+            }), 202
 
-        # Step 1: Extract PDF text
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-
-        # Step 2: Simple text chunking (no ML)
-        sentences = text.split('. ')
-        chunks = []
-        current_chunk = ""
-        chunk_index = 0
-        chunk_size = 500  # words per chunk
-
-        for sentence in sentences:
-            if len((current_chunk + ". " + sentence).split()) > chunk_size and current_chunk:
-                chunks.append({
-                    'chunkId': f"{party_id}_chunk_{chunk_index}",
-                    'partyId': party_id,
-                    'partyName': party_name,
-                    'text': current_chunk.strip(),
-                    'chunkIndex': chunk_index
-                })
-                chunk_index += 1
-                current_chunk = sentence
-            else:
-                current_chunk = current_chunk + ". " + sentence if current_chunk else sentence
-
-        if current_chunk:
-            chunks.append({
-                'chunkId': f"{party_id}_chunk_{chunk_index}",
-                'partyId': party_id,
-                'partyName': party_name,
-                'text': current_chunk.strip(),
-                'chunkIndex': chunk_index
-            })
-
-        # Store in memory (for demo)
-        manifestos[party_id] = {
-            'partyName': party_name,
-            'text': text,
-            'chunks': chunks,
-            'processedAt': str(__import__('datetime').datetime.now())
-        }
-
-        return jsonify({
-            'success': True,
-            'message': f'Successfully processed manifesto for {party_name}',
-            'totalChunks': len(chunks),
-            'partyId': party_id,
-            'partyName': party_name
-        })
+        with spooled_pdf(file) as upload:
+            return jsonify(ingest_manifesto(upload, party_id, party_name))
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def ingest_job_status(job_id):
+    """Report the stage, page progress and ETA of a background ingest"""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(dict(job.to_dict(), success=True))
+
+@app.route('/manifesto-summary/<party_id>', methods=['GET'])
+def manifesto_summary(party_id):
+    """Return the extractive summary computed when the manifesto was ingested"""
+    manifesto_data = manifestos.get(party_id)
+    if manifesto_data is None:
+        return jsonify({'error': 'Manifesto not found'}), 404
+    return jsonify({
+        'success': True,
+        'partyId': party_id,
+        'partyName': manifesto_data.party_name,
+        'summary': manifesto_data.summary
+    })
+
 @app.route('/search-manifesto', methods=['POST'])
 def search_manifesto():
-    """Simple text search (no vector search for demo)"""
+    """BM25 keyword search (no vector search for demo)"""
     try:
         data = request.json
         query = data['query'].lower()
-        party_filter = data.get('partyId')
+        party_filter = data.get('partyId') or None  # empty means every party
+        top_k = max(1, min(int(data.get('topK', 5)), 50))
 
         relevant_chunks = []
 
-        # Simple keyword search across stored manifestos
-        for party_id, manifesto_data in manifestos.items():
-            if party_filter and party_id != party_filter:
-                continue
-
-            for chunk in manifesto_data['chunks']:
-                # Simple relevance scoring based on keyword matches
-                text_lower = chunk['text'].lower()
-                score = 0
-                query_words = query.split()
-
-                for word in query_words:
-                    if word in text_lower:
-                        score += text_lower.count(word)
-
-                if score > 0:
-                    relevant_chunks.append({
-                        'text': chunk['text'],
-                        'metadata': {
-                            'partyId': chunk['partyId'],
-                            'partyName': chunk['partyName'],
-                            'chunkIndex': chunk['chunkIndex']
-                        },
-                        'similarity': min(score / 10, 1.0)  # Normalize score
-                    })
-
-        # Sort by relevance and return top results
-        relevant_chunks.sort(key=lambda x: x['similarity'], reverse=True)
-        relevant_chunks = relevant_chunks[:5]
+        # BM25 search over the inverted index
+        for score, chunk in search_chunks(query, party_id=party_filter, top_k=top_k):
+            relevant_chunks.append({
+                'text': chunk['text'],
+                'metadata': {
+                    'partyId': chunk['partyId'],
+                    'partyName': chunk['partyName'],
+                    'chunkIndex': chunk['chunkIndex']
+                },
+                'similarity': min(score / 10, 1.0)  # Normalize score
+            })
 
         return jsonify({
             'success': True,
@@ -172,90 +501,98 @@ def search_manifesto():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def search_chunks(chunks, query):
-    """Simple text-based search for chunks"""
-    query_words = query.lower().split()
-    scored_chunks = []
-
-    for chunk in chunks:
-        text = chunk['text'].lower()
-        score = 0
+def search_chunks(query, party_id=None, top_k=5):
+    """Return the top_k ``(score, chunk)`` pairs from the BM25 index, cached per index version"""
+    # Read the version before searching so a concurrent ingest can only
+    # leave results under a version that is never looked up again
+    version = search_index.version
+    key = SearchCache.make_key(query, party_id, top_k)
+    cached = search_cache.get(key, version)
+    if cached is not None:
+        return cached
+
+    results = []
+    with metrics.stage('search'):
+        for score, (chunk_party, chunk_index) in search_index.search(query, top_k, party_id):
+            chunk = manifestos.chunk(chunk_party, chunk_index)
+            if chunk is not None:
+                results.append((score, chunk))
+    search_cache.put(key, version, results)
+    return results
+
+def extractive_fallback(query, relevant_chunks):
+    """Build an extractive answer from the retrieved chunks' precomputed sentences"""
+    with metrics.stage('extractive_answer'):
+        return extractive_answer(
+            query,
+            [dict(chunk['metadata'], text=chunk['text']) for chunk in relevant_chunks],
+            lambda chunk, terms, limit: manifestos.top_sentences(chunk['partyId'], chunk['chunkIndex'], terms, limit)
+        )
+
+def plan_chat(data, mode=None):
+    """Retrieve manifesto chunks and build the Ollama prompt for a /chat request
+
+    Returns a ChatReply when the answer is known without the model (no
+    message, nothing relevant found, extractive mode, a cached answer) and
+    a ChatTurn otherwise.
+    """
+    query = data.get('message') or data.get('query', '')
+    party = data.get('party', 'all')
+
+    if not query:
+        return ChatReply({
+            'success': False,
+            'error': 'No message provided'
+        })
 
-        # Count word matches
-        for word in query_words:
-            score += text.count(word)
+    # First, search for relevant chunks
+    relevant_chunks = []
 
-        # Bonus for exact phrase matches
-        if query.lower() in text:
-            score += 5
+    dependencies = []
 
-        if score > 0:
-            scored_chunks.append({
+    if party == 'all' or party in manifestos:
+        party_filter = None if party == 'all' else party
+        for score, chunk in search_chunks(query, party_id=party_filter, top_k=3):
+            dependencies.append(chunk_dependency(chunk['partyId'], chunk['text']))
+            relevant_chunks.append({
                 'text': chunk['text'],
+                'metadata': {
+                    'partyId': chunk['partyId'],
+                    'partyName': chunk['partyName'],
+                    'chunkIndex': chunk['chunkIndex']
+                },
                 'score': score
             })
 
-    return scored_chunks
-
-@app.route('/chat', methods=['POST'])
-def chat_with_ollama():
-    """Generate response using Ollama LLM"""
-    try:
-        data = request.json
-        query = data.get('message') or data.get('query', '')
-        party = data.get('party', 'all')
-
-        if not query:
-            return jsonify({
-                'success': False,
-                'error': 'No message provided'
-            })
-
-        # First, search for relevant chunks
-        relevant_chunks = []
+    if not relevant_chunks:
+        return ChatReply({
+            'success': True,
+            'response': "I couldn't find specific information about that topic in the available manifestos. Could you try rephrasing your question or ask about a different topic?",
+            'sources': [],
+            'query': query
+        })
 
-        if party == 'all':
-            # Search across all parties
-            for party_id, party_data in manifestos.items():
-                chunks = search_chunks(party_data['chunks'], query)
-                for chunk in chunks:
-                    relevant_chunks.append({
-                        'text': chunk['text'],
-                        'metadata': {'partyName': party_data['partyName']},
-                        'score': chunk['score']
-                    })
-        elif party in manifestos:
-            # Search specific party
-            chunks = search_chunks(manifestos[party]['chunks'], query)
-            for chunk in chunks:
-                relevant_chunks.append({
-                    'text': chunk['text'],
-                    'metadata': {'partyName': manifestos[party]['partyName']},
-                    'score': chunk['score']
-                })
-
-        # Sort by relevance score
-        relevant_chunks.sort(key=lambda x: x['score'], reverse=True)
-
-        if not relevant_chunks:
-            return jsonify({
-                'success': True,
-                'response': "I couldn't find specific information about that topic in the available manifestos. Could you try rephrasing your question or ask about a different topic?",
-                'sources': [],
-                'query': query
-            })
+    # Build context from relevant chunks
+    context = ""
+    sources = []
 
-        # Build context from relevant chunks
-        context = ""
-        sources = []
+    for chunk in relevant_chunks[:3]:  # Use top 3 most relevant
+        context += f"Party: {chunk['metadata']['partyName']}\n"
+        context += f"Content: {chunk['text']}\n\n"
+        sources.append(f"{chunk['metadata']['partyName']} (Manifesto)")
 
-        for chunk in relevant_chunks[:3]:  # Use top 3 most relevant
-            context += f"Party: {chunk['metadata']['partyName']}\n"
-            context += f"Content: {chunk['text']}\n\n"
-            sources.append(f"{chunk['metadata']['partyName']} (Manifesto)")
+    # Extractive mode: quote the best manifesto sentences without calling the LLM
+    if mode == 'extractive':
+        return ChatReply({
+            'success': True,
+            'response': extractive_fallback(query, relevant_chunks),
+            'sources': sources,
+            'query': query,
+            'mode': 'extractive'
+        }, streamable=True)
 
-        # Create prompt for Ollama
-        prompt = f"""You are a helpful political information assistant. Answer the user's question based ONLY on the provided manifesto information.
+    # Create prompt for Ollama
+    prompt = f"""You are a helpful political information assistant. Answer the user's question based ONLY on the provided manifesto information.
 
 User Question: {query}
 
@@ -271,98 +608,79 @@ Instructions:
 
 Answer:"""
 
-        try:
-            # Call Ollama API
-            ollama_response = requests.post('http://localhost:11434/api/generate',
-                json={
-                    'model': 'llama3.2:3b',
-                    'prompt': prompt,
-                    'stream': False
-                },
-                timeout=30
-            )
+    cache_key = response_cache.make_key(OLLAMA_MODEL, party, query, fingerprint(context))
+    cached_response = response_cache.get(cache_key)
+    if cached_response is not None:
+        return ChatReply({
+            'success': True,
+            'response': cached_response,
+            'sources': sources,
+            'query': query,
+            'cached': True
+        }, streamable=True)
+
+    def complete(text, final):
+        response_cache.put(cache_key, text, party=party, depends_on=dependencies)
+        return text
+
+    def failure(error):
+        if isinstance(error, CircuitOpen):
+            # Ollama is known to be down or too slow: answer now instead of queueing
+            return {'response': extractive_fallback(query, relevant_chunks), 'degraded': True}
+        if not isinstance(error, GenerationFailed):
+            print(f"Ollama error: {error}")
+        # Enhanced fallback if Ollama is not available
+        return {'response': extractive_fallback(query, relevant_chunks), 'degraded': False}
+
+    return ChatTurn(
+        {'model': OLLAMA_MODEL, 'prompt': prompt},
+        cache_key,
+        {'success': True, 'sources': sources, 'query': query, 'cached': False},
+        complete,
+        failure,
+        fallback=lambda: extractive_fallback(query, relevant_chunks)
+    )
 
-            if ollama_response.status_code == 200:
-                response_text = ollama_response.json()['response']
-                return jsonify({
-                    'success': True,
-                    'response': response_text,
-                    'sources': sources,
-                    'query': query
-                })
-            else:
-                # Fallback response if Ollama is not available
-                fallback_response = f"Based on the manifesto content about '{query}':\n\n"
-
-                for i, chunk in enumerate(relevant_chunks[:2], 1):
-                    # Clean up and format the text better
-                    clean_text = chunk['text'].replace('CONTENTS', '').replace('TABLE OF', '').strip()
-
-                    # Extract key sentences related to the query
-                    sentences = clean_text.split('. ')
-                    relevant_sentences = []
-                    query_words = query.lower().split()
-
-                    for sentence in sentences:
-                        if any(word in sentence.lower() for word in ['health', 'medical', 'hospital', 'policy', 'care'] if 'health' in query.lower()):
-                            relevant_sentences.append(sentence.strip())
-                        elif any(word in sentence.lower() for word in ['education', 'school', 'student', 'learning'] if 'education' in query.lower()):
-                            relevant_sentences.append(sentence.strip())
-                        elif len(relevant_sentences) < 2 and len(sentence.strip()) > 20:
-                            relevant_sentences.append(sentence.strip())
-
-                    if relevant_sentences:
-                        fallback_response += f"**{chunk['metadata']['partyName']} Position:**\n"
-                        for sentence in relevant_sentences[:2]:
-                            if len(sentence) > 20:
-                                fallback_response += f"• {sentence}\n"
-                        fallback_response += "\n"
-                    else:
-                        fallback_response += f"**{chunk['metadata']['partyName']}**: {clean_text[:300]}...\n\n"
-
-                return jsonify({
-                    'success': True,
-                    'response': fallback_response,
-                    'sources': sources,
-                    'query': query
-                })
-        except Exception as e:
-            print(f"Ollama error: {e}")
-            # Enhanced fallback if Ollama is not available
-            fallback_response = f"Regarding '{query}', here's what I found in the manifestos:\n\n"
-
-            for chunk in relevant_chunks[:2]:
-                clean_text = chunk['text'].replace('CONTENTS', '').replace('TABLE OF', '').strip()
-
-                # Extract most relevant part
-                if len(clean_text) > 500:
-                    # Find sentences with policy keywords
-                    sentences = clean_text.split('. ')
-                    best_sentences = []
-
-                    for sentence in sentences:
-                        if any(keyword in sentence.lower() for keyword in ['policy', 'will', 'ensure', 'provide', 'implement', 'strengthen']):
-                            best_sentences.append(sentence.strip())
-                            if len(best_sentences) >= 2:
-                                break
-
-                    if best_sentences:
-                        clean_text = '. '.join(best_sentences)
-                    else:
-                        clean_text = clean_text[:400]
-
-                fallback_response += f"**{chunk['metadata']['partyName']}**: {clean_text}\n\n"
+@app.route('/chat', methods=['POST'])
+def chat_with_ollama():
+    """Generate response using Ollama LLM"""
+    try:
+        data = request.json
+        fmt = stream_format(request, data)
+        turn = plan_chat(data, data.get('mode') or request.args.get('mode'))
 
-            return jsonify({
-                'success': True,
-                'response': fallback_response,
-                'sources': sources,
-                'query': query
-            })
+        if isinstance(turn, ChatReply):
+            if fmt and turn.streamable:
+                return event_stream_response(reply_events(turn, fmt), fmt)
+            return jsonify(turn.body), turn.status
+
+        # Streaming mode: relay tokens to the client as they are generated
+        if fmt:
+            return event_stream_response(stream_turn(turn, ollama_client, fmt), fmt)
+
+        # Concurrent identical questions wait for one shared generation
+        return jsonify(answer_turn(turn, ollama_client, inflight_generations, COALESCE_WAIT_SECONDS))
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/llm/stats', methods=['GET'])
+def llm_stats():
+    """Ollama queue depth, concurrency and wait-time statistics"""
+    return jsonify({'success': True, 'llm': ollama_client.stats()})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Response and ingest cache statistics"""
+    return jsonify({
+        'success': True,
+        'responses': response_cache.stats(),
+        'inflight': inflight_generations.stats(),
+        'ingest': ingest_cache.stats(),
+        'search': search_cache.stats(),
+        'chunkStore': manifestos.stats()
+    })
+
 @app.route('/list-manifestos', methods=['GET'])
 def list_manifestos():
     """List all processed manifestos"""
@@ -370,9 +688,9 @@ def list_manifestos():
         'success': True,
         'manifestos': {
             party_id: {
-                'partyName': data['partyName'],
-                'totalChunks': len(data['chunks']),
-                'processedAt': data['processedAt']
+                'partyName': data.party_name,
+                'totalChunks': len(data),
+                'processedAt': data.processed_at
             }
             for party_id, data in manifestos.items()
         }
@@ -383,5 +701,6 @@ if __name__ == '__main__':
     print("📡 Service will run on http://localhost:5001")
     print("💡 Test with: curl http://localhost:5001/health")
     print("🤖 Ollama integration available (fallback if not running)")
+    print("🧵 For multiple worker processes run: python serve.py --workers N")
 
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=5001, debug=True)
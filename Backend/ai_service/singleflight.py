@@ -0,0 +1,77 @@
+import threading
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when a coalesced caller gives up waiting for the shared result"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls that share a key
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait for its result instead of starting their
+    own. If the leader raises, every waiter receives the same exception.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """Run fn once per concurrent key and return its result to every caller
+
+        Waiters give up with SingleFlightTimeout after ``timeout`` seconds.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except Exception as e:
+                call.error = e
+                with self._lock:
+                    self.errors += 1
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+
+        if not call.done.wait(timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise SingleFlightTimeout(f"Timed out after {timeout}s waiting for a shared request")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        """Return in-flight and coalescing counters"""
+        with self._lock:
+            return {
+                'inFlight': len(self._calls),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'timeouts': self.timeouts,
+                'errors': self.errors
+            }
@@ -0,0 +1,658 @@
+import bisect
+import fcntl
+import heapq
+import json
+import math
+import mmap
+import os
+import tempfile
+import threading
+import time
+from array import array
+from collections import defaultdict
+
+from search_index import expand_query, tokenize
+from sentences import SentenceTable
+
+MAGIC = b'EVSNAP01'
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = '.lock'
+
+# Per-document fields in the 'docs' section
+DOC_FIELDS = 6  # text offset, text bytes, page start, page end, word count, token count
+
+
+def _pad(handle):
+    # Keep every section 4-byte aligned so it can be cast to uint32 in place
+    remainder = handle.tell() % 4
+    if remainder:
+        handle.write(b'\0' * (4 - remainder))
+
+
+def _check_party_id(party_id):
+    # Manifests key segments by JSON object keys, which are always strings;
+    # any other id would not match the one in the segment header
+    if not isinstance(party_id, str) or not party_id:
+        raise ValueError(f"Party id must be a non-empty string, got {party_id!r}")
+
+
+def _atomic_write(path, write):
+    """Call ``write(temp_path)`` and rename the result over ``path``"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def write_segment(path, parties, k1=1.5, b=0.75):
+    """Write an immutable segment of manifestos and their BM25 postings to ``path``
+
+    ``parties`` yields ``(party_id, party_name, chunks, metadata)`` where
+    chunks are dicts with ``text`` and optional page/word fields, and
+    metadata holds ``page_count``, ``summary`` and ``processed_at``.
+    Each party's sentence table is stored too, with term ids rewritten to
+    the segment's term dictionary.
+    """
+    text_parts = []
+    docs = array('I')
+    party_table = []
+    sentence_tables = []
+    postings = defaultdict(list)  # term -> [doc, tf, doc, tf, ...]
+    text_offset = 0
+    total_length = 0
+
+    for party_id, party_name, chunks, metadata in parties:
+        _check_party_id(party_id)
+        first_doc = len(docs) // DOC_FIELDS
+        texts = []
+        for chunk in chunks:
+            doc = len(docs) // DOC_FIELDS
+            texts.append(chunk['text'])
+            encoded = chunk['text'].encode('utf-8')
+            tokens = tokenize(chunk['text'])
+            frequencies = defaultdict(int)
+            for token in tokens:
+                frequencies[token] += 1
+            for term, tf in frequencies.items():
+                postings[term].extend((doc, tf))
+            docs.extend((
+                text_offset,
+                len(encoded),
+                chunk.get('pageStart') or 0,
+                chunk.get('pageEnd') or 0,
+                chunk.get('wordCount') or len(chunk['text'].split()),
+                len(tokens)
+            ))
+            text_parts.append(encoded)
+            text_offset += len(encoded)
+            total_length += len(tokens)
+        sentence_tables.append(SentenceTable.build(texts))
+        party_table.append({
+            'partyId': party_id,
+            'partyName': party_name,
+            'pageCount': metadata.get('page_count'),
+            'summary': metadata.get('summary') or [],
+            'processedAt': metadata.get('processed_at'),
+            'firstDoc': first_doc,
+            'chunks': len(docs) // DOC_FIELDS - first_doc
+        })
+
+    terms = sorted(postings)
+    term_offsets = array('I', [0])
+    posting_offsets = array('I', [0])
+    term_blob = []
+    position = 0
+    for term in terms:
+        encoded = term.encode('utf-8')
+        term_blob.append(encoded)
+        position += len(encoded)
+        term_offsets.append(position)
+        posting_offsets.append(posting_offsets[-1] + len(postings[term]) // 2)
+    posting_data = array('I')
+    for term in terms:
+        posting_data.extend(postings[term])
+
+    # Concatenate the party sentence tables, indexed by segment doc number
+    term_ids = {term: term_id for term_id, term in enumerate(terms)}
+    sentence_chunk_first = array('I', [0])
+    sentence_spans = array('I')
+    sentence_term_first = array('I', [0])
+    sentence_terms = array('I')
+    sentence_weights = array('f')
+    for table in sentence_tables:
+        base_sentence = len(sentence_spans) // 2
+        base_term = len(sentence_terms)
+        local_terms = sorted(table.vocabulary, key=table.vocabulary.get)
+        sentence_chunk_first.extend(base_sentence + first for first in table.chunk_first[1:])
+        sentence_spans.extend(table.spans)
+        sentence_term_first.extend(base_term + first for first in table.term_first[1:])
+        sentence_terms.extend(term_ids[local_terms[term_id]] for term_id in table.terms)
+        sentence_weights.extend(table.weights)
+
+    sections = [
+        ('text', b''.join(text_parts)),
+        ('docs', docs.tobytes()),
+        ('termOffsets', term_offsets.tobytes()),
+        ('terms', b''.join(term_blob)),
+        ('postingOffsets', posting_offsets.tobytes()),
+        ('postings', posting_data.tobytes()),
+        ('sentChunkFirst', sentence_chunk_first.tobytes()),
+        ('sentSpans', sentence_spans.tobytes()),
+        ('sentTermFirst', sentence_term_first.tobytes()),
+        ('sentTerms', sentence_terms.tobytes()),
+        ('sentWeights', sentence_weights.tobytes())
+    ]
+    header = {
+        'createdAt': time.time(),
+        'k1': k1,
+        'b': b,
+        'docCount': len(docs) // DOC_FIELDS,
+        'termCount': len(terms),
+        'totalLength': total_length,
+        'parties': party_table
+    }
+
+    # Section offsets depend on the header length, so lay the header out with
+    # placeholder offsets first and reserve room for the real ones
+    header['sections'] = {name: [0, len(data)] for name, data in sections}
+    encoded_header = json.dumps(header).encode('utf-8')
+    start = len(MAGIC) + 8 + len(encoded_header) + 64 * len(sections)
+    start += -start % 4
+    for name, data in sections:
+        header['sections'][name] = [start, len(data)]
+        start += len(data)
+        start += -start % 4
+    encoded_header = json.dumps(header).encode('utf-8')
+
+    with open(path, 'wb') as handle:
+        handle.write(MAGIC)
+        handle.write(len(encoded_header).to_bytes(8, 'little'))
+        handle.write(encoded_header)
+        for name, data in sections:
+            _pad(handle)
+            # The final header is shorter than the space reserved; fill the gap
+            handle.write(b'\0' * (header['sections'][name][0] - handle.tell()))
+            handle.write(data)
+        handle.flush()
+        os.fsync(handle.fileno())
+
+
+class SegmentParty:
+    """Read-only view of one party in a segment, shaped like chunk_store.PartyChunks"""
+
+    __slots__ = ('party_id', 'party_name', 'page_count', 'summary', 'processed_at', 'first_doc', 'count')
+
+    def __init__(self, entry):
+        self.party_id = entry['partyId']
+        self.party_name = entry['partyName']
+        self.page_count = entry['pageCount']
+        self.summary = entry['summary']
+        self.processed_at = entry['processedAt']
+        self.first_doc = entry['firstDoc']
+        self.count = entry['chunks']
+
+    def __len__(self):
+        return self.count
+
+
+class Segment:
+    """Memory-mapped reader for a file written by write_segment
+
+    Chunk text, document stats, the term dictionary and the postings are all
+    read straight from the mapping, so every worker process that opens the
+    same file shares one copy in the page cache. Only the small party table
+    is parsed into Python objects.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a manifesto segment")
+        header_length = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 8], 'little')
+        header_start = len(MAGIC) + 8
+        header = json.loads(self._mmap[header_start:header_start + header_length])
+
+        self.k1 = header['k1']
+        self.b = header['b']
+        self.doc_count = header['docCount']
+        self.term_count = header['termCount']
+        self.total_length = header['totalLength']
+        self.nbytes = len(self._mmap)
+        self.parties = {entry['partyId']: SegmentParty(entry) for entry in header['parties']}
+        self._first_docs = [entry['firstDoc'] for entry in header['parties']]
+        self._party_order = [entry['partyId'] for entry in header['parties']]
+
+        view = memoryview(self._mmap)
+        sections = {
+            name: view[offset:offset + length]
+            for name, (offset, length) in header['sections'].items()
+        }
+        self._text = sections['text']
+        self._terms = sections['terms']
+        self._docs = sections['docs'].cast('I')
+        self._term_offsets = sections['termOffsets'].cast('I')
+        self._posting_offsets = sections['postingOffsets'].cast('I')
+        self._postings = sections['postings'].cast('I')
+        if 'sentSpans' in sections:
+            self.sentences = SentenceTable(
+                sections['sentChunkFirst'].cast('I'),
+                sections['sentSpans'].cast('I'),
+                sections['sentTermFirst'].cast('I'),
+                sections['sentTerms'].cast('I'),
+                sections['sentWeights'].cast('f')
+            )
+        else:
+            self.sentences = None  # written before sentence tables were stored
+
+    def chunk(self, party_id, index):
+        """Return one chunk dict, or None if it does not exist"""
+        party = self.parties.get(party_id)
+        if party is None or not 0 <= index < party.count:
+            return None
+        base = (party.first_doc + index) * DOC_FIELDS
+        offset, length, page_start, page_end, word_count = self._docs[base:base + 5]
+        return {
+            'chunkId': f"{party_id}_chunk_{index}",
+            'partyId': party_id,
+            'partyName': party.party_name,
+            'text': bytes(self._text[offset:offset + length]).decode('utf-8'),
+            'chunkIndex': index,
+            'pageStart': page_start,
+            'pageEnd': page_end,
+            'wordCount': word_count
+        }
+
+    def iter_party(self, party_id):
+        """Yield every chunk dict of a party in order"""
+        party = self.parties[party_id]
+        for index in range(party.count):
+            yield self.chunk(party_id, index)
+
+    def term_id(self, term):
+        """Return a term's position in the term dictionary, or None"""
+        target = term.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self._term(middle)
+            if candidate < target:
+                low = middle + 1
+            elif candidate > target:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def _term(self, term_id):
+        start, stop = self._term_offsets[term_id], self._term_offsets[term_id + 1]
+        return bytes(self._terms[start:stop])
+
+    def completions(self, prefix, limit):
+        """Terms of the dictionary starting with ``prefix``, at most ``limit``"""
+        target = prefix.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        completions = []
+        for term_id in range(low, min(low + limit, self.term_count)):
+            term = self._term(term_id)
+            if not term.startswith(target):
+                break
+            completions.append(term.decode('utf-8'))
+        return completions
+
+    def postings(self, term):
+        """Return the flat ``[doc, tf, doc, tf, ...]`` postings of a term, or None"""
+        term_id = self.term_id(term)
+        if term_id is None:
+            return None
+        first, last = self._posting_offsets[term_id], self._posting_offsets[term_id + 1]
+        return self._postings[first * 2:last * 2]
+
+    def top_sentences(self, party_id, index, terms, limit=2):
+        """Best sentences of one chunk for query terms, from the stored sentence table"""
+        chunk = self.chunk(party_id, index)
+        if chunk is None:
+            return []
+        if self.sentences is None:
+            table = SentenceTable.build([chunk['text']])
+            return table.top(0, chunk['text'], table.term_ids(terms), limit)
+        term_ids = {term_id for term_id in map(self.term_id, terms) if term_id is not None}
+        doc = self.parties[party_id].first_doc + index
+        return self.sentences.top(doc, chunk['text'], term_ids, limit)
+
+    def score(self, weights, avg_length, party_id=None):
+        """Accumulate BM25 scores for ``weights`` ({term: idf}) into ``{doc_id: score}``
+
+        Collection statistics are passed in so scores stay comparable across
+        segments.
+        """
+        if party_id is not None:
+            party = self.parties.get(party_id)
+            if party is None:
+                return {}
+            low, high = party.first_doc, party.first_doc + party.count
+        else:
+            low, high = 0, self.doc_count
+
+        scores = defaultdict(float)
+        for term, idf in weights.items():
+            pairs = self.postings(term)
+            if pairs is None:
+                continue
+            for position in range(0, len(pairs), 2):
+                doc = pairs[position]
+                if not low <= doc < high:
+                    continue
+                tf = pairs[position + 1]
+                doc_length = self._docs[doc * DOC_FIELDS + 5]
+                norm = self.k1 * (1 - self.b + self.b * doc_length / avg_length)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        results = {}
+        for doc, score in scores.items():
+            owner = self._party_order[bisect.bisect_right(self._first_docs, doc) - 1]
+            results[(owner, doc - self.parties[owner].first_doc)] = score
+        return results
+
+
+class SnapshotView:
+    """One published version: the segment holding each party"""
+
+    def __init__(self, version, segments):
+        self.version = version
+        self.segments = segments  # party_id -> Segment
+        unique = {id(segment): segment for segment in segments.values()}.values()
+        self.doc_count = sum(segment.doc_count for segment in unique)
+        self.total_length = sum(segment.total_length for segment in unique)
+        self.term_count = sum(segment.term_count for segment in unique)
+        self.nbytes = sum(segment.nbytes for segment in unique)
+        self._unique = list(unique)
+        self._df = {}
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __contains__(self, party_id):
+        return party_id in self.segments
+
+    def get(self, party_id):
+        segment = self.segments.get(party_id)
+        return segment.parties[party_id] if segment is not None else None
+
+    def items(self):
+        return [(party_id, segment.parties[party_id]) for party_id, segment in self.segments.items()]
+
+    def chunk(self, party_id, index):
+        segment = self.segments.get(party_id)
+        return segment.chunk(party_id, index) if segment is not None else None
+
+    def iter_party(self, party_id):
+        return self.segments[party_id].iter_party(party_id)
+
+    def top_sentences(self, party_id, index, terms, limit=2):
+        segment = self.segments.get(party_id)
+        return segment.top_sentences(party_id, index, terms, limit) if segment is not None else []
+
+    def _document_frequency(self, term):
+        df = self._df.get(term)
+        if df is None:
+            df = 0
+            for segment in self._unique:
+                pairs = segment.postings(term)
+                if pairs is not None:
+                    df += len(pairs) // 2
+            if len(self._df) > 50000:
+                self._df.clear()
+            self._df[term] = df
+        return df
+
+    def completions(self, prefix, limit):
+        """Terms of any segment starting with ``prefix``, at most ``limit``"""
+        found = set()
+        for segment in self._unique:
+            found.update(segment.completions(prefix, limit))
+        return sorted(found)[:limit]
+
+    def search(self, query, top_k=5, party_id=None):
+        """Return up to top_k ``(score, (party_id, chunk_index))`` pairs ranked by BM25, with prefix matching"""
+        terms = set(tokenize(query))
+        if not terms or self.doc_count == 0:
+            return []
+        if party_id is not None and party_id not in self.segments:
+            return []
+
+        weights = {}
+        for term, weight in expand_query(terms, self.completions).items():
+            df = self._document_frequency(term)
+            if df:
+                weights[term] = weight * math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+        if not weights:
+            return []
+
+        avg_length = self.total_length / self.doc_count
+        segments = [self.segments[party_id]] if party_id is not None else self._unique
+        scores = {}
+        for segment in segments:
+            scores.update(segment.score(weights, avg_length, party_id))
+        return heapq.nlargest(
+            top_k,
+            ((score, doc_id) for doc_id, score in scores.items()),
+            key=lambda hit: hit[0]
+        )
+
+
+class SnapshotStore:
+    """Durable manifesto store: one mmap'd segment per party plus a versioned manifest
+
+    Layout of ``directory``::
+
+        CURRENT                   name of the live manifest
+        manifest-00000007.json    {"version": 7, "segments": {party_id: file}}
+        segment-00000007.bin      one party's chunks and BM25 postings
+
+    Readers call ``current()`` (directly or through the ChunkStore/
+    InvertedIndex-compatible methods); at most every ``poll_interval``
+    seconds it re-reads CURRENT and, if a newer manifest was published,
+    maps only the segments it has not opened yet. Opening a store maps every
+    segment but parses only their small headers, so it is ready to serve
+    right away and survives restarts.
+
+    ``put``/``remove`` publish a new version under an exclusive file lock:
+    the party's segment is written to a temporary file and renamed into
+    place, then a new manifest is written and CURRENT is atomically
+    repointed. Files not referenced by the last ``keep`` manifests are
+    unlinked; workers still mapping them keep reading until they swap.
+    """
+
+    def __init__(self, directory, poll_interval=1.0, keep=3):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.keep = keep
+        self.swaps = 0
+        self.publishes = 0
+        self._view = None
+        self._current_name = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.current(force=True)
+
+    def _read_pointer(self):
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE)) as handle:
+                return handle.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _load(self, name):
+        with open(os.path.join(self.directory, name)) as handle:
+            manifest = json.load(handle)
+        opened = {}
+        if self._view is not None:
+            for segment in self._view._unique:
+                opened[os.path.basename(segment.path)] = segment
+        segments = {}
+        for party_id, filename in manifest['segments'].items():
+            if filename not in opened:
+                opened[filename] = Segment(os.path.join(self.directory, filename))
+            segments[party_id] = opened[filename]
+        return SnapshotView(manifest['version'], segments)
+
+    def current(self, force=False):
+        """Return the newest SnapshotView, or None if nothing was published yet"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.poll_interval:
+            return self._view
+        with self._lock:
+            self._checked_at = now
+            name = self._read_pointer()
+            if name and name != self._current_name:
+                # Old mappings are released once in-flight readers drop them
+                self._view = self._load(name)
+                self._current_name = name
+                self.swaps += 1
+            return self._view
+
+    @property
+    def version(self):
+        view = self.current()
+        return view.version if view is not None else 0
+
+    def _publish(self, changes, replace=False):
+        """Publish one version applying ``{party_id: write(path) or None}``
+
+        Each ``write`` produces the party's new segment file; None removes
+        the party. With ``replace`` parties not in ``changes`` are dropped.
+        """
+        for party_id in changes:
+            _check_party_id(party_id)
+        lock_path = os.path.join(self.directory, LOCK_FILE)
+        with open(lock_path, 'a') as lock_handle:
+            fcntl.flock(lock_handle, fcntl.LOCK_EX)
+            try:
+                base = self.current(force=True)
+                version = (base.version if base is not None else 0) + 1
+                segments = {
+                    pid: os.path.basename(segment.path)
+                    for pid, segment in (base.segments.items() if base is not None else ())
+                    if pid not in changes and not replace
+                }
+                for number, (party_id, write) in enumerate(changes.items()):
+                    if write is None:
+                        continue
+                    # A bulk publish writes several segments in one version
+                    name = f"segment-{version:08d}{f'-{number:04d}' if len(changes) > 1 else ''}.bin"
+                    _atomic_write(os.path.join(self.directory, name), write)
+                    segments[party_id] = name
+
+                manifest_name = f"manifest-{version:08d}.json"
+
+                def write_manifest(path):
+                    with open(path, 'w') as handle:
+                        json.dump({'version': version, 'createdAt': time.time(), 'segments': segments}, handle)
+                        handle.flush()
+                        os.fsync(handle.fileno())
+
+                def write_pointer(path):
+                    with open(path, 'w') as handle:
+                        handle.write(manifest_name)
+                        handle.flush()
+                        os.fsync(handle.fileno())
+
+                _atomic_write(os.path.join(self.directory, manifest_name), write_manifest)
+                _atomic_write(os.path.join(self.directory, CURRENT_FILE), write_pointer)
+                self.publishes += 1
+                self._prune()
+            finally:
+                fcntl.flock(lock_handle, fcntl.LOCK_UN)
+        return self.current(force=True)
+
+    def _prune(self):
+        names = os.listdir(self.directory)
+        manifests = sorted(name for name in names if name.startswith('manifest-') and name.endswith('.json'))
+        keep = manifests[-self.keep:]
+        referenced = set()
+        for name in keep:
+            with open(os.path.join(self.directory, name)) as handle:
+                referenced.update(json.load(handle)['segments'].values())
+        for name in names:
+            stale_manifest = name.startswith('manifest-') and name.endswith('.json') and name not in keep
+            stale_segment = name.startswith('segment-') and name.endswith('.bin') and name not in referenced
+            if stale_manifest or stale_segment:
+                os.unlink(os.path.join(self.directory, name))
+
+    def put(self, party_id, party_name, chunks, **metadata):
+        """Publish a version with this party's chunks replaced"""
+        write = lambda path: write_segment(path, [(party_id, party_name, chunks, metadata)])
+        return self._publish({party_id: write}).get(party_id)
+
+    def put_segments(self, segment_files, replace=False):
+        """Publish one version from prebuilt ``{party_id: segment file}``
+
+        The files (written by write_segment, e.g. by bulk_ingest workers)
+        must be in ``directory``; they are renamed into place. With
+        ``replace`` the version holds only these parties.
+        """
+        return self._publish({
+            party_id: (lambda path, source=source: os.replace(source, path))
+            for party_id, source in segment_files.items()
+        }, replace=replace)
+
+    def remove(self, party_id):
+        """Publish a version without this party"""
+        self._publish({party_id: None})
+
+    # ChunkStore / InvertedIndex compatible reads against the current version
+
+    def get(self, party_id):
+        view = self.current()
+        return view.get(party_id) if view is not None else None
+
+    def chunk(self, party_id, index):
+        view = self.current()
+        return view.chunk(party_id, index) if view is not None else None
+
+    def items(self):
+        view = self.current()
+        return view.items() if view is not None else []
+
+    def top_sentences(self, party_id, index, terms, limit=2):
+        view = self.current()
+        return view.top_sentences(party_id, index, terms, limit) if view is not None else []
+
+    def search(self, query, top_k=5, party_id=None):
+        view = self.current()
+        return view.search(query, top_k, party_id) if view is not None else []
+
+    def __contains__(self, party_id):
+        view = self.current()
+        return view is not None and party_id in view
+
+    def __len__(self):
+        view = self.current()
+        return len(view) if view is not None else 0
+
+    def stats(self):
+        """Return the live version's size plus swap and publish counters"""
+        view = self.current()
+        return {
+            'directory': self.directory,
+            'version': view.version if view is not None else 0,
+            'parties': len(view) if view is not None else 0,
+            'segments': len(view._unique) if view is not None else 0,
+            'chunks': view.doc_count if view is not None else 0,
+            'bytes': view.nbytes if view is not None else 0,
+            'swaps': self.swaps,
+            'publishes': self.publishes
+        }
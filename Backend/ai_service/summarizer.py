@@ -0,0 +1,42 @@
+from collections import Counter
+
+from chunker import split_sentences
+from search_index import tokenize
+
+# Very common words carry no signal about what a manifesto is about
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or our that the
+their this to was we were will with which who all also been more not they us
+""".split())
+
+
+def extractive_summary(chunks, max_sentences=5, min_words=6, max_words=60):
+    """Pick the manifesto's most representative sentences, in document order
+
+    Sentences are scored by the average corpus frequency of their content
+    words (Luhn-style), so sentences about the manifesto's dominant themes
+    rank highest.
+    """
+    sentences = []
+    frequencies = Counter()
+    for chunk in chunks:
+        for sentence in split_sentences(chunk['text']):
+            terms = [term for term in tokenize(sentence) if term not in STOPWORDS and len(term) > 2]
+            if not terms:
+                continue
+            frequencies.update(terms)
+            word_count = len(sentence.split())
+            if min_words <= word_count <= max_words:
+                sentences.append((len(sentences), sentence.strip(), terms))
+
+    # Overlapping chunks repeat sentences; score each distinct sentence once
+    seen = set()
+    scored = []
+    for position, sentence, terms in sentences:
+        if sentence in seen:
+            continue
+        seen.add(sentence)
+        scored.append((sum(frequencies[term] for term in terms) / len(terms), position, sentence))
+
+    best = sorted(scored, reverse=True)[:max_sentences]
+    return [sentence for _, _, sentence in sorted(best, key=lambda item: item[1])]
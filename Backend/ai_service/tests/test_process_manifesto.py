@@ -0,0 +1,66 @@
+"""/process-manifesto against the default snapshot storage"""
+import importlib
+import io
+import sys
+
+import pytest
+
+from snapshot import SnapshotStore, write_segment
+from synthetic_pdf import manifesto_pdf
+
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    root = tmp_path_factory.mktemp('service')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('SNAPSHOT_DIR', str(root / 'snapshots'))
+        patch.setenv('INGEST_CACHE_DIR', str(root / 'ingest'))
+        patch.setenv('RESPONSE_CACHE_DB', '')
+        patch.setenv('OLLAMA_URL', 'http://127.0.0.1:9')
+        sys.modules.pop('simple_app', None)
+        simple_app = importlib.import_module('simple_app')
+        simple_app.create_app()
+        yield simple_app
+        sys.modules.pop('simple_app', None)
+
+
+def upload(client, **form):
+    form['file'] = (io.BytesIO(manifesto_pdf('Alpha', 3)), 'alpha.pdf')
+    return client.post('/process-manifesto', data=form, content_type='multipart/form-data')
+
+
+@pytest.mark.parametrize('form', [{}, {'partyId': ''}, {'async': 'true'}])
+def test_upload_without_party_id_is_rejected(service, form):
+    client = service.app.test_client()
+    response = upload(client, partyName='Alpha', **form)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'partyId is required'
+
+    # Nothing was published, so the stored manifestos stay readable
+    listed = client.get('/list-manifestos')
+    assert listed.status_code == 200
+    assert None not in listed.get_json()['manifestos']
+
+
+def test_upload_with_party_id_is_listed_and_searchable(service):
+    client = service.app.test_client()
+    assert upload(client, partyId='alpha', partyName='Alpha').status_code == 200
+
+    listed = client.get('/list-manifestos').get_json()['manifestos']
+    assert listed['alpha']['partyName'] == 'Alpha'
+    found = client.post('/search-manifesto', json={'query': 'schools', 'partyId': 'alpha'}).get_json()
+    assert found['totalFound'] > 0
+
+    # An empty party filter searches every party
+    unfiltered = client.post('/search-manifesto', json={'query': 'schools', 'partyId': ''}).get_json()
+    assert unfiltered['totalFound'] == found['totalFound']
+
+
+@pytest.mark.parametrize('party_id', [None, '', 7])
+def test_snapshot_refuses_non_string_party_ids(tmp_path, party_id):
+    store = SnapshotStore(str(tmp_path))
+    with pytest.raises(ValueError):
+        store.put(party_id, 'Party', [{'text': 'schools for every district'}])
+    with pytest.raises(ValueError):
+        write_segment(str(tmp_path / 'segment.bin'), [(party_id, 'Party', [], {})])
+    assert store.current(force=True) is None
@@ -0,0 +1,28 @@
+"""Persistent tier of the response cache"""
+import sqlite3
+import time
+
+from response_cache import ResponseCache
+
+
+def row_counts(path):
+    with sqlite3.connect(path) as db:
+        return [db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in ('responses', 'response_deps')]
+
+
+def test_sqlite_rows_are_capped_at_max_entries(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    cache = ResponseCache(max_entries=10, db_path=path, prune_seconds=0)
+    for number in range(50):
+        cache.put(f'key-{number}', f'answer {number}', party='alpha', depends_on=[f'chunk-{number}'])
+    assert row_counts(path) == [10, 10]
+    assert cache.get('key-49') == 'answer 49'
+
+
+def test_expired_rows_are_pruned_without_a_restart(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    cache = ResponseCache(ttl_seconds=0.2, db_path=path, prune_seconds=0)
+    cache.put('key', 'answer', party='alpha', depends_on=['chunk'])
+    time.sleep(0.3)
+    assert cache.get('key') is None
+    assert row_counts(path) == [0, 0]
@@ -0,0 +1,36 @@
+"""BM25 search over the in-memory index and the snapshot store"""
+import pytest
+
+from search_index import InvertedIndex
+from snapshot import SnapshotStore
+
+CHUNKS = [
+    {'chunkIndex': 0, 'text': 'Universal healthcare for every citizen'},
+    {'chunkIndex': 1, 'text': 'Health clinics in every village and health workers'},
+    {'chunkIndex': 2, 'text': 'Lower taxes for farmers'}
+]
+
+
+@pytest.fixture(params=['memory', 'snapshot'])
+def index(request, tmp_path):
+    if request.param == 'memory':
+        index = InvertedIndex()
+        index.replace_party('alpha', CHUNKS)
+        return index
+    store = SnapshotStore(str(tmp_path))
+    store.put('alpha', 'Alpha', CHUNKS)
+    return store
+
+
+def test_query_terms_match_words_they_start(index):
+    hits = index.search('health farm')
+    assert {doc_id for _, doc_id in hits} == {('alpha', 0), ('alpha', 1), ('alpha', 2)}
+
+
+def test_exact_matches_rank_above_prefix_matches(index):
+    hits = index.search('health')
+    assert [doc_id for _, doc_id in hits] == [('alpha', 1), ('alpha', 0)]
+
+
+def test_short_terms_are_not_expanded(index):
+    assert index.search('he') == []
@@ -185,7 +185,7 @@ const getPartiesWithManifestos = async (req, res) => {
 // Chat with party manifesto using AI service
 const chatWithManifesto = async (req, res) => {
   try {
-    const { partyId, question, conversationHistory = [] } = req.body;
+    const { partyId, question, conversationHistory = [], mode } = req.body;
 
     if (!partyId || !question) {
       return res
@@ -234,6 +234,7 @@ Content: ${m.extractedText}
         manifesto_content: combinedText,
         party_name: manifestos[0].party.name,
         conversation_history: conversationHistory,
+        mode, // "extractive" answers from manifesto sentences without the LLM
       },
       {
         timeout: 120000, // 2 minute timeout for AI processing
@@ -259,6 +260,7 @@ Content: ${m.extractedText}
         title: m.title,
         fileName: m.fileName,
       })),
+      citations: response.sources || [],
       timestamp: new Date().toISOString(),
       model: response.model || "AI Service",
     });